@@ -0,0 +1,44 @@
+import argparse
+import json
+import sys
+
+from Benchmarks.suite import sizes, run, compare, format_report, format_comparison
+
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python -m Benchmarks', description = 'Graph-State-Machine benchmark suite')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    run_parser = commands.add_parser('run', help = 'run the benchmark cases and (optionally) save a JSON report')
+    run_parser.add_argument('--size', choices = list(sizes), default = 'small')
+    run_parser.add_argument('--repeats', type = int, default = 5)
+    run_parser.add_argument('--only', help = 'regex selecting the cases to run (e.g. "^scan/")')
+    run_parser.add_argument('--out', help = 'path of the JSON report to write')
+    for name, kind in [('n_nodes', int), ('n_types', int), ('mean_degree', float), ('degree_distribution', str), ('hub_skew', float),
+                       ('necessity_density', float), ('sufficiency_density', float), ('joint_sufficiency_size', int), ('n_states', int), ('seed', int)]:
+        run_parser.add_argument(f"--{name.replace('_', '-')}", dest = name, type = kind)
+
+    compare_parser = commands.add_parser('compare', help = 'compare two JSON reports; exits with status 1 if any case regressed')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--time-tolerance', type = float, default = 1.2)
+    compare_parser.add_argument('--memory-tolerance', type = float, default = 1.2)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        overrides = {k: v for k, v in vars(args).items() if k not in ('command', 'size', 'repeats', 'only', 'out') if v is not None}
+        report = run(args.size, args.repeats, args.only, **overrides)
+        print(format_report(report))
+        if args.out:
+            with open(args.out, 'w') as f: json.dump(report, f, indent = 2)
+        return 0
+    else:
+        with open(args.old) as f: old = json.load(f)
+        with open(args.new) as f: new = json.load(f)
+        if old['meta']['params'] != new['meta']['params']: print(f"WARNING: the reports were run with different parameters:\n\told: {old['meta']['params']}\n\tnew: {new['meta']['params']}\n")
+        rows = compare(old, new, args.time_tolerance, args.memory_tolerance)
+        print(format_comparison(rows))
+        return 1 if any(r['regression'] for r in rows) else 0
+
+
+if __name__ == '__main__': sys.exit(main())
@@ -0,0 +1,41 @@
+import numpy as np
+
+from Graph_State_Machine.types import *
+
+
+def synthetic_records(n_nodes = 10000, n_types = 8, mean_degree = 4, degree_distribution = 'poisson', hub_skew = 1.0,
+                      necessity_density = 0.1, sufficiency_density = 0.1, joint_sufficiency_size = 2, seed = 0) -> Iterator[Tuple[NodeType, Node, Union[List[Node], Dict[str, List]]]]:
+    '''Seeded synthetic typed ontology as (node type, node, adjacency) records (see Graph.read_typed_adjacency_stream and synthetic_ontology):
+        - each node declares edges towards earlier nodes only (so necessities can never be symmetric), with their number drawn from degree_distribution
+            ('poisson', 'uniform' or 'power_law', all with mean roughly mean_degree)
+        - edge ends are drawn as floor(i * u ** hub_skew) for uniform u, i.e. uniformly for hub_skew = 1 and increasingly concentrated on early nodes (hubs) above it
+        - each declared edge is necessary with probability necessity_density and sufficient with probability sufficiency_density,
+            sufficient ends being grouped into jointly sufficient sets of joint_sufficiency_size (any remainder being plainly sufficient)
+        - nodes whose declared edges are all plain use the list form of adjacency, all others the dict form'''
+    rng = np.random.default_rng(seed)
+    types = [f'Type_{t}' for t in range(n_types)]
+    names = [f'node_{i}' for i in range(n_nodes)]
+    if degree_distribution == 'poisson': degrees = rng.poisson(mean_degree, n_nodes)
+    elif degree_distribution == 'uniform': degrees = rng.integers(0, 2 * mean_degree + 1, n_nodes)
+    elif degree_distribution == 'power_law': degrees = np.minimum(np.floor((mean_degree / 2) * (rng.pareto(2.0, n_nodes) + 1)).astype(np.int64), n_nodes)
+    else: raise ValueError(f"Unknown degree_distribution '{degree_distribution}'; the available ones are 'poisson', 'uniform' and 'power_law'")
+    node_types = rng.integers(0, n_types, n_nodes)
+
+    for i in range(n_nodes):
+        ends = np.unique(np.floor(i * rng.random(min(int(degrees[i]), i)) ** hub_skew).astype(np.int64)) if i else np.zeros(0, dtype = np.int64)
+        kinds = rng.random(len(ends))
+        necessary, sufficient = [names[e] for e in ends[kinds < necessity_density]], [names[e] for e in ends[(kinds >= necessity_density) & (kinds < necessity_density + sufficiency_density)]]
+        plain = [names[e] for e in ends[kinds >= necessity_density + sufficiency_density]]
+        if not necessary and not sufficient: yield types[node_types[i]], names[i], plain
+        else:
+            size = max(joint_sufficiency_size, 1)
+            joint = [sufficient[j:j + size] for j in range(0, len(sufficient) - len(sufficient) % size, size)] if size > 1 else []
+            adjacency = dict(plain = plain, are_necessary = necessary, are_sufficient = joint + sufficient[len(joint) * size:])
+            yield types[node_types[i]], names[i], {k: v for k, v in adjacency.items() if v}
+
+
+def synthetic_ontology(**kwargs) -> TypedAdjacencies:
+    '''Seeded synthetic typed ontology as TypedAdjacencies; see synthetic_records for the arguments'''
+    tas = {}
+    for nt, n, adjacency in synthetic_records(**kwargs): tas.setdefault(nt, {})[n] = adjacency
+    return tas
@@ -0,0 +1,155 @@
+import os
+import platform
+import random
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+import warnings
+from functools import cached_property
+import networkx as nx
+import numpy as np
+
+from Graph_State_Machine import *
+from Graph_State_Machine.compiled import CompiledGraph
+from Benchmarks.generator import synthetic_records
+from Graph_State_Machine.types import *
+
+
+sizes = dict(tiny = dict(n_nodes = 300, n_states = 5), small = dict(n_nodes = 3000, n_states = 50),
+             medium = dict(n_nodes = 30000, n_states = 100), large = dict(n_nodes = 300000, n_states = 200))
+
+
+class Fixtures:
+    '''Lazily built (and then shared) inputs of the benchmark cases: the synthetic ontology in its various forms, scan states and step plans'''
+    def __init__(self, n_states = 50, state_size = 3, extension_size = 20, seed = 0, **ontology_params):
+        self.params = dict(ontology_params, seed = seed)
+        self.n_states, self.state_size, self.extension_size, self.seed = n_states, state_size, extension_size, seed
+
+    @cached_property
+    def records(self) -> List[Tuple[NodeType, Node, Any]]: return list(synthetic_records(**self.params))
+
+    @cached_property
+    def tas(self) -> TypedAdjacencies:
+        tas = {}
+        for nt, n, adjacency in self.records: tas.setdefault(nt, {})[n] = adjacency
+        return tas
+
+    @cached_property
+    def graph(self) -> Graph: return Graph(self.tas, warn_about_problematic_sufficiencies = False)
+
+    @cached_property
+    def compiled(self) -> Graph: return Graph(self.graph.G, warn_about_problematic_sufficiencies = False, compiled = True)
+
+    @cached_property
+    def states(self) -> List[List[Node]]:
+        rng = random.Random(self.seed)
+        nodes = list(self.graph.G.nodes)
+        return [rng.sample(nodes, self.state_size) for _ in range(self.n_states)]
+
+    @cached_property
+    def plan(self) -> List[Dict[str, Any]]:
+        types = self.graph.types
+        return [dict(candidate_types = types[i % len(types):i % len(types) + 2]) for i in range(6)]
+
+    @cached_property
+    def extension(self) -> Graph:
+        '''Small extension adding new nodes linked to existing ones (and redeclaring a few existing ones)'''
+        rng, nodes, types = random.Random(self.seed + 1), list(self.graph.G.nodes), self.graph.types
+        tas = {}
+        for i in range(self.extension_size):
+            ends = rng.sample(nodes, 3)
+            tas.setdefault(rng.choice(types), {})[f'extension_{i}'] = dict(plain = ends[:2], are_necessary = ends[2:])
+            for e in ends: tas.setdefault(self.graph.nodes_to_types[e], {})[e] = []
+        return Graph(tas, warn_about_problematic_sufficiencies = False)
+
+    @cached_property
+    def path(self) -> str:
+        fd, path = tempfile.mkstemp(suffix = '.gsm')
+        os.close(fd)
+        self.compiled.save(path)
+        return path
+
+    def cleanup(self):
+        if 'path' in self.__dict__: os.remove(self.path)
+
+
+def cases() -> Dict[str, Callable[[Fixtures], Any]]:
+    '''Benchmarked operations by name, each a function of the Fixtures (whose construction is not included in the measurements)'''
+    return {
+        'construction/read_typed_adjacency_list': lambda f: Graph(f.tas, warn_about_problematic_sufficiencies = False),
+        'construction/read_typed_adjacency_stream': lambda f: Graph.read_typed_adjacency_stream(f.records),
+        'construction/compile': lambda f: CompiledGraph.from_networkx(f.graph.G),
+        'construction/load': lambda f: Graph.load(f.path),
+        'scan/by_score': lambda f: [by_score()(f.graph, s) for s in f.states],
+        'scan/by_score_compiled': lambda f: [by_score()(f.compiled, s) for s in f.states],
+        'scan/by_score_batch_compiled': lambda f: by_score().batch(f.compiled, f.states),
+        'scan/neighbour_intersection': lambda f: [neighbour_intersection(f.graph, s) for s in f.states],
+        'scan/neighbour_intersection_compiled': lambda f: [neighbour_intersection(f.compiled, s) for s in f.states],
+        'filter/necessity_sufficiency': lambda f: [f.graph.necessity_sufficiency_filter(s, f.graph.type_filter(None, f.plan[0]['candidate_types'])) for s in f.states],
+        'filter/necessity_sufficiency_compiled': lambda f: [f.compiled.necessity_sufficiency_filter(s, f.compiled.type_filter(None, f.plan[0]['candidate_types'])) for s in f.states],
+        'step/consecutive_steps': lambda f: [GSM(f.graph, list(s)).consecutive_steps(*f.plan) for s in f.states],
+        'step/consecutive_steps_compiled': lambda f: [GSM(f.compiled, list(s)).consecutive_steps(*f.plan) for s in f.states],
+        'step/consecutive_steps_incremental': lambda f: [GSM(f.compiled, list(s), incremental = True).consecutive_steps(*f.plan) for s in f.states],
+        'step/batch_compiled': lambda f: GSMBatch(f.compiled, f.states).run(*f.plan),
+        'extension/extend_with': lambda f: GSM(f.graph, []).extend_with(f.extension, False),
+        'extension/extend_with_compiled': lambda f: GSM(f.compiled, []).extend_with(f.extension, False),
+    }
+
+
+def measure(f: Callable[[], Any], repeats = 5) -> Dict[str, float]:
+    '''Minimum and median wall-clock seconds over the given number of runs, plus the peak traced memory of one further (separate, since tracing slows things down) run'''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        f()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally: tracemalloc.stop()
+    return dict(seconds_min = min(times), seconds_median = statistics.median(times), repeats = repeats, peak_bytes = peak)
+
+
+def run(size = 'small', repeats = 5, only: str = None, **fixture_params) -> Dict[str, Any]:
+    '''Run all benchmark cases (or those whose name matches the only regex) on a synthetic ontology of the given size preset,
+        whose parameters (and those of synthetic_records) can be overridden by fixture_params; returns a JSON-serialisable report'''
+    params = dict(sizes[size], **fixture_params)
+    fixtures, results = Fixtures(**params), {}
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for name, case in cases().items():
+                if only and not re.search(only, name): continue
+                case(fixtures) # Warm-up, also building any fixtures the case needs outside the measurement
+                results[name] = measure(lambda: case(fixtures), repeats)
+    finally: fixtures.cleanup()
+    return dict(meta = dict(size = size, params = params, time = time.strftime('%Y-%m-%dT%H:%M:%S'), python = platform.python_version(),
+                            platform = platform.platform(), numpy = np.__version__, networkx = nx.__version__), results = results)
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], time_tolerance = 1.2, memory_tolerance = 1.2) -> List[Dict[str, Any]]:
+    '''Per-case new/old ratios of minimum times and peak memory for the cases present in both reports,
+        flagged as regressions when above the given tolerances'''
+    rows = []
+    for name in [n for n in new['results'] if n in old['results']]:
+        a, b = old['results'][name], new['results'][name]
+        time_ratio, memory_ratio = b['seconds_min'] / max(a['seconds_min'], 1e-9), b['peak_bytes'] / max(a['peak_bytes'], 1)
+        rows.append(dict(case = name, old_seconds = a['seconds_min'], new_seconds = b['seconds_min'], time_ratio = time_ratio,
+                         old_peak_bytes = a['peak_bytes'], new_peak_bytes = b['peak_bytes'], memory_ratio = memory_ratio,
+                         regression = time_ratio > time_tolerance or memory_ratio > memory_tolerance))
+    return rows
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    width = max(map(len, report['results']), default = 4)
+    return '\n'.join([f"{'case':<{width}}  {'min s':>10}  {'median s':>10}  {'peak MiB':>10}"] +
+                     [f"{name:<{width}}  {r['seconds_min']:>10.4f}  {r['seconds_median']:>10.4f}  {r['peak_bytes'] / 2 ** 20:>10.2f}" for name, r in report['results'].items()])
+
+
+def format_comparison(rows: List[Dict[str, Any]]) -> str:
+    width = max((len(r['case']) for r in rows), default = 4)
+    return '\n'.join([f"{'case':<{width}}  {'old s':>10}  {'new s':>10}  {'time x':>7}  {'memory x':>8}"] +
+                     [f"{r['case']:<{width}}  {r['old_seconds']:>10.4f}  {r['new_seconds']:>10.4f}  {r['time_ratio']:>7.2f}  {r['memory_ratio']:>8.2f}{'  REGRESSION' if r['regression'] else ''}" for r in rows])
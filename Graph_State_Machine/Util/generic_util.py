@@ -141,6 +141,14 @@ def fst(ab: Tuple[_a, _b]) -> _a: return ab[0]
 def snd(ab: Tuple[_a, _b]) -> _b: return ab[1]
 
 
+def frozen(x):
+    '''Hashable equivalent of (nested) arguments: dictionaries to sorted item tuples, lists and tuples to tuples and sets to frozensets'''
+    if isinstance(x, dict): return tuple(sorted((k, frozen(v)) for k, v in x.items()))
+    if isinstance(x, (list, tuple)): return tuple(map(frozen, x))
+    if isinstance(x, (set, frozenset)): return frozenset(map(frozen, x))
+    return x
+
+
 def update_dict_with(d0: Dict, d1: Dict, f: Callable[[_a, _b], Union[_a, _b]]) -> Dict[Any, Union[_a, _b]]:
     '''Update a dictionary's entries with those of another using a given function, e.g. appending (operator.add is ideal for this)
     NOTE: This modifies d0, so might want to give it a deepcopy
@@ -1,4 +1,3 @@
-import warnings
 import networkx as nx
 import numpy as np
 from collections import defaultdict
@@ -6,8 +5,10 @@ from warnings import warn
 from typing import *
 
 
+edge_dict_keys = ['necessary_for', 'sufficient_for', 'are_necessary', 'are_sufficient', 'plain']
+
 def check_edge_dict_keys(dict_many: Dict[str, List[str]]) -> None:
-    ok_keys = ['necessary_for', 'sufficient_for', 'are_necessary', 'are_sufficient', 'plain']
+    ok_keys = edge_dict_keys
     assert not (bad_keys := [k for k in dict_many.keys() if k not in ok_keys]), f'The only keys allowed in graph-shortand edge dictionaries are {ok_keys}; the following bad keys were provided: {bad_keys}'
 
 
@@ -51,19 +52,6 @@ def strs_as_keys(strs: List[str], unique_value: List[str] = None) -> Dict[str, L
     return {t: unique_value for t in strs}
 
 
-def expand_user_warning(f: Callable, suffix_f = lambda: ' <<-- nested warning'):
-    with warnings.catch_warnings():  # Reset warning filter afterwards
-        warnings.filterwarnings('error')
-        res = None
-        try: res = f()
-        except Warning as w: # Append suffix if UserWarning
-            warnings.filterwarnings('default')
-            warnings.warn(w.args[0] + (suffix_f() if issubclass(w.__class__, UserWarning) else ''))
-            return res
-        except Exception as e: raise e # Raise other errors
-        return res
-
-
 def radial_degrees(x, y): return np.arctan2(y, x) * 180 / np.pi
 
 
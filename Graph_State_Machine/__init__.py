@@ -8,15 +8,22 @@ __author__ = 'Thomas Fletcher <T-Fletcher@outlook.com>'
 # Core imports
 from Graph_State_Machine.graph import Graph
 from Graph_State_Machine.gsm import GSM
+from Graph_State_Machine.batch import GSMBatch
+from Graph_State_Machine.parallel import run_parallel
+from Graph_State_Machine.search import search
+from Graph_State_Machine.log import GSMLog, FileSink
+from Graph_State_Machine.cache import ScanCache
+from Graph_State_Machine.profiling import Profiler
+from Graph_State_Machine.states import OrderedState, DictState
 
 # Graph-construction utility functions
 from Graph_State_Machine.Util.misc import strs_as_keys, reverse_adjacencies
 
 # Basic examples and constructors for each function group
-from Graph_State_Machine.selectors import identity, last_only, dict_fields_getter
+from Graph_State_Machine.selectors import identity, last_only, dict_fields_getter, dict_state_fields_getter
 from Graph_State_Machine.scanners import by_score, neighbour_intersection
 from Graph_State_Machine.scores import presence_score, jaccard_similarity
-from Graph_State_Machine.updaters import list_accumulator, list_in_dict_accumulator
+from Graph_State_Machine.updaters import list_accumulator, list_in_dict_accumulator, ordered_accumulator, ordered_accumulator_greedy, dict_state_accumulator
 
 # Function groups named imports instead
 # import Graph_State_Machine.selectors as sels
@@ -0,0 +1,94 @@
+from inspect import signature
+
+from Graph_State_Machine.gsm import GSM
+from Graph_State_Machine.selectors import identity
+from Graph_State_Machine.scanners import by_score
+from Graph_State_Machine.updaters import list_accumulator, list_accumulator_greedy
+from Graph_State_Machine.log import GSMLog, LogRecord
+from Graph_State_Machine.outcomes import StepOutcome, warn_on_outcome
+from Graph_State_Machine.types import *
+from Graph_State_Machine.Util.generic_util import group_by
+
+
+class GSMBatch:
+    def __init__(self, graph: Graph, states: List[State],
+                 node_scanner: Scanner = by_score(), state_updater: Updater = list_accumulator, selector = identity,
+                 greedy_state_updater: Updater = list_accumulator_greedy, log: GSMLog = None,
+                 outcome_handler: Optional[Callable[[StepOutcome], Any]] = warn_on_outcome):
+        '''Many independent state machines (one per given initial state) over one shared Graph (and its compiled form, if any),
+            all with the same operation functions (see GSM for their meaning) and advanced together by the same steps.
+            Scans are performed in a single call for all machines sharing a graph if the Scanner provides a batched version of itself as its
+            .batch attribute (as the by_score ones do, vectorised across all states on compiled graphs), and one machine at a time otherwise.
+            Machine states, graphs (all the same object unless an Updater returns a different one), logs and last step outcomes are kept in parallel lists.
+            Every machine's step outcome (a StepOutcome with its index as machine) is passed to the outcome_handler, as by GSM:
+                the default one, warn_on_outcome, warns about each skipped step and empty scan result, while None makes steps silent.
+            Each machine's log is a copy of the given GSMLog (an empty, full-retention one by default), i.e. follows its retention policy, capacity,
+                scan_result_limit and sinks (which therefore receive the records of all machines); e.g. GSMLog('ring', 10) bounds the memory of large batches'''
+        self.scanner = node_scanner
+        self.updater = state_updater
+        self.selector = selector
+        self.greedy_updater = greedy_state_updater
+        self.outcome_handler = outcome_handler
+
+        self.states = list(states)
+        self.graphs = [graph] * len(self.states)
+        log = log if log is not None else GSMLog()
+        self.logs = [log.copy() for _ in self.states]
+        for machine_log, s in zip(self.logs, self.states): machine_log.append(LogRecord('__init__', state = s))
+        self.last_outcomes = [None] * len(self.states)
+
+    def __len__(self): return len(self.states)
+
+    def __str__(self): return f'GSMBatch of {len(self)} States'
+
+
+    # Core functionality methods
+
+    def _scan(self, indices: List[int], scanner_arguments: Dict[str, Any], top_k: int = None) -> Dict[int, ScanResult]:
+        '''Note: this method just returns the step results of the given machines; it does not update their states.
+            top_k is handled as in GSM._scan'''
+        if top_k is not None and 'top_k' in signature(self.scanner).parameters: scanner_arguments, top_k = dict(scanner_arguments, top_k = top_k), None
+        results = {}
+        for group in group_by(lambda i: id(self.graphs[i]), indices).values():
+            graph, list_states = self.graphs[group[0]], [self.selector(self.states[i]) for i in group]
+            if (batch_scanner := getattr(self.scanner, 'batch', None)) is not None: results.update(zip(group, batch_scanner(graph, list_states, **scanner_arguments)))
+            else: results.update((i, self.scanner(graph, s, **scanner_arguments)) for i, s in zip(group, list_states))
+        return results if top_k is None else {i: r[:top_k] for i, r in results.items()}
+
+    def step(self, *args, conditional = False, greedy = False, top_k: int = None, **kwargs):
+        '''Perform the same step on all machines; see GSM.step for the meaning of the arguments and GSM for the reporting of step outcomes'''
+        if args and kwargs: raise TypeError('Step function arguments should be either all named or all unnamed (except for "conditional", which should always be named)')
+        scanner_arguments = self._ensure_scanner_args_are_named(args if args else kwargs)
+        if conditional:
+            node_type = list(scanner_arguments.values())[0][0]
+            active, skipped = [], []
+            for i in range(len(self)): (skipped if node_type in self.graphs[i].type_set(self.selector(self.states[i])) else active).append(i)
+            for i in skipped: self._report(StepOutcome('skipped', scanner_arguments, machine = i))
+        else: active = range(len(self))
+
+        scan_results = self._scan(active, scanner_arguments, top_k)
+        updater = self.greedy_updater if greedy else self.updater
+        for i in active:
+            record = self.logs[i].append(LogRecord('step', scan_result = scan_results[i], scanner_arguments = scanner_arguments))
+            self.states[i], self.graphs[i] = updater(self.states[i], self.graphs[i], scan_results[i])
+            self._report(StepOutcome('taken' if scan_results[i] else 'no_candidates', scanner_arguments, record, machine = i))
+        return self
+
+    def _report(self, outcome: StepOutcome):
+        self.last_outcomes[outcome.machine] = outcome
+        if self.outcome_handler is not None: self.outcome_handler(outcome)
+
+    def consecutive_steps(self, *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False, top_k: int = None):
+        '''Perform the given steps one after the other on all machines; see GSM.consecutive_steps'''
+        for ss in scanners_arguments: self.step(**self._ensure_scanner_args_are_named(ss), conditional = conditional, greedy = greedy, top_k = top_k)
+        return self
+
+    def run(self, *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False, top_k: int = None) -> Tuple[List[State], List[GSMLog]]:
+        '''Perform the given steps (as consecutive_steps) and return the final states and the per-machine logs'''
+        self.consecutive_steps(*scanners_arguments, conditional = conditional, greedy = greedy, top_k = top_k)
+        return self.states, self.logs
+
+
+    # Utility methods
+
+    _ensure_scanner_args_are_named = GSM._ensure_scanner_args_are_named
@@ -0,0 +1,69 @@
+import time
+from copy import copy
+from collections import Counter, OrderedDict
+from threading import Lock
+
+from Graph_State_Machine.Util.generic_util import frozen
+from Graph_State_Machine.types import *
+
+
+class ScanCache:
+    '''Opt-in LRU memoisation of GSM scans (see GSM's scan_cache argument), keyed on the graph version (see Graph.version),
+        the state nodes (i.e. selector(state)), the Scanner and its named arguments (top_k included).
+        - maxsize: maximum number of cached scan results, the least recently used being evicted first
+        - ttl: if given, number of seconds after which a cached result is discarded
+        - state_key: the function turning the state nodes into the key component; the default, tuple, is exact, while ScanCache.multiset
+            shares results between states differing only in node order (and frozenset also in duplicates), which is only correct for Scanners whose result
+            does not depend on it (e.g. by_score with the provided scores, but not neighbour_intersection, whose ties are in state order)
+        A cache can be shared by any number of GSMs, also across threads; scan results are returned as shallow copies, and scans with unhashable arguments are not cached.
+        Note: graphs modified in place (rather than through _set_graph, compile or extend_with) need their mark_changed method called, otherwise stale results are returned'''
+    def __init__(self, maxsize = 1024, ttl: float = None, state_key: Callable[[List[Node]], Hashable] = tuple, clock: Callable[[], float] = time.monotonic):
+        self.maxsize, self.ttl, self.state_key, self.clock = maxsize, ttl, state_key, clock
+        self.entries, self.lock = OrderedDict(), Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    @staticmethod
+    def multiset(nodes: List[Node]) -> Hashable: return frozenset(Counter(nodes).items())
+
+    def get(self, graph: Graph, scanner: Scanner, nodes: List[Node], scanner_arguments: Dict[str, Any], scan: Callable[[], ScanResult]) -> ScanResult:
+        '''Cached result of the given scan if present (and not expired), otherwise the result of calling scan (which is then cached)'''
+        try: key = (getattr(graph, 'version', None), self.state_key(nodes), scanner, frozen(scanner_arguments))
+        except TypeError: key = None
+        try: hash(key)
+        except TypeError: key = None
+        if key is None or key[0] is None: return scan()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and self.clock() - entry[1] > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy(entry[0])
+            self.misses += 1
+
+        res = scan() # Outside the lock, so that concurrent scans do not wait for each other
+        with self.lock:
+            self.entries[key] = (res, self.clock())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last = False)
+                self.evictions += 1
+        return copy(res)
+
+    def clear(self):
+        with self.lock: self.entries.clear()
+        return self
+
+    def info(self) -> Dict[str, Any]:
+        '''Counters and occupancy, e.g. for sizing: hits, misses, hit_rate, evictions (by size), expirations (by ttl), size and maxsize'''
+        with self.lock:
+            return dict(hits = self.hits, misses = self.misses, hit_rate = self.hits / max(self.hits + self.misses, 1),
+                        evictions = self.evictions, expirations = self.expirations, size = len(self.entries), maxsize = self.maxsize)
+
+    def __len__(self): return len(self.entries)
+    def __repr__(self): return f'ScanCache({self.info()})'
+    def __deepcopy__(self, memo): return self # A shared resource rather than data
@@ -0,0 +1,391 @@
+import json
+from itertools import chain, islice
+import networkx as nx
+import numpy as np
+
+from typing import *
+Node = str
+NodeType = str
+
+# Edge kind flags (see CompiledGraph.edge_kinds and Graph.edge_kind), from the point of view of the node the edge is looked up from; plain edges have none
+NECESSARY, SUFFICIENT, JOINTLY_SUFFICIENT, REQUIRED_BY = 1, 2, 4, 8 # The neighbour is necessary / alone sufficient / in a jointly sufficient set for the node, or requires it
+
+
+def gather(indptr: np.ndarray, indices: Optional[np.ndarray], rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''Concatenate the CSR rows of the given row ids, returning (values, per-row counts); the workhorse of all compiled lookups.
+        If indices is None then the positions themselves are returned as values (e.g. ids of items stored contiguously by row)'''
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    if not (total := int(counts.sum())): return np.zeros(0, dtype = np.int64), counts
+    positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+    return (positions if indices is None else indices[positions]), counts
+
+def offsets(lengths: Iterable[int], n_rows: int) -> np.ndarray:
+    '''CSR indptr array from per-row lengths'''
+    indptr = np.zeros(n_rows + 1, dtype = np.int64)
+    indptr[1:] = np.cumsum(lengths if isinstance(lengths, np.ndarray) else np.fromiter(lengths, dtype = np.int64, count = n_rows))
+    return indptr
+
+def csr(lengths: Iterable[int], values: Iterable[int], n_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''Build (indptr, indices) arrays from per-row lengths and the flattened row values'''
+    indptr = offsets(lengths, n_rows)
+    return indptr, np.fromiter(values, dtype = np.int64, count = int(indptr[-1]))
+
+def move_rows(indptr: np.ndarray, indices: np.ndarray, lengths: np.ndarray, old_rows: np.ndarray, new_rows: np.ndarray,
+              fresh_rows: np.ndarray, fresh_values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''New CSR with the given per-row lengths in which the old rows old_rows are copied (in bulk) into the rows new_rows
+        and the rows fresh_rows are filled with the flattened fresh_values (in fresh_rows order)'''
+    new_indptr = offsets(lengths, len(lengths))
+    new_indices = np.empty(int(new_indptr[-1]), dtype = indices.dtype)
+    old_positions, counts = gather(indptr, None, old_rows)
+    new_indices[old_positions + np.repeat(new_indptr[new_rows] - indptr[old_rows], counts)] = indices[old_positions]
+    new_indices[gather(new_indptr, None, fresh_rows)[0]] = fresh_values
+    return new_indptr, new_indices
+
+def replace_rows(indptr: np.ndarray, indices: np.ndarray, n_rows: int, kept_rows: np.ndarray, rows: np.ndarray, lengths: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''New CSR of n_rows rows (possibly more than the old ones) keeping the old kept_rows as they are and filling rows with the given lengths and flattened values'''
+    all_lengths = np.zeros(n_rows, dtype = np.int64)
+    all_lengths[kept_rows] = indptr[kept_rows + 1] - indptr[kept_rows]
+    all_lengths[rows] = lengths
+    return move_rows(indptr, indices, all_lengths, kept_rows, kept_rows, rows, values)
+
+def segment_ids(counts: np.ndarray) -> np.ndarray:
+    '''The row (segment) index of each value in the output of gather'''
+    return np.repeat(np.arange(len(counts)), counts)
+
+def sorted_membership(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    '''Vectorised "in" test of keys against a sorted array of unique keys'''
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), max(len(sorted_keys) - 1, 0))
+    return sorted_keys[positions] == keys if len(sorted_keys) else np.zeros(len(keys), dtype = bool)
+
+def transpose(indptr: np.ndarray, indices: np.ndarray, n_cols: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''Reverse CSR structure, i.e. for each column value the (ascending) rows containing it'''
+    order = np.argsort(indices, kind = 'stable')
+    return offsets(np.bincount(indices, minlength = n_cols), n_cols), segment_ids(np.diff(indptr))[order]
+
+
+class CompiledGraph:
+    '''Frozen array form of a Graph: integer node ids (in networkx node order), a CSR neighbour array (preserving networkx neighbour order),
+        a type-code array and a necessity/sufficiency index; built once from a networkx graph and then only read from.
+        Node ids are positions in .nodes, and type codes are positions in .types (which is sorted, as Graph.types).
+        The necessity/sufficiency index consists of three CSR structures:
+            - nec_indptr/nec_indices: the necessary node ids of each node (in attribute order)
+            - suff_indptr: the (contiguous) range of sufficient-set ids of each node (in attribute order)
+            - set_indptr/set_indices: the (sorted) member node ids of each sufficient set (singletons for plain sufficiency)
+        The same index classifies every adjacency entry by kind in edge_kinds'''
+    array_names = ['type_codes', 'indptr', 'indices', 'nec_indptr', 'nec_indices', 'suff_indptr', 'set_indptr', 'set_indices', 'name_rank'] # Flat form content
+    file_magic = b'GSM-COMPILED-GRAPH-1\n'
+
+    def __init__(self, nodes: List[Node], types: List[NodeType], type_codes: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 nec_indptr: np.ndarray, nec_indices: np.ndarray, suff_indptr: np.ndarray, set_indptr: np.ndarray, set_indices: np.ndarray,
+                 name_rank: np.ndarray = None, node_ids: Dict[Node, int] = None):
+        self.nodes = nodes
+        self.node_array = np.array(nodes, dtype = object)
+        self.node_ids = node_ids if node_ids is not None else {n: i for i, n in enumerate(nodes)}
+        if name_rank is None: # Position of each node in name order, for (score, name) sorting of id arrays
+            name_rank = np.empty(len(nodes), dtype = np.int64)
+            name_rank[sorted(range(len(nodes)), key = nodes.__getitem__)] = np.arange(len(nodes))
+        self.name_rank = name_rank
+        self.types = types
+        self.type_ids = {t: i for i, t in enumerate(types)}
+        self.type_codes = type_codes
+        self.indptr = indptr
+        self.indices = indices
+        self.nec_indptr, self.nec_indices = nec_indptr, nec_indices
+        self.suff_indptr, self.set_indptr, self.set_indices = suff_indptr, set_indptr, set_indices
+
+    @classmethod
+    def from_networkx(cls, G: nx.Graph, type_attr: NodeType = 'node_type') -> 'CompiledGraph':
+        nodes = list(G.nodes)
+        node_ids = {n: i for i, n in enumerate(nodes)}
+        types = sorted(set(nx.get_node_attributes(G, type_attr).values()))
+        type_ids = {t: i for i, t in enumerate(types)}
+
+        type_codes = np.fromiter((type_ids[t] for _, t in G.nodes(data = type_attr)), dtype = np.int32, count = len(nodes))
+        adj_lengths, adj, nec_lengths, nec, suff_lengths, set_lengths, sets = cls._rows(G, nodes, node_ids)
+        suff_indptr = offsets(suff_lengths, len(nodes))
+        return cls(nodes, types, type_codes, *(offsets(adj_lengths, len(nodes)), adj), *(offsets(nec_lengths, len(nodes)), nec),
+                   suff_indptr, offsets(set_lengths, int(suff_indptr[-1])), sets, node_ids = node_ids)
+
+    @staticmethod
+    def _rows(G: nx.Graph, nodes: List[Node], node_ids: Dict[Node, int]) -> Tuple[np.ndarray, ...]:
+        '''Per-row lengths and flattened values of the neighbour, necessity and sufficiency structures of the given nodes:
+            (neighbour counts, neighbours, necessary counts, necessary nodes, sufficient-set counts, set sizes, set members)'''
+        adj_lengths = np.fromiter((len(G._adj[n]) for n in nodes), dtype = np.int64, count = len(nodes))
+        adj = np.fromiter((node_ids[b] for n in nodes for b in G._adj[n]), dtype = np.int64, count = int(adj_lengths.sum()))
+        attributes = [G._node[n] for n in nodes]
+        necessary = [d.get('necessary', ()) for d in attributes]
+        sufficient = [[sorted(node_ids[a] for a in ns) for ns in d.get('sufficient', ())] for d in attributes]
+        nec_lengths, set_lengths = np.fromiter(map(len, necessary), dtype = np.int64, count = len(nodes)), np.array([len(ns) for nss in sufficient for ns in nss], dtype = np.int64)
+        return (adj_lengths, adj, nec_lengths, np.fromiter((node_ids[a] for ns in necessary for a in ns), dtype = np.int64, count = int(nec_lengths.sum())),
+                np.fromiter(map(len, sufficient), dtype = np.int64, count = len(nodes)), set_lengths, np.fromiter(chain.from_iterable(chain.from_iterable(sufficient)), dtype = np.int64, count = int(set_lengths.sum())))
+
+    def extended(self, G: nx.Graph, touched: Iterable[Node], type_attr: NodeType = 'node_type') -> 'CompiledGraph':
+        '''Compiled form of G, a graph extending the one this was compiled from: the same nodes in the same order followed by any new ones,
+            with differences only in the attributes and adjacencies of the given touched nodes (new nodes being implicitly touched).
+            Only the touched rows are built from G, all others (and the node-id map) being copied over in bulk, which is still linear in this graph'''
+        n_old = len(self.nodes)
+        nodes = self.nodes + (new_nodes := list(islice(G._node, n_old, None)))
+        node_ids = dict(self.node_ids)
+        node_ids.update((n, i) for i, n in enumerate(new_nodes, n_old))
+        rows = np.unique(np.fromiter((node_ids[n] for n in chain(touched, new_nodes)), dtype = np.int64))
+        kept = np.setdiff1d(np.arange(n_old), rows, assume_unique = True)
+        touched_nodes = [nodes[i] for i in rows.tolist()]
+
+        row_types = [G._node[n][type_attr] for n in touched_nodes]
+        types = sorted(set(self.types).union(row_types))
+        type_ids = {t: i for i, t in enumerate(types)}
+        type_codes = np.empty(len(nodes), dtype = np.int32)
+        type_codes[:n_old] = np.array([type_ids[t] for t in self.types], dtype = np.int32)[self.type_codes]
+        type_codes[rows] = [type_ids[t] for t in row_types]
+        if not (present := np.bincount(type_codes, minlength = len(types)) > 0).all(): # Some existing node changed to a new type, leaving an old one unused
+            types, type_codes = [t for t, p in zip(types, present) if p], (np.cumsum(present) - 1).astype(np.int32)[type_codes]
+
+        adj_lengths, adj, nec_lengths, nec, suff_lengths, set_lengths, sets = self._rows(G, touched_nodes, node_ids)
+        suff_indptr, all_set_lengths = replace_rows(self.suff_indptr, np.diff(self.set_indptr), len(nodes), kept, rows, suff_lengths, set_lengths)
+        set_indptr, set_indices = move_rows(self.set_indptr, self.set_indices, all_set_lengths, gather(self.suff_indptr, None, kept)[0],
+                                            gather(suff_indptr, None, kept)[0], gather(suff_indptr, None, rows)[0], sets)
+
+        name_rank = self.name_rank
+        if new_nodes: # Merging the new names into the existing name order
+            order = np.empty(n_old, dtype = np.int64)
+            order[self.name_rank] = np.arange(n_old)
+            new_order = np.array(sorted(range(len(new_nodes)), key = new_nodes.__getitem__), dtype = np.int64)
+            positions = np.searchsorted(self.node_array[order], np.array(new_nodes, dtype = object)[new_order])
+            name_rank = np.empty(len(nodes), dtype = np.int64)
+            name_rank[:n_old] = self.name_rank + np.searchsorted(positions, self.name_rank, side = 'right')
+            name_rank[n_old + new_order] = positions + np.arange(len(new_nodes))
+
+        return CompiledGraph(nodes, types, type_codes, *replace_rows(self.indptr, self.indices, len(nodes), kept, rows, adj_lengths, adj),
+                             *replace_rows(self.nec_indptr, self.nec_indices, len(nodes), kept, rows, nec_lengths, nec),
+                             suff_indptr, set_indptr, set_indices, name_rank = name_rank, node_ids = node_ids)
+
+
+    @property
+    def reverse_necessity_sufficiency(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        '''(Cached) reverse necessity/sufficiency index, for updates driven by state nodes rather than by candidates:
+            (rev_nec_indptr, rev_nec_indices, rev_set_indptr, rev_set_indices, set_owners), i.e. the nodes each node is necessary for,
+            the sufficient sets each node is a member of and the node owning each sufficient set'''
+        if (res := getattr(self, '_reverse_nec_suff', None)) is None:
+            res = self._reverse_nec_suff = (*transpose(self.nec_indptr, self.nec_indices, len(self.nodes)),
+                                            *transpose(self.set_indptr, self.set_indices, len(self.nodes)), segment_ids(np.diff(self.suff_indptr)))
+        return res
+
+    @property
+    def edge_kinds(self) -> np.ndarray:
+        '''(Cached) kind flags (NECESSARY, SUFFICIENT, JOINTLY_SUFFICIENT and REQUIRED_BY) of every adjacency entry, aligned with indices, 0 marking plain edges;
+            derived from the necessity/sufficiency index by a single sorted matching of (node, neighbour) keys'''
+        if (res := self.__dict__.get('_edge_kinds')) is None:
+            n, set_lengths = len(self.nodes), np.diff(self.set_indptr)
+            keys = segment_ids(np.diff(self.indptr)) * n + self.indices
+            order = np.argsort(keys, kind = 'stable')
+            sorted_keys = keys[order]
+            owners = np.concatenate([segment_ids(np.diff(self.nec_indptr)), np.repeat(segment_ids(np.diff(self.suff_indptr)), set_lengths)])
+            members = np.concatenate([self.nec_indices, self.set_indices])
+            kinds = np.concatenate([np.full(len(self.nec_indices), NECESSARY, dtype = np.uint8),
+                                    np.where(np.repeat(set_lengths, set_lengths) == 1, SUFFICIENT, JOINTLY_SUFFICIENT).astype(np.uint8)])
+            res = np.zeros(len(self.indices), dtype = np.uint8)
+            for entry_keys, entry_kinds in [(owners * n + members, kinds), (members * n + owners, np.full(len(kinds), REQUIRED_BY, dtype = np.uint8))]:
+                found = sorted_membership(sorted_keys, entry_keys) # Requirements without an edge (see Graph.consistent) have no entry to mark
+                np.bitwise_or.at(res, order[np.searchsorted(sorted_keys, entry_keys[found])], entry_kinds[found])
+            self.__dict__['_edge_kinds'] = res
+        return res
+
+
+    # Lookups
+
+    def ids(self, nodes: Iterable[Node]) -> np.ndarray:
+        try: return np.fromiter((self.node_ids[n] for n in nodes), dtype = np.int64)
+        except KeyError as e: raise nx.NetworkXError(f'The node {e.args[0]} is not in the graph.') from None
+
+    def names(self, ids: np.ndarray) -> List[Node]: return self.node_array[ids].tolist()
+
+    def type_mask(self, good_types: Iterable[NodeType] = None, bad_types: Iterable[NodeType] = None) -> np.ndarray:
+        '''Boolean mask over type codes with the same semantics as Graph.type_filter (empty or None good_types meaning all types)'''
+        mask = np.zeros(len(self.types), dtype = bool)
+        if good_types: mask[[c for t in good_types if (c := self.type_ids.get(t)) is not None]] = True
+        else: mask[:] = True
+        if bad_types: mask[[c for t in bad_types if (c := self.type_ids.get(t)) is not None]] = False
+        return mask
+
+    def neighbours(self, ids: np.ndarray, type_mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        '''Concatenated neighbours of the given ids (in networkx order) and their per-id counts, optionally restricted by a type mask'''
+        values, counts = gather(self.indptr, self.indices, ids)
+        if type_mask is None or type_mask.all(): return values, counts
+        keep = type_mask[self.type_codes[values]]
+        return values[keep], np.bincount(segment_ids(counts)[keep], minlength = len(ids))
+
+    def type_degrees(self, type_mask: np.ndarray) -> np.ndarray:
+        '''(Cached) numbers of neighbours of types in the given mask of all nodes'''
+        if (degrees := (cache := self.__dict__.setdefault('_type_degrees', {})).get(key := type_mask.tobytes())) is None:
+            degrees = cache[key] = np.diff(self.indptr) if type_mask.all() else \
+                np.bincount(segment_ids(np.diff(self.indptr))[type_mask[self.type_codes[self.indices]]], minlength = len(self.nodes))
+        return degrees
+
+    def state_mask(self, state_ids: np.ndarray) -> np.ndarray:
+        '''Indicator vector of the given ids over all nodes'''
+        mask = np.zeros(len(self.nodes), dtype = bool)
+        mask[state_ids] = True
+        return mask
+
+    def necessity_sufficiency_mask(self, state_ids: np.ndarray, candidate_ids: np.ndarray, check_necessity = True, check_sufficiency = True,
+                                   check_only_state_types = False) -> np.ndarray:
+        '''Boolean mask over candidate_ids with the semantics of Graph.necessity_sufficiency_filter, evaluated on the precomputed index:
+            a candidate passes if all of its necessary nodes are "ok" and, if it has sufficient sets, all the members of at least one of them are,
+            "ok" meaning in state (or of a type not in state if check_only_state_types is True); candidates without requirements always pass'''
+        ok = self.nec_suff_ok_mask(state_ids, check_only_state_types)
+        return self.necessity_sufficiency_ok(lambda _, ids: ok[ids], candidate_ids, check_necessity, check_sufficiency)
+
+    def nec_suff_ok_mask(self, state_ids: np.ndarray, check_only_state_types = False) -> np.ndarray:
+        '''Mask over all nodes of those counting as satisfied in necessity/sufficiency checks: the state bitset, plus all nodes of types not in state if requested'''
+        ok = self.state_mask(state_ids)
+        if check_only_state_types:
+            state_types = np.zeros(len(self.types), dtype = bool)
+            state_types[self.type_codes[state_ids]] = True
+            ok |= ~state_types[self.type_codes]
+        return ok
+
+    def necessity_sufficiency_ok(self, ok: Callable[[np.ndarray, np.ndarray], np.ndarray], candidate_ids: np.ndarray, check_necessity = True, check_sufficiency = True) -> np.ndarray:
+        '''Boolean mask over candidate_ids given an "ok" function of (candidate positions, node ids) pairs (see nec_suff_ok_mask for the single-state version)'''
+        res = np.ones(len(candidate_ids), dtype = bool)
+        if check_necessity:
+            values, counts = gather(self.nec_indptr, self.nec_indices, candidate_ids)
+            res &= np.bincount((owners := segment_ids(counts))[~ok(owners, values)], minlength = len(candidate_ids)) == 0
+        if check_sufficiency:
+            set_ids, set_counts = gather(self.suff_indptr, None, candidate_ids)
+            members, member_counts = gather(self.set_indptr, self.set_indices, set_ids)
+            set_ok = np.bincount((sets := segment_ids(member_counts))[~ok(segment_ids(set_counts)[sets], members)], minlength = len(set_ids)) == 0
+            res &= (set_counts == 0) | (np.bincount(segment_ids(set_counts)[set_ok], minlength = len(candidate_ids)) > 0)
+        return res
+
+    def split_names(self, values: np.ndarray, counts: np.ndarray) -> List[List[Node]]:
+        '''Split the output of .neighbours back into per-id lists of node names'''
+        names = self.names(values)
+        return [names[end - c:end] for end, c in zip(np.cumsum(counts).tolist(), counts.tolist())]
+
+
+    # Reachability analysis
+
+    def requirement_free_mask(self, check_necessity = True, check_sufficiency = True) -> np.ndarray:
+        '''Mask over all nodes of those without (checked) necessary nodes or sufficient sets, i.e. which any adjacent state makes candidates'''
+        res = np.ones(len(self.nodes), dtype = bool)
+        if check_necessity: res &= np.diff(self.nec_indptr) == 0
+        if check_sufficiency: res &= np.diff(self.suff_indptr) == 0
+        return res
+
+    def attainable_mask(self, start_ids: np.ndarray, check_necessity = True, check_sufficiency = True) -> np.ndarray:
+        '''Mask over all nodes of those which can be in a state grown from the start ids by steps, i.e. by adding candidates (neighbours of state nodes)
+            passing the (checked) necessity/sufficiency requirements: the least fixpoint of that rule, propagated in rounds from each round's newly attained nodes
+            through the neighbour and reverse necessity/sufficiency indices, so that every index entry is visited once overall.
+            Since the result is closed under the rule, scans of states within it (without check_only_state_types) only ever accept candidates within it'''
+        n = len(self.nodes)
+        rev_nec_indptr, rev_nec_indices, rev_set_indptr, rev_set_indices, set_owners = self.reverse_necessity_sufficiency
+        nec_missing = np.diff(self.nec_indptr) # Numbers of necessary nodes not yet attained
+        set_missing = np.diff(self.set_indptr) # Numbers of sufficient-set members not yet attained
+        unsatisfied = np.diff(self.suff_indptr) > 0 if check_sufficiency else np.zeros(n, dtype = bool)
+        if check_sufficiency: unsatisfied[set_owners[set_missing == 0]] = False # Empty sets are trivially satisfied
+        adjacent, attained = np.zeros(n, dtype = bool), self.state_mask(start_ids)
+        frontier = np.flatnonzero(attained)
+        while len(frontier):
+            neighbours = gather(self.indptr, self.indices, frontier)[0]
+            adjacent[neighbours] = True
+            if check_necessity:
+                owners, counts = np.unique(gather(rev_nec_indptr, rev_nec_indices, frontier)[0], return_counts = True)
+                nec_missing[owners] -= counts
+            if check_sufficiency:
+                sets, counts = np.unique(gather(rev_set_indptr, rev_set_indices, frontier)[0], return_counts = True)
+                set_missing[sets] -= counts
+                unsatisfied[set_owners[sets[set_missing[sets] == 0]]] = False
+            # Requirement nodes are neighbours (see Graph.consistent), so only neighbours of the frontier can become attainable
+            frontier = np.unique(neighbours)
+            frontier = frontier[~attained[frontier] & adjacent[frontier] & ~unsatisfied[frontier] & ((nec_missing[frontier] == 0) if check_necessity else True)]
+            attained[frontier] = True
+        return attained
+
+    def prerequisite_index(self, check_necessity = True, check_sufficiency = True) -> Tuple[np.ndarray, np.ndarray]:
+        '''(Cached) CSR (indptr, indices) of the direct prerequisites of each node, i.e. the nodes which must be in state for it to pass the (checked)
+            necessity/sufficiency requirements: its necessary nodes and the members common to all its sufficient sets'''
+        if (res := (cache := self.__dict__.setdefault('_prerequisite_index', {})).get(key := (check_necessity, check_sufficiency))) is None:
+            n, keys = len(self.nodes), [np.zeros(0, dtype = np.int64)]
+            if check_necessity: keys.append(segment_ids(np.diff(self.nec_indptr)) * n + self.nec_indices)
+            if check_sufficiency: # Members appearing in as many of a node's sets as it has (members being unique within sets)
+                set_counts = np.diff(self.suff_indptr)
+                member_keys, member_counts = np.unique(segment_ids(set_counts)[segment_ids(np.diff(self.set_indptr))] * n + self.set_indices, return_counts = True)
+                keys.append(member_keys[member_counts == set_counts[member_keys // n]])
+            owners, prerequisites = np.divmod(np.unique(np.concatenate(keys)), n)
+            res = cache[key] = (offsets(np.bincount(owners, minlength = n), n), prerequisites)
+        return res
+
+    def prerequisites_mask(self, ids: np.ndarray, check_necessity = True, check_sufficiency = True) -> np.ndarray:
+        '''Mask over all nodes of the transitive prerequisites of the given ids (see prerequisite_index), i.e. of the nodes which any state containing them
+            (and grown by steps from states without them) must contain; the given ids are only included if they are their own prerequisites, i.e. in a requirement cycle'''
+        indptr, indices = self.prerequisite_index(check_necessity, check_sufficiency)
+        res, frontier = np.zeros(len(self.nodes), dtype = bool), np.unique(ids)
+        while len(frontier):
+            frontier = np.unique(gather(indptr, indices, frontier)[0])
+            frontier = frontier[~res[frontier]]
+            res[frontier] = True
+        return res
+
+
+    # Conversions
+
+    def to_networkx(self, type_attr: NodeType = 'node_type') -> nx.Graph:
+        '''Rebuild the networkx graph this was compiled from, with the same node and neighbour orders and necessity/sufficiency attributes
+            (NOTE: edge attributes and node attributes other than the type and necessity/sufficiency ones are not part of the compiled form)'''
+        G, nodes = nx.Graph(), self.nodes
+        G.add_nodes_from((n, {type_attr: self.types[t]}) for n, t in zip(nodes, self.type_codes.tolist()))
+        for n, attrs, ns in zip(nodes, G._node.values(), self.split_names(*gather(self.nec_indptr, self.nec_indices, np.arange(len(nodes))))):
+            if ns: attrs['necessary'] = ns
+        set_names = [set(ns) for ns in self.split_names(*gather(self.set_indptr, self.set_indices, np.arange(len(self.set_indptr) - 1)))]
+        for attrs, a, b in zip(G._node.values(), self.suff_indptr[:-1].tolist(), self.suff_indptr[1:].tolist()):
+            if b > a: attrs['sufficient'] = set_names[a:b]
+        adj = G._adj
+        for n, ns in zip(nodes, self.split_names(self.indices, np.diff(self.indptr))): # Filling each adjacency dict in order, sharing edge data dicts as networkx does
+            row = adj[n]
+            for b in ns: row[b] = adj[b][n] if n in adj[b] else {}
+        return G
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        '''Flat array form (with node names as utf-8 bytes and offsets), as used by save'''
+        if bad := [n for n in self.nodes if not isinstance(n, str)][:5]: raise TypeError(f'Only graphs with string nodes can be converted to flat arrays; found nodes such as {bad}')
+        names = [n.encode('utf-8') for n in self.nodes]
+        return dict(name_bytes = np.frombuffer(b''.join(names), dtype = np.uint8), name_offsets = offsets(map(len, names), len(names)),
+                    **{a: getattr(self, a) for a in self.array_names})
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], types: List[NodeType]) -> 'CompiledGraph':
+        name_bytes, name_offsets = arrays['name_bytes'].tobytes(), arrays['name_offsets'].tolist()
+        if len(text := name_bytes.decode('utf-8')) == len(name_bytes): nodes = [text[a:b] for a, b in zip(name_offsets, name_offsets[1:])] # ASCII: byte offsets are character offsets
+        else: nodes = [name_bytes[a:b].decode('utf-8') for a, b in zip(name_offsets, name_offsets[1:])]
+        return cls(nodes, types, *(arrays[a] for a in cls.array_names))
+
+    def save(self, path: str, metadata: Dict[str, Any] = None):
+        '''Write the flat array form to a single file: a magic line, the length of a JSON header (8 bytes, little-endian), the header itself
+            (array layout, types and any given JSON-serialisable metadata) and the 64-byte-aligned raw arrays; see load'''
+        arrays, layout, position = self.to_arrays(), {}, 0
+        for name, a in arrays.items():
+            layout[name] = dict(dtype = a.dtype.str, shape = list(a.shape), offset = position)
+            position += -(-a.nbytes // 64) * 64
+        header = json.dumps(dict(types = self.types, metadata = metadata if metadata else {}, arrays = layout)).encode('utf-8')
+        start = -(-(len(self.file_magic) + 8 + len(header)) // 64) * 64
+        with open(path, 'wb') as f:
+            f.write(self.file_magic + len(header).to_bytes(8, 'little') + header)
+            for name, a in arrays.items():
+                f.seek(start + layout[name]['offset'])
+                f.write(np.ascontiguousarray(a).tobytes())
+            f.truncate(start + position)
+
+    @classmethod
+    def load(cls, path: str, mmap = True) -> Tuple['CompiledGraph', Dict[str, Any]]:
+        '''Read a file written by save, returning the CompiledGraph and the saved metadata;
+            if mmap is True then the arrays are read-only views of a memory map of the file (shared between processes by the OS)'''
+        with open(path, 'rb') as f:
+            if f.read(len(cls.file_magic)) != cls.file_magic: raise ValueError(f'{path} is not a compiled graph file')
+            header = json.loads(f.read(int.from_bytes(f.read(8), 'little')).decode('utf-8'))
+            start = -(-f.tell() // 64) * 64
+        data = np.memmap(path, dtype = np.uint8, mode = 'r') if mmap else np.fromfile(path, dtype = np.uint8)
+        arrays = {name: data[(a := start + l['offset']):a + int(np.prod(l['shape'])) * np.dtype(l['dtype']).itemsize].view(l['dtype']).reshape(l['shape'])
+                  for name, l in header['arrays'].items()}
+        return cls.from_arrays(arrays, header['types']), header['metadata']
+
@@ -1,30 +1,156 @@
-from operator import itemgetter
 import networkx as nx
 import numpy as np
-import matplotlib.colors as mcolors
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
 from pprint import pformat
-from copy import deepcopy
+from copy import copy
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain, count, islice
+from threading import Lock
 from warnings import warn
 
-from Graph_State_Machine.Util.generic_util import diff, group_by, flatten, intersperse_val
-from Graph_State_Machine.Util.misc import check_edge_dict_keys, radial_degrees
+from Graph_State_Machine.Util.generic_util import diff, group_by, flatten, intersperse_val, frozen
+from Graph_State_Machine.Util.misc import check_edge_dict_keys, edge_dict_keys, radial_degrees
+from Graph_State_Machine.overlay import CopyOnWriteGraph
+from Graph_State_Machine.compiled import CompiledGraph, NECESSARY, SUFFICIENT, JOINTLY_SUFFICIENT, REQUIRED_BY
 
 from typing import *
 Node = str
 NodeType = str
-TypedAdjacencies = Dict[NodeType, Dict[Node, Union[List[Node], Dict[str, List[Union[Node, List[Node]]]]]]]
-
+Adjacency = Union[List[Node], Dict[str, List[Union[Node, List[Node]]]]]
+TypedAdjacencies = Dict[NodeType, Dict[Node, Adjacency]]
+
+_versions = count() # Source of Graph version tokens, unique across all graphs of the process
+_lazy_lock = Lock() # Guards the lazy construction of G for graphs created by from_compiled and of colour maps
+
+
+@lru_cache(maxsize = None)
+def _xkcd_palette() -> Tuple[str, ...]:
+    '''The default colour order: a few hardcoded distinct colours followed by the rest of matplotlib's XKCD ones (whose import is deferred to here)'''
+    import matplotlib.colors as mcolors
+    xkcd_palette = ['xkcd:green', 'xkcd:blue', 'xkcd:purple', 'xkcd:red', 'xkcd:orange', 'xkcd:yellow', 'xkcd:lime', 'xkcd:teal', 'xkcd:azure']
+    # ms_office_dark_theme_palette = {'Green': '#81BB42', 'Blue': '#4A9BDC', 'Red': '#DF2E28', 'Orange': '#FE801A', 'Yellow': '#E9BF35', 'Cyan': '#32C7A9', 'Dark Orange': '#D15E01'}.values()
+    xkcd_palette = xkcd_palette + diff(mcolors.XKCD_COLORS.keys(), xkcd_palette)
+    # Removing some colours which are very similar to the hardcoded first few
+    return tuple(diff(xkcd_palette, ['xkcd:dark grass green', 'xkcd:dark pastel green', 'xkcd:fresh green', 'xkcd:electric lime', 'xkcd:light eggplant']))
+
+_layouts, _layouts_lock, _layouts_maxsize = OrderedDict(), Lock(), 16 # The process-wide LRU cache of plot layouts (see Graph.get_layout)
+
+def _coloured(types: List[NodeType], colour_map: Optional[Dict[NodeType, str]], default_cols: Optional[List[str]], custom_cols: List[str] = None) -> Tuple[Dict[NodeType, str], List[str]]:
+    '''Colour map and default colours after a graph with the given colour map and default colours acquires the given types;
+        new types take the first unused default colours, and the palette is only needed if there is no colour map yet'''
+    if colour_map:
+        if set(colour_map.keys()) == set(types): return colour_map, default_cols # Nothing to change if equal
+        new_types = diff(types, colour_map.keys())
+        new_cols = diff(default_cols, colour_map.values())
+        new_map = dict(zip(new_types, new_cols))
+        # The following two are defined so as to look as though they were defined directly and not from an extension
+        colour_map = {t: colour_map[t] if t in colour_map else new_map[t] for t in types}
+        return colour_map, list(colour_map.values()) + diff(default_cols, colour_map.values())
+    if custom_cols: default_cols = custom_cols + diff(_xkcd_palette(), custom_cols)
+    elif default_cols: default_cols = default_cols + diff(_xkcd_palette(), default_cols)
+    else: default_cols = list(_xkcd_palette())
+    return dict(zip(types, default_cols)), default_cols
+
+
+def _segments(coords: Dict[Node, Iterable[float]], pairs: Iterable[Tuple[Node, Node]]) -> Tuple[np.ndarray, np.ndarray]:
+    '''x and y arrays of line segments between the given pairs of nodes, separated by NaN (i.e. gaps for plotly), which plotly validates much faster than lists'''
+    ends = np.array([(coords[a], coords[b]) for a, b in pairs], dtype = float).reshape(-1, 2, 2)
+    lines = np.concatenate([ends, np.full((len(ends), 1, 2), np.nan)], axis = 1).reshape(-1, 2)
+    return lines[:, 0], lines[:, 1]
+
+
+class NodeIndex:
+    '''Per-node data derived from a graph (e.g. a node's neighbours grouped by type), computed by compute on first lookup and then cached.
+        The index of an extension (see Graph.extend_with) takes the entries its base graph's index already computed for all but the touched nodes
+        (whose data may differ), so that neither building nor extending a graph computes or copies entries for all its nodes'''
+    __slots__ = ('compute', 'cache', 'base_cache', 'touched')
+
+    def __init__(self, compute: Callable[[Node], Any], base: 'NodeIndex' = None, touched: Collection[Node] = ()):
+        self.compute, self.cache, self.touched = compute, {}, touched
+        self.base_cache = base.cache if base is not None else None # Not the base index itself, so that chains of extensions do not keep all their indices alive
+
+    def __getitem__(self, n: Node):
+        if (res := self.cache.get(n)) is None:
+            if self.base_cache is None or n in self.touched or (res := self.base_cache.get(n)) is None: res = self.compute(n)
+            self.cache[n] = res
+        return res
+
+
+class Requirements(NamedTuple):
+    '''A node's entry in the requirement index (see Graph.requirements): its necessary nodes, its sufficient sets (positions in sufficient being
+        the node's set ids, as in the compiled index) and the kind flags (NECESSARY, SUFFICIENT and JOINTLY_SUFFICIENT) of each of its requirements'''
+    necessary: Tuple[Node, ...]
+    sufficient: Tuple[Set[Node], ...]
+    kinds: Dict[Node, int]
+
+    @classmethod
+    def of(cls, necessary: Iterable[Node], sufficient: Iterable[Set[Node]]) -> 'Requirements':
+        '''Entry of the given requirements; as in the compiled index, requirements without an edge (see Graph.consistent) are included'''
+        necessary, sufficient = tuple(necessary), tuple(sufficient)
+        if not necessary and not sufficient: return _no_requirements
+        kinds = dict.fromkeys(necessary, NECESSARY)
+        for s in sufficient:
+            kind = SUFFICIENT if len(s) == 1 else JOINTLY_SUFFICIENT
+            for a in s: kinds[a] = kinds.get(a, 0) | kind
+        return cls(necessary, sufficient, kinds)
+
+_no_requirements = Requirements((), (), {})
+
+
+class Pruning(NamedTuple):
+    '''The attainability analysis of a graph version used by its scans (see Graph.prune_unattainable): the mask of attainable nodes over compiled ids
+        (None for non-compiled graphs), the unattainable node names and the requirement checks it assumed'''
+    version: int
+    attainable: Optional[np.ndarray]
+    unattainable: FrozenSet[Node]
+    check_necessity: bool
+    check_sufficiency: bool
+
+
+class ValidationReport(NamedTuple):
+    '''Findings of Graph.validate (which Graph.consistent turns into an assertion error and a warning):
+        - untyped: the checked nodes without a type attribute
+        - problematic_sufficiencies: the checked nodes with both sufficient neighbours and plain edges, as {node: dict(are_sufficient = ..., plain = [...])}
+        - checked: the number of nodes checked'''
+    untyped: Set[Node]
+    problematic_sufficiencies: Dict[Node, Dict[str, List]]
+    checked: int
+
+    @property
+    def ok(self) -> bool: return not self.untyped and not self.problematic_sufficiencies
+
+    def sufficiency_warning(self, max_listed = 100) -> str:
+        '''The text of the problematic sufficiencies warning, listing the first max_listed nodes (formatting them all being slow for large graphs)'''
+        listed = dict(islice(self.problematic_sufficiencies.items(), max_listed))
+        more = f'\n... and {more} more (see Graph.validate)' if (more := len(self.problematic_sufficiencies) - len(listed)) > 0 else ''
+        return (f'\n\nIMPORTANT:\n'
+                f'Some nodes in the graph (reported below) have both some neighbours which are sufficient for them and some with plain edges.\n'
+                f'If this is not intentional, be aware that strictly checking for sufficiency may lead to situations in which these nodes '
+                f'will be discarded if no sufficient set of neighbours is in state EVEN if all plain ones are.\n\n'
+                f'The perhaps problematic nodes are:\n{pformat(listed)}{more}\n\n'
+                f'Possible actions to take include:\n '
+                f'\t- carefully checking that the plain edges in the above are fine as they are (i.e. that they are not undeclared sufficient or jointly-sufficient ones) and correct them otherwise\n'
+                f'\t- carefully checking that this is not a problem for the given use case (perhaps by changing some Scanner parameter, e.g. check_only_state_types)\n'
+                f'Once things are deemed to be fine, this warning may be suppressed by setting warn_about_problematic_sufficiencies to False on Graph declaration '
+                f'(and, if desired, on independent calls to the .consistent method).\n')
 
 
 class Graph:
-    def __init__(self, G: Union[nx.Graph, TypedAdjacencies], type_attr: NodeType = 'node_type', warn_about_problematic_sufficiencies = True):
+    frozen = False # Set by freeze
+    pruning = None # Set by prune_unattainable
+    _colour_history = () # The (types, custom_cols) pairs of _set_colours calls yet to be applied to the colour map
+
+    def __init__(self, G: Union[nx.Graph, TypedAdjacencies], type_attr: NodeType = 'node_type', warn_about_problematic_sufficiencies = True, compiled = False):
         '''Note: the constructor accepts either a Networkx Graph or a Dict[NodeType, Dict[Node, List[Node]]] (aliased to TypedAdjacencies internally).
-        Calling the constructor with the latter is equivalent to Graph(Graph.read_typed_adjacency_list(TypedAdjacencies_OBJECT, type_attr), type_attr)'''
+        Calling the constructor with the latter is equivalent to Graph(Graph.read_typed_adjacency_list(TypedAdjacencies_OBJECT, type_attr), type_attr)
+        Setting compiled to True makes the graph also keep a frozen array form of itself (a CompiledGraph, rebuilt on every _set_graph),
+            against which all filters and the provided Scanners then run; the networkx G remains available for plotting and extension
+        Note: the version attribute is a token unique to the current content of the graph across all graphs of the process: it is renewed by
+            _set_graph, compile and extend_with (whose result is a new graph), and by mark_changed, which should be called after modifying G in place'''
         self.type_attr = type_attr
-        self.default_cols = None
-        self.colour_map = None
+        self._default_cols, self._colour_map = None, None
+        self.use_compiled = compiled
+        self.compiled = None
 
         if not isinstance(G, nx.Graph): G = Graph.read_typed_adjacency_list(G, self.type_attr)
         self._set_graph(G, warn_about_problematic_sufficiencies)
@@ -34,33 +160,148 @@ class Graph:
 
     def _set_graph(self, G: nx.Graph, warn_about_problematic_sufficiencies = True):
         self.G = G
+        self.version = next(_versions)
+        self.requirements = NodeIndex(self._node_requirements)
         self.consistent(warn_about_problematic_sufficiencies)
 
         self.nodes_to_types = self._get_nodes_to_types()
         self.types = sorted(list(set(nx.get_node_attributes(self.G, self.type_attr).values())))
+        self.compiled = CompiledGraph.from_networkx(self.G, self.type_attr) if self.use_compiled else None
+        self.neighbours_by_type = None if self.use_compiled else NodeIndex(self._neighbour_groups)
 
         self._set_colours()
         return self
 
+    @classmethod
+    def from_compiled(cls, compiled: CompiledGraph, type_attr: NodeType = 'node_type', colour_map: Dict[NodeType, str] = None, default_cols: List[str] = None):
+        '''Graph (with compiled = True) built directly from a compiled form, e.g. one loaded by CompiledGraph.load in a worker process;
+            its networkx G is only rebuilt from the compiled form if accessed (e.g. by plotting, extension or user-defined Scanners and Updaters)'''
+        res = cls.__new__(cls)
+        res.type_attr, res._default_cols, res._colour_map, res.use_compiled, res.compiled, res._G = type_attr, default_cols, colour_map, True, compiled, None
+        res.neighbours_by_type = None
+        res.version = next(_versions)
+        res.requirements = NodeIndex(res._compiled_requirements)
+        res.nodes_to_types = dict(zip(compiled.nodes, [compiled.types[t] for t in compiled.type_codes.tolist()]))
+        res.types = list(compiled.types)
+        return res._set_colours()
+
+    def save(self, path: str):
+        '''Write this graph (node names, types, adjacencies, necessity/sufficiency and colours) to a single file of flat arrays; see load.
+            Note: other node attributes and edge attributes are not saved (a warning is issued if any are present)'''
+        if extra := {k for d in self.G._node.values() for k in d if k not in (self.type_attr, 'necessary', 'sufficient')}.union(k for nbrs in self.G._adj.values() for d in nbrs.values() for k in d):
+            warn(f'Graph.save does not store node attributes other than the type and necessity/sufficiency ones, nor edge attributes; these will be lost: {sorted(extra)}')
+        (self.compiled if self.compiled is not None else CompiledGraph.from_networkx(self.G, self.type_attr)).save(path,
+            dict(type_attr = self.type_attr, colour_map = self._colour_map, default_cols = self._default_cols, colour_history = self._colour_history))
+        return self
+
+    @classmethod
+    def load(cls, path: str, mmap = True):
+        '''Read a graph written by save, without re-validation; the result is compiled (on memory-mapped arrays if mmap is True)
+            and its networkx G is only rebuilt if accessed (see from_compiled)'''
+        compiled, metadata = CompiledGraph.load(path, mmap)
+        res = cls.from_compiled(compiled, metadata['type_attr'], metadata['colour_map'], metadata['default_cols'])
+        if history := metadata.get('colour_history'): res._colour_history = tuple((tuple(ts), cs) for ts, cs in history) + res._colour_history # Colours not computed before saving
+        return res
+
+    @property
+    def G(self) -> nx.Graph:
+        if self._G is None: # Only for graphs created by from_compiled
+            with _lazy_lock:
+                if self._G is None:
+                    G = self.compiled.to_networkx(self.type_attr)
+                    self.__dict__['_G'] = nx.freeze(G) if self.frozen else G
+        return self._G
+
+    @G.setter
+    def G(self, G: nx.Graph): self._G = G
+
+    def compile(self):
+        '''Switch to (and build) the compiled array form of this graph; see the constructor's compiled argument'''
+        self.use_compiled = True
+        self.compiled = CompiledGraph.from_networkx(self.G, self.type_attr)
+        self.neighbours_by_type = None # Superseded by the compiled form
+        self.version = next(_versions)
+        return self
+
+    def freeze(self):
+        '''Make this graph read-only, so that any number of threads and GSMs can scan it concurrently without copies or locks:
+            setting its attributes (hence also _set_graph, compile, mark_changed and _set_colours) raises a TypeError, its networkx G is frozen
+            (see nx.freeze; its modification methods raise a NetworkXError) and its compiled arrays, if any, are made read-only.
+            Non-mutating methods (scans, filters, plotting, save and extend_with, whose result is a new, modifiable graph) work as usual;
+            use fork for a modifiable copy, e.g. in an Updater which changes the graph by graph = graph.fork() if graph.frozen else graph'''
+        if self._G is not None: nx.freeze(self._G)
+        if self.compiled is not None:
+            for a in [self.compiled.node_array] + [getattr(self.compiled, name) for name in CompiledGraph.array_names]: a.flags.writeable = False
+        self.__dict__['frozen'] = True
+        return self
+
+    def fork(self) -> 'Graph':
+        '''Modifiable copy of this (typically frozen) graph with the same version: its G is a copy (made lazily if this graph's G is,
+            i.e. for graphs created by from_compiled), while its read-only compiled form is shared until the fork is changed by _set_graph or compile.
+            Note: additions are cheaper through extend_with, which overlays rather than copies'''
+        res = copy(self)
+        vars(res).pop('frozen', None)
+        res.G = self._G.copy() if self._G is not None else None
+        res.nodes_to_types, res.types = dict(self.nodes_to_types), list(self.types)
+        res.requirements = NodeIndex(res._node_requirements if self._G is not None else res._compiled_requirements, self.requirements) # Reading the fork's own data
+        if self.neighbours_by_type is not None: res.neighbours_by_type = NodeIndex(res._neighbour_groups, self.neighbours_by_type)
+        res._colour_map, res._default_cols = dict(self._colour_map) if self._colour_map is not None else None, list(self._default_cols) if self._default_cols is not None else None
+        return res
+
+    def __setattr__(self, name: str, value):
+        if self.frozen: raise TypeError(f"Cannot set the '{name}' attribute of a frozen Graph; use fork() for a modifiable copy")
+        super().__setattr__(name, value)
+
+    def mark_changed(self):
+        '''Give this graph a new version token (see version), e.g. after modifying node or edge attributes of its G in place,
+            so that cached scan results for the previous version (see ScanCache) are no longer used;
+            structural changes (nodes, edges, types or necessity/sufficiency) need _set_graph instead, which also refreshes nodes_to_types and the neighbour and requirement indices'''
+        self.version = next(_versions)
+        return self
+
     @staticmethod
     def read_typed_adjacency_list(tas: TypedAdjacencies, type_attr: NodeType = 'node_type') -> nx.Graph:
         assert all(isinstance(nt, NodeType) for nt in tas.keys())
         assert all(isinstance(n, Node) for nt in tas.keys() for n in tas[nt].keys())
+        return Graph.read_typed_adjacency_stream(((nt, start, many) for nt, one_to_many in tas.items() for start, many in one_to_many.items()), type_attr)
 
-        G = nx.Graph()
-        for nt, one_to_many in tas.items(): G.add_nodes_from(one_to_many.keys(), **{type_attr: nt}) # Separate loop because nodes need to exist before edges
-        for nt, one_to_many in tas.items(): # G.add_edges_from([(start, end) for start, many in one_to_many.items() for end in many])
-            for start, many in one_to_many.items():
-                # This is fine without edge existence checks because re-adding an edge with or without attributes only updates it constructively
-                if isinstance(many, list): G.add_edges_from([(start, end) for end in many])
-                else: # isinstance(one_to_many, dict)
-                    check_edge_dict_keys(many)
-                    G.add_edges_from([(start, end) for end in flatten([n_or_ns if isinstance(n_or_ns, list) else [n_or_ns] for n_or_ns in flatten(many.values())])])
-                    # No need to do anything with the 'plain' list below since its edges are already added above
-                    Graph._parse_necessity_sufficiency(G, start, many, 'are_necessary', 'necessary', False)
-                    Graph._parse_necessity_sufficiency(G, start, many, 'are_sufficient', 'sufficient', False)
-                    Graph._parse_necessity_sufficiency(G, start, many, 'necessary_for', 'necessary', True)
-                    Graph._parse_necessity_sufficiency(G, start, many, 'sufficient_for', 'sufficient', True)
+    @staticmethod
+    def read_typed_adjacency_stream(records: Iterable[Tuple[NodeType, Node, Adjacency]], type_attr: NodeType = 'node_type', chunk_size = 100000) -> nx.Graph:
+        '''Build a graph from (node type, node, adjacency) records, i.e. the flattened entries of a TypedAdjacencies (e.g. produced by a data pipeline),
+            with the same result, warnings and errors as read_typed_adjacency_list on the equivalent TypedAdjacencies.
+            Records are consumed in chunks, each adding its nodes in bulk; edges are kept as integer arrays (and necessity/sufficiency declarations as given)
+            until the end of the stream, since all nodes need to exist (in declaration order) before edges, and then added in a single bulk call.
+            Memory use is therefore bounded by the output graph rather than by the input'''
+        G, node_ids, names = nx.Graph(), {}, []
+        def node_id(n: Node) -> int:
+            if (i := node_ids.get(n)) is None:
+                i = node_ids[n] = len(names)
+                names.append(n)
+            return i
+
+        ok_keys, records = set(edge_dict_keys), iter(records)
+        starts, ends, declarations = [], [], [] # Chunks of edge end ids and (start, edge dict) pairs with necessity/sufficiency content
+        while chunk := list(islice(records, chunk_size)):
+            assert all(isinstance(nt, NodeType) and isinstance(start, Node) for nt, start, _ in chunk)
+            G.add_nodes_from((start, {type_attr: nt}) for nt, start, _ in chunk) # Nodes need to exist before edges
+            chunk_starts, chunk_ends = [], []
+            for _, start, many in chunk:
+                if isinstance(many, list): chunk_ends += map(node_id, many)
+                else: # isinstance(many, dict)
+                    if not ok_keys.issuperset(many): check_edge_dict_keys(many)
+                    chunk_ends += (node_id(e) for n_or_ns in chain.from_iterable(many.values()) for e in (n_or_ns if isinstance(n_or_ns, list) else [n_or_ns]))
+                    if ok_keys.difference(['plain']).intersection(many): declarations.append((start, many)) # No need to keep the 'plain' list since its edges are already recorded
+                chunk_starts += [node_id(start)] * (len(chunk_ends) - len(chunk_starts))
+            starts.append(np.array(chunk_starts, dtype = np.int64))
+            ends.append(np.array(chunk_ends, dtype = np.int64))
+
+        # This is fine without edge existence checks because re-adding an edge with or without attributes only updates it constructively
+        if starts: G.add_edges_from(zip(map(names.__getitem__, np.concatenate(starts).tolist()), map(names.__getitem__, np.concatenate(ends).tolist())))
+        for start, many in declarations:
+            Graph._parse_necessity_sufficiency(G, start, many, 'are_necessary', 'necessary', False)
+            Graph._parse_necessity_sufficiency(G, start, many, 'are_sufficient', 'sufficient', False)
+            Graph._parse_necessity_sufficiency(G, start, many, 'necessary_for', 'necessary', True)
+            Graph._parse_necessity_sufficiency(G, start, many, 'sufficient_for', 'sufficient', True)
         return G
 
     @staticmethod
@@ -92,42 +333,94 @@ class Graph:
                     else: G.nodes[side_to_set][attribute_name].append(value)
                 else: G.nodes[side_to_set][attribute_name] = [value]
 
-    def consistent(self, warn_about_problematic_sufficiencies = True):
+    def consistent(self, warn_about_problematic_sufficiencies = True, nodes: Iterable[Node] = None, extension: nx.Graph = None):
         '''This function does not check some obvious things which should come about automatically from read_typed_adjacency_list
         on Graph declaration but which could be ruined later by manually setting new node attributes.
         (Things like all nodes in necessity/sufficiency attributes actually having an edge to the given node
         or node pairs not having each other in the necessary attribute,
         which would make them unreachable by any step function making sensible use of this information but could be allowed by setting
-        read_typed_adjacency_list's allow_symmetric_necessity argument to True)'''
-        typed_ns = set(nx.get_node_attributes(self.G, self.type_attr).keys())
-        assert set(self.G.nodes) == typed_ns, f'Some nodes have no type: {set(self.G.nodes) - typed_ns}'
-        if warn_about_problematic_sufficiencies: self._check_problematic_sufficiencies()
+        read_typed_adjacency_list's allow_symmetric_necessity argument to True)
+        If nodes are given then only they are checked, and if an extension graph is given then only its nodes and their edges are (see validate)'''
+        report = self.validate(nodes, extension, warn_about_problematic_sufficiencies)
+        assert not report.untyped, f'Some nodes have no type: {report.untyped}'
+        if report.problematic_sufficiencies: warn(report.sufficiency_warning())
         return self
 
+    def validate(self, nodes: Iterable[Node] = None, extension: nx.Graph = None, check_sufficiencies = True) -> ValidationReport:
+        '''Single-pass check of all nodes (or only the given ones) for missing types and (if check_sufficiencies) problematic sufficiencies,
+            i.e. nodes with sufficient neighbours and also plain edges (edges carrying neither necessity nor sufficiency in either direction; see plain_edges).
+            Each edge is classified in constant time by the requirement index (see edge_kind).
+            If the (networkx) graph of an extension merged into this one is given (as by extend_with), validation is incremental: its nodes are checked,
+            and other nodes only if one of their edges to its nodes is plain (as only those edges may have changed)'''
+        G, type_attr, requirements = self.G, self.type_attr, self.requirements
+        if extension is not None:
+            to_check, added = list(extension._node), extension._node
+            if check_sufficiencies:
+                to_check += dict.fromkeys(b for n in added for b in G._adj[n] if b not in added and requirements[b].sufficient and not self.edge_kind(b, n))
+        else: to_check = G.nodes if nodes is None else list(nodes)
+        untyped = {n for n in to_check if type_attr not in G._node[n]}
+        if not check_sufficiencies: return ValidationReport(untyped, {}, len(to_check))
+
+        problematic = {c: dict(are_sufficient = list(sufficient), plain = plain) for c in to_check if (sufficient := requirements[c].sufficient)
+                       if (plain := self.plain_edges(c))}
+        return ValidationReport(untyped, problematic, len(to_check))
+
+    def _node_requirements(self, n: Node) -> Requirements:
+        '''The requirement attributes of the given node as its entry in the requirements index (see Requirements)'''
+        d = self.G._node[n]
+        return Requirements.of(d.get('necessary', ()), d.get('sufficient', ())) if 'necessary' in d or 'sufficient' in d else _no_requirements
+
+    def _compiled_requirements(self, n: Node) -> Requirements:
+        '''As _node_requirements, but read from the necessity/sufficiency index of the compiled form (for graphs created by from_compiled)'''
+        cg = self.compiled
+        i = cg.node_ids[n]
+        a, b = cg.suff_indptr[i:i + 2].tolist()
+        return Requirements.of(cg.names(cg.nec_indices[cg.nec_indptr[i]:cg.nec_indptr[i + 1]]),
+                               [set(cg.names(cg.set_indices[cg.set_indptr[j]:cg.set_indptr[j + 1]])) for j in range(a, b)])
+
     def _get_nodes_to_types(self) -> Dict[Node, NodeType]: return nx.get_node_attributes(self.G, self.type_attr)
 
+    def _neighbour_groups(self, n: Node) -> Dict[NodeType, List[Node]]:
+        '''Neighbours of the given node grouped by type (each group in adjacency order), i.e. its entry in the neighbours_by_type index
+            which relevant_neighbours uses on non-compiled graphs'''
+        ntt, groups = self.nodes_to_types, {}
+        for m in self.G._adj[n]: groups.setdefault(ntt[m], []).append(m)
+        return groups
+
     def _set_colours(self, custom_cols = None):
-        xkcd_palette = ['xkcd:green', 'xkcd:blue', 'xkcd:purple', 'xkcd:red', 'xkcd:orange', 'xkcd:yellow', 'xkcd:lime', 'xkcd:teal', 'xkcd:azure']
-        # ms_office_dark_theme_palette = {'Green': '#81BB42', 'Blue': '#4A9BDC', 'Red': '#DF2E28', 'Orange': '#FE801A', 'Yellow': '#E9BF35', 'Cyan': '#32C7A9', 'Dark Orange': '#D15E01'}.values()
-        xkcd_palette = xkcd_palette + diff(mcolors.XKCD_COLORS.keys(), xkcd_palette)
-        # Removing some colours which are very similar to the hardcoded first few
-        xkcd_palette = diff(xkcd_palette, ['xkcd:dark grass green', 'xkcd:dark pastel green', 'xkcd:fresh green', 'xkcd:electric lime', 'xkcd:light eggplant'])
-
-        if self.colour_map:
-            if set(self.colour_map.keys()) != set(self.types): # Nothing to change if equal
-                new_types = diff(self.types, self.colour_map.keys())
-                new_cols = diff(self.default_cols, self.colour_map.values())
-                new_map = dict(zip(new_types, new_cols))
-                # The following two are defined so as to look as though they were defined directly and not from an extension
-                self.colour_map = {t: self.colour_map[t] if t in self.colour_map else new_map[t] for t in self.types}
-                self.default_cols = list(self.colour_map.values()) + diff(self.default_cols, self.colour_map.values())
-        else:
-            if custom_cols: self.default_cols = custom_cols + diff(xkcd_palette, custom_cols)
-            elif self.default_cols: self.default_cols = self.default_cols + diff(xkcd_palette, self.default_cols)
-            else: self.default_cols = xkcd_palette
-            self.colour_map = dict(zip(self.types, self.default_cols))
+        '''Assign colours to any new types; this is deferred to the first access of colour_map or default_cols (e.g. by plotting)
+            unless a colour map is already present, so that scanning-only uses never load matplotlib'''
+        if self._colour_map and not self._colour_history: self._colour_map, self._default_cols = _coloured(self.types, self._colour_map, self._default_cols, custom_cols)
+        else: self._colour_history += ((tuple(self.types), custom_cols),)
         return self
 
+    def _resolve_colours(self):
+        with _lazy_lock:
+            if history := self._colour_history: # Written through __dict__ so that this also works on frozen graphs
+                colour_map, default_cols = self._colour_map, self._default_cols
+                for types, custom_cols in history: colour_map, default_cols = _coloured(list(types), colour_map, default_cols, custom_cols)
+                self.__dict__.update(_colour_map = colour_map, _default_cols = default_cols, _colour_history = ())
+
+    @property
+    def colour_map(self) -> Dict[NodeType, str]:
+        if self._colour_history: self._resolve_colours()
+        return self._colour_map
+
+    @colour_map.setter
+    def colour_map(self, colour_map: Dict[NodeType, str]):
+        self._resolve_colours()
+        self._colour_map = colour_map
+
+    @property
+    def default_cols(self) -> List[str]:
+        if self._colour_history: self._resolve_colours()
+        return self._default_cols
+
+    @default_cols.setter
+    def default_cols(self, default_cols: List[str]):
+        self._resolve_colours()
+        self._default_cols = default_cols
+
 
     # Core functionality methods
 
@@ -136,23 +429,72 @@ class Graph:
         return {nt: unsorted[nt] for nt in sorted(unsorted)}
 
     def extend_with(self, extension_graph, warn_about_problematic_sufficiencies = True):
-        '''Note: returns a new object; does not affect the original'''
-        res = deepcopy(self)
-        return res._set_graph(nx.compose(res.G, extension_graph.G),    warn_about_problematic_sufficiencies)
+        '''Note: returns a new object; does not affect the original.
+            The result is a copy-on-write overlay of the extension on this graph, with node-level work only for the extension's nodes
+            (though the outer node and adjacency dicts, nodes_to_types and any untouched compiled rows are still copied in bulk, i.e. in time linear in this graph):
+                - nodes in the extension get copies of their attribute and adjacency dicts, merged as by nx.compose (extension attributes taking precedence),
+                    with new neighbours of existing nodes appended to their adjacencies
+                - all other nodes share their dicts with this graph, which should therefore not be modified in place afterwards;
+                    the result's G is a CopyOnWriteGraph, which copies shared dicts before changing them, so modifying the result never affects this graph
+                - only nodes in the extension (and their neighbours with new plain edges, for problematic sufficiencies) are re-validated
+                - the compiled form, if any, is extended by rebuilding only the rows of nodes in the extension'''
+        G, H = self.G, extension_graph.G
+        R = CopyOnWriteGraph.overlay(G)
+        R.graph.update(H.graph)
+        R._owned_nodes.update(H._node), R._owned_adjs.update(H._node) # Given their own dicts below
+        retyped = False
+        for n, d in H._node.items():
+            if n in R._node:
+                retyped |= self.type_attr in d and d[self.type_attr] != R._node[n].get(self.type_attr)
+                R._node[n], R._adj[n] = {**R._node[n], **d}, dict(R._adj[n])
+            else: R._node[n], R._adj[n] = dict(d), {}
+        for a, b, d in H.edges(data = True):
+            R._adj[a][b] = R._adj[b][a] = {**R._adj[a].get(b, {}), **d}
+            R._owned_edges.update(((a, b), (b, a)))
+
+        res = copy(self)
+        vars(res).pop('frozen', None)
+        res.G, res.version = R, next(_versions)
+        res.requirements = NodeIndex(res._node_requirements, self.requirements, H._node)
+        res.consistent(warn_about_problematic_sufficiencies, extension = H)
+        res.nodes_to_types = dict(self.nodes_to_types)
+        res.nodes_to_types.update((n, R._node[n][self.type_attr]) for n in H._node)
+        res.types = sorted(set(res.nodes_to_types.values())) if retyped else sorted(set(self.types).union(res.nodes_to_types[n] for n in H._node))
+        if self.use_compiled: res.compiled = self.compiled.extended(R, H._node, self.type_attr) if self.compiled is not None else CompiledGraph.from_networkx(R, self.type_attr)
+        else: # Retyped nodes also move between the groups of their neighbours
+            res.neighbours_by_type = NodeIndex(res._neighbour_groups, self.neighbours_by_type, set(chain(H._node, *(R._adj[n] for n in H._node))) if retyped else H._node)
+        return res._set_colours()
 
 
     # Utility methods
 
-    def type_set(self, nodes: List[Node]) -> Set[NodeType]: return set(itemgetter(*nodes)(self.nodes_to_types))
+    def type_set(self, nodes: List[Node]) -> Set[NodeType]: return {self.nodes_to_types[n] for n in nodes}
 
     def relevant_neighbours(self, nodes: List[Node], good_types: List[NodeType] = None, bad_types: List[NodeType] = None) -> List[List[Node]]:
         '''Return neighbours of state nodes of the specified types or all types if none specified'''
-        return [self.type_filter(self.G.neighbors(sn), good_types, bad_types) for sn in nodes]
+        if (cg := self.compiled) is not None: return cg.split_names(*cg.neighbours(cg.ids(nodes), cg.type_mask(good_types, bad_types)))
+        if (good := self._good_types(good_types, bad_types)) is None: return [list(self.G._adj[sn]) for sn in nodes]
+        res = []
+        for sn in nodes: # Prebuilt slices of the per-type index, unless several types contribute (whose neighbours are then kept in adjacency order)
+            groups = self.neighbours_by_type[sn]
+            selected = [ns for t, ns in groups.items() if t in good]
+            res.append(list(selected[0]) if len(selected) == 1 else [] if not selected else list(self.G._adj[sn]) if len(selected) == len(groups) else
+                       [m for m in self.G._adj[sn] if self.nodes_to_types[m] in good])
+        return res
 
     def type_filter(self, nodes: List[Node] = None, good_types: List[NodeType] = None, bad_types: List[NodeType] = None) -> List[Node]:
         '''Keep nodes of good_types and discard those of bad_types'''
-        good_types = set(good_types if good_types else self.types).difference(bad_types if bad_types else [])
-        return [n for n in (nodes if nodes else self.G.nodes) if self.G.nodes[n][self.type_attr] in good_types]
+        if (cg := self.compiled) is not None:
+            ids = cg.ids(nodes) if nodes else np.arange(len(cg.nodes))
+            return cg.names(ids[cg.type_mask(good_types, bad_types)[cg.type_codes[ids]]])
+        nodes = nodes if nodes else self.G.nodes
+        if (good := self._good_types(good_types, bad_types)) is None: return list(nodes)
+        return [n for n in nodes if self.nodes_to_types[n] in good]
+
+    def _good_types(self, good_types: List[NodeType] = None, bad_types: List[NodeType] = None) -> Optional[Set[NodeType]]:
+        '''Set of the types selected by good_types and bad_types as in type_filter, or None if all of them are'''
+        if not good_types and not bad_types: return None
+        return set(good_types if good_types else self.types).difference(bad_types if bad_types else [])
 
     def necessity_sufficiency_filter(self, list_state: List[Node], candidates: List[Node],
                                      check_necessity = True, check_sufficiency = True,
@@ -165,31 +507,84 @@ class Graph:
             warn('Called necessity_sufficiency_filter with both check_necessity and check_sufficiency False; candidates passed through unaffected')
             return candidates
 
-        state_types = self.type_set(list_state) # Otherwise recomputed for every candidate
-        return [c for c in candidates # Assignments in a single tuple below so that it evaluates to True
-                if (necessary := self.G.nodes[c].get('necessary'), sufficient := self.G.nodes[c].get('sufficient'))
-                if not check_necessity   or not necessary  or     all(n in list_state or (check_only_state_types and self.nodes_to_types[n] not in state_types) for n in necessary)
-                if not check_sufficiency or not sufficient or any(all(n in list_state or (check_only_state_types and self.nodes_to_types[n] not in state_types) for n in ns) for ns in sufficient)]
+        if (cg := self.compiled) is not None: # Precomputed index evaluated against a state bitset
+            candidate_ids = self.attainable_candidates(list_state, cg.ids(candidates), check_necessity, check_sufficiency, check_only_state_types)
+            return cg.names(candidate_ids[cg.necessity_sufficiency_mask(cg.ids(list_state), candidate_ids, check_necessity, check_sufficiency, check_only_state_types)])
+
+        if (p := self._pruning(check_necessity, check_sufficiency, check_only_state_types)) is not None and p.unattainable.isdisjoint(list_state):
+            candidates = [c for c in candidates if c not in p.unattainable]
+        state_types, state_set = self.type_set(list_state), set(list_state) # Otherwise recomputed for every candidate
+        requirements = self.requirements
+        return [c for c in candidates if (r := requirements[c]) # Requirements entries are non-empty tuples, hence True
+                if not check_necessity   or not r.necessary  or     all(n in state_set or (check_only_state_types and self.nodes_to_types[n] not in state_types) for n in r.necessary)
+                if not check_sufficiency or not r.sufficient or any(all(n in state_set or (check_only_state_types and self.nodes_to_types[n] not in state_types) for n in ns) for ns in r.sufficient)]
 
     def plain_edges(self, n: Node) -> List[Node]:
         '''Returns the nodes with which the given node has edges carrying neither necessity nor sufficiency in either direction'''
-        own_non_plain = set(self.G.nodes[n].get('necessary', [])).union(flatten(self.G.nodes[n].get('sufficient', [])))
-        return [b for _, b in self.G.edges(n) if b not in own_non_plain
-            if n not in set(self.G.nodes[b].get('necessary', [])).union(flatten(self.G.nodes[b].get('sufficient', [])))]
-
-    def _check_problematic_sufficiencies(self):
-        if problematic := {c: dict(are_sufficient = sufficient, plain = plain) for c in self.G.nodes
-         if (sufficient := self.G.nodes[c].get('sufficient')) if (plain := self.plain_edges(c))}:
-            warn(f'\n\nIMPORTANT:\n'
-                 f'Some nodes in the graph (reported below) have both some neighbours which are sufficient for them and some with plain edges.\n'
-                 f'If this is not intentional, be aware that strictly checking for sufficiency may lead to situations in which these nodes '
-                 f'will be discarded if no sufficient set of neighbours is in state EVEN if all plain ones are.\n\n'
-                 f'The perhaps problematic nodes are:\n{pformat(problematic)}\n\n'
-                 f'Possible actions to take include:\n '
-                 f'\t- carefully checking that the plain edges in the above are fine as they are (i.e. that they are not undeclared sufficient or jointly-sufficient ones) and correct them otherwise\n'
-                 f'\t- carefully checking that this is not a problem for the given use case (perhaps by changing some Scanner parameter, e.g. check_only_state_types)\n'
-                 f'Once things are deemed to be fine, this warning may be suppressed by setting warn_about_problematic_sufficiencies to False on Graph declaration '
-                 f'(and, if desired, on independent calls to the .consistent method).\n')
+        requirements = self.requirements
+        kinds = requirements[n].kinds
+        return [b for b in self.G._adj[n] if b not in kinds and n not in requirements[b].kinds]
+
+    def edge_kind(self, a: Node, b: Node) -> int:
+        '''Kind flags of the edge between a and b from the point of view of a, combining NECESSARY, SUFFICIENT and JOINTLY_SUFFICIENT (b being so for a)
+            and REQUIRED_BY (a being any of them for b), as importable from Graph_State_Machine.graph; 0 for plain edges (and non-edges).
+            This is a constant-time lookup of both nodes' entries in the requirements index (see Requirements), which is built lazily per node
+            (from the node's attributes, or from the compiled form for graphs created by from_compiled) and shared with extensions for untouched nodes'''
+        requirements = self.requirements
+        return requirements[a].kinds.get(b, 0) | (REQUIRED_BY if a in requirements[b].kinds else 0)
+
+    # Reachability methods
+
+    def _analysed(self) -> CompiledGraph: return self.compiled if self.compiled is not None else CompiledGraph.from_networkx(self.G, self.type_attr)
+
+    def attainable(self, start_types: List[NodeType] = None, start_nodes: List[Node] = None, check_necessity = True, check_sufficiency = True) -> List[Node]:
+        '''Nodes which can be in a state grown by steps (of Scanners checking the given requirements, without check_only_state_types) from states of
+            nodes of the start_types and the start_nodes, i.e. the start nodes and, recursively, the neighbours of attainable nodes whose necessary nodes and
+            some sufficient set are attainable; if neither is given, the start nodes are those without requirements.
+            The complement (see unattainable) includes nodes in requirement cycles (e.g. mutually necessary through intermediate nodes) and chains depending on them.
+            Linear in the graph size; on non-compiled graphs a temporary compiled form is built (compile the graph for repeated analyses)'''
+        cg = self._analysed()
+        return cg.names(np.flatnonzero(self._attainable_mask(cg, start_types, start_nodes, check_necessity, check_sufficiency)))
+
+    def unattainable(self, start_types: List[NodeType] = None, start_nodes: List[Node] = None, check_necessity = True, check_sufficiency = True) -> List[Node]:
+        '''The nodes not in attainable (with the same arguments), i.e. dead ones'''
+        cg = self._analysed()
+        return cg.names(np.flatnonzero(~self._attainable_mask(cg, start_types, start_nodes, check_necessity, check_sufficiency)))
+
+    @staticmethod
+    def _attainable_mask(cg: CompiledGraph, start_types: List[NodeType], start_nodes: List[Node], check_necessity: bool, check_sufficiency: bool) -> np.ndarray:
+        if start_types is None and start_nodes is None: start_ids = np.flatnonzero(cg.requirement_free_mask(check_necessity, check_sufficiency))
+        else: start_ids = np.concatenate([np.flatnonzero(cg.type_mask(start_types)[cg.type_codes]) if start_types else np.zeros(0, dtype = np.int64), cg.ids(start_nodes if start_nodes else [])])
+        return cg.attainable_mask(start_ids, check_necessity, check_sufficiency)
+
+    def prerequisites(self, nodes: List[Node], check_necessity = True, check_sufficiency = True) -> List[Node]:
+        '''The minimal prerequisite closure of the given nodes (in node order): the nodes which must be in any state they enter by steps
+            (of Scanners checking the given requirements), i.e. recursively their necessary nodes and the members common to all their sufficient sets;
+            a given node is only included if it is its own prerequisite, i.e. in a requirement cycle (hence only attainable by being a start node)'''
+        cg = self._analysed()
+        return cg.names(np.flatnonzero(cg.prerequisites_mask(cg.ids(nodes), check_necessity, check_sufficiency)))
+
+    def prune_unattainable(self, start_types: List[NodeType] = None, start_nodes: List[Node] = None, check_necessity = True, check_sufficiency = True):
+        '''Make scans skip the necessity/sufficiency checks of unattainable candidates (see attainable, whose arguments these are) by discarding them up front.
+            This never changes scan results: the pruning only applies to scans of states of attainable nodes which check (at least) the given requirements
+            without check_only_state_types (on which unattainable candidates would fail the checks anyway), and only to the current graph version
+            (i.e. it lapses on _set_graph, compile, mark_changed and in extend_with results, which may be pruned again). Call it before freeze'''
+        cg = self._analysed()
+        mask = self._attainable_mask(cg, start_types, start_nodes, check_necessity, check_sufficiency)
+        self.pruning = Pruning(self.version, mask if self.compiled is not None else None, frozenset(cg.names(np.flatnonzero(~mask))), check_necessity, check_sufficiency)
+        return self
+
+    def _pruning(self, check_necessity: bool, check_sufficiency: bool, check_only_state_types: bool) -> Optional[Pruning]:
+        '''The prune_unattainable analysis if it applies to scans with the given arguments'''
+        if (p := self.pruning) is not None and p.unattainable and p.version == self.version and not check_only_state_types and \
+            check_necessity >= p.check_necessity and check_sufficiency >= p.check_sufficiency: return p
+        return None
+
+    def attainable_candidates(self, list_state: List[Node], candidate_ids: np.ndarray, check_necessity = True, check_sufficiency = True, check_only_state_types = False) -> np.ndarray:
+        '''The given compiled candidate ids without the unattainable ones if the prune_unattainable analysis applies (i.e. if all state nodes are attainable)'''
+        if (p := self._pruning(check_necessity, check_sufficiency, check_only_state_types)) is not None and p.attainable is not None and p.attainable[self.compiled.ids(list_state)].all():
+            return candidate_ids[p.attainable[candidate_ids]]
+        return candidate_ids
 
 
     # Plotting methods
@@ -201,66 +596,106 @@ class Graph:
             return cols, outs
         else: return cols, cols
 
+    def get_layout(self, layout: Callable[[Any], Dict[Any, Iterable[float]]] = nx.kamada_kawai_layout, layout_args: Dict[str, Any] = {}) -> Dict[Node, Iterable[float]]:
+        '''Node coordinates by the given layout function and arguments, cached on the version token of the graph for the 16 most recently used combinations
+            since layouts such as the default Kamada-Kawai one are quadratic in the number of nodes; randomised layouts are therefore also stable across plots'''
+        try: hash(key := (self.version, layout, frozen(layout_args)))
+        except TypeError: return layout(self.G, **layout_args) # Arguments which cannot be keyed are not cached
+        with _layouts_lock:
+            if (res := _layouts.get(key)) is not None:
+                _layouts.move_to_end(key)
+                return dict(res)
+        res = layout(self.G, **layout_args) # Outside the lock, so that concurrent layouts do not wait for each other
+        with _layouts_lock:
+            _layouts[key] = res
+            while len(_layouts) > _layouts_maxsize: _layouts.popitem(last = False)
+        return dict(res)
+
     def plot(self, nodes_with_outline: List[Node] = None,
              show_necessity = True, show_sufficiency = True,
              layout: Callable[[Any], Dict[Any, Iterable[float]]] = nx.kamada_kawai_layout, layout_args: Dict[str, Any] = {},
-             plotly = True, radial_labels = False, networkx_plot_args: Dict[str, Any] = {}):
+             plotly = True, radial_labels = False, networkx_plot_args: Dict[str, Any] = {},
+             large = False, base_figure = None, path: str = None, show: bool = None):
         '''Plots the GSM graph either through plotly or networkx.
-            - layout and layout_args are always used
+            - layout and layout_args are always used, the coordinates being cached (see get_layout)
             - networkx_plot_args is only used if plotly is False; reference for its content: https://networkx.org/documentation/stable/reference/generated/networkx.drawing.nx_pylab.draw_networkx.html .
-            - radial_labels is only used if plotly is True, and is intended for use with the nx.shell_layout layout'''
-        coords = layout(self.G, **layout_args)
-        digraphs = self._get_nec_suff_arrows()
+            - radial_labels is only used if plotly is True (and large is False), and is intended for use with the nx.shell_layout layout
+            - large switches to a mode for graphs of thousands of nodes: with plotly, all traces are WebGL ones (Scattergl), node labels are trace text
+                and necessity/sufficiency edges are one line trace per kind (direction shown by a marker near each target) instead of one annotation each;
+                with networkx, edges (including necessity/sufficiency ones, then without arrowheads) are drawn as line collections instead of one arrow patch each
+            - base_figure is a plotly figure previously returned by this method for this graph: only its 'Node in State' trace is updated
+                (in place) to nodes_with_outline and it is returned, avoiding rebuilding the rest
+            - path is a file to export the figure to: HTML or, through kaleido, an image format by its extension for plotly, any format supported by savefig otherwise
+            - show is whether to display the figure (by fig.show or plt.show); by default only if no path is given'''
+        coords = self.get_layout(layout, layout_args)
+        show = path is None if show is None else show
 
         if plotly:
+            import plotly.graph_objects as go
+            import matplotlib.colors as mcolors
+            Scatter = go.Scattergl if large else go.Scatter
+
+            if base_figure is not None:
+                outline = self._outline_trace(Scatter, nodes_with_outline, coords)
+                if (outlines := [t for t in base_figure.data if t.name == 'Node in State']): outlines[0].update(x = outline.x, y = outline.y)
+                else: base_figure.add_trace(outline)
+                return self._output_figure(base_figure, path, show)
+
+            digraphs = self._get_nec_suff_arrows()
+            shown_kinds = [(attr, label, colour, width) for attr, label, colour, width in [('necessary', 'Necessary', 'tomato', 2.5), ('sufficient', 'Sufficient', 'royalblue', 1.5), ('jointly_sufficient', 'Jointly Sufficient', '#839deb', 1.5)]
+                           if (show_necessity or attr != 'necessary') and (show_sufficiency or attr != 'sufficient')]
+
             # Necessity & sufficiency arrows (added to fig itself later, but prepared here for tidiness)
             arrows = []
-            for attr, colour, width, shorter in [('necessary', 'tomato', 2.5, 0.02), ('sufficient', 'royalblue', 1.5, 0.01), ('jointly_sufficient', '#839deb', 1.5, 0.01)]:
-                if not show_necessity   and attr == 'necessary':  continue
-                if not show_sufficiency and attr == 'sufficient': continue
-                for a, b in digraphs[attr]:
-                    ax, ay, bx, by = coords[a][0], coords[a][1], coords[b][0], coords[b][1]
-                    # Would use the below arrow shortening in order not to cross nodes' boundaries, but plotly scales the coordinates
-                    #   to match the window shape, therefore any in-coordinates shift becomes disproportionate;
-                    #   would need absolute coordinates (like those determining the node size from a parameter)
-                    # angle = np.arctan2([by - ay], [bx - ax])[0]
-                    # ax += shorter * np.cos(angle)
-                    # bx -= shorter * np.cos(angle)
-                    # ay += shorter * np.sin(angle)
-                    # by -= shorter * np.sin(angle)
-                    arrows.append(go.layout.Annotation(dict(
-                        x = bx, y = by, ax = ax, ay = ay,
-                        xref = 'x', yref = 'y', axref = 'x', ayref = 'y', text = '',
-                        showarrow = True, arrowhead = 3, arrowwidth = width, arrowsize = 1, arrowcolor = colour) ) )
+            if not large:
+                for attr, _, colour, width in shown_kinds:
+                    for a, b in digraphs[attr]:
+                        ax, ay, bx, by = coords[a][0], coords[a][1], coords[b][0], coords[b][1]
+                        # Would use the below arrow shortening in order not to cross nodes' boundaries, but plotly scales the coordinates
+                        #   to match the window shape, therefore any in-coordinates shift becomes disproportionate;
+                        #   would need absolute coordinates (like those determining the node size from a parameter)
+                        # angle = np.arctan2([by - ay], [bx - ax])[0]
+                        # ax += shorter * np.cos(angle)
+                        # bx -= shorter * np.cos(angle)
+                        # ay += shorter * np.sin(angle)
+                        # by -= shorter * np.sin(angle)
+                        arrows.append(go.layout.Annotation(dict(
+                            x = bx, y = by, ax = ax, ay = ay,
+                            xref = 'x', yref = 'y', axref = 'x', ayref = 'y', text = '',
+                            showarrow = True, arrowhead = 3, arrowwidth = width, arrowsize = 1, arrowcolor = colour) ) )
 
             # All edges
-            edge_x, edge_y = map(lambda xs: intersperse_val(xs, None, 2, append = True), zip(*flatten([(coords[a], coords[b]) for a, b in self.G.edges()])))
-            traces = [go.Scatter(x = edge_x, y = edge_y, showlegend = True, name = 'Plain Edges' if any(digraphs.values()) and (show_necessity or show_sufficiency) else 'Edges',
+            if large: edge_x, edge_y = _segments(coords, self.G.edges())
+            else: edge_x, edge_y = map(lambda xs: intersperse_val(xs, None, 2, append = True), zip(*flatten([(coords[a], coords[b]) for a, b in self.G.edges()])))
+            traces = [Scatter(x = edge_x, y = edge_y, showlegend = True, name = 'Plain Edges' if any(digraphs.values()) and (show_necessity or show_sufficiency) else 'Edges',
                 line = dict(width = 0.5, color = '#606060'), hoverinfo = 'none', mode = 'lines')]
 
-            # 0-length edges to generate legend entries for the necessity/sufficiency ones
-            for attr, label, colour in [('necessary', 'Necessary', 'tomato'), ('sufficient', 'Sufficient', 'royalblue'), ('jointly_sufficient', 'Jointly Sufficient', '#839deb')]:
-                if not digraphs[attr]: continue
-                traces.append(go.Scatter(x = [0], y = [0], mode = 'lines', showlegend = True, name = label, marker = dict(color = colour)))
+            if large: # One line trace per kind of necessity/sufficiency edge, with a marker towards each target in place of the arrowhead
+                for attr, label, colour, width in shown_kinds:
+                    if not digraphs[attr]: continue
+                    line_x, line_y = _segments(coords, digraphs[attr])
+                    heads = np.array([coords[a] for a, _ in digraphs[attr]], dtype = float) * 0.15 + np.array([coords[b] for _, b in digraphs[attr]], dtype = float) * 0.85
+                    traces.append(Scatter(x = line_x, y = line_y, mode = 'lines', showlegend = True, name = label, legendgroup = label,
+                        line = dict(width = width, color = colour), hoverinfo = 'none'))
+                    traces.append(Scatter(x = heads[:, 0], y = heads[:, 1], mode = 'markers', showlegend = False, name = label, legendgroup = label,
+                        marker = dict(size = 3 * width + 2, color = colour), hoverinfo = 'none'))
+            else: # 0-length edges to generate legend entries for the necessity/sufficiency ones
+                for attr, label, colour in [('necessary', 'Necessary', 'tomato'), ('sufficient', 'Sufficient', 'royalblue'), ('jointly_sufficient', 'Jointly Sufficient', '#839deb')]:
+                    if not digraphs[attr]: continue
+                    traces.append(go.Scatter(x = [0], y = [0], mode = 'lines', showlegend = True, name = label, marker = dict(color = colour)))
 
             # Nodes by type
             for node_type, nodes in self.group_nodes().items():
                 node_x, node_y = map(list, zip(*[coords[n] for n in nodes]))
-                traces.append(go.Scatter(x = node_x, y = node_y,
-                    name = node_type, mode = 'markers', hoverinfo = 'text', showlegend = True, # labels are annotations later, so no '+text' in mode
+                traces.append(Scatter(x = node_x, y = node_y,
+                    name = node_type, mode = 'markers+text' if large else 'markers', hoverinfo = 'text', showlegend = True, # labels are annotations later unless large, so no '+text' in mode
                     text = nodes, textposition = 'bottom center', # textfont = dict(size = 12, color = 'black'),
                     #legendgroup = 'Node Types', legendgrouptitle_text = 'Node Types',
                     marker = dict(showscale = False, size = 17, color = (col := mcolors.XKCD_COLORS[self.colour_map[node_type]]),
                                   line = dict(color = col, width = 2)) ))
 
             # Nodes in State
-            if nodes_with_outline:
-                node_x, node_y = map(list, zip(*[coords[n] for n in nodes_with_outline]))
-                traces.append(go.Scatter(x = node_x, y = node_y,
-                    name = 'Node in State', mode = 'markers', showlegend = True,
-                    #legendgroup = 'State', legendgrouptitle_text = 'State',
-                    marker = dict(showscale = False, size = 17, color = 'rgba(0,0,0,0)',
-                                  line = dict(color = 'black', width = 3)) ))
+            if nodes_with_outline or large: traces.append(self._outline_trace(Scatter, nodes_with_outline, coords)) # Always present in large figures, for base_figure reuse
 
             # All together
             fig = go.Figure(data = traces, layout = go.Layout(
@@ -273,7 +708,8 @@ class Graph:
             fig.update_layout(annotations = arrows) # necessity & sufficiency if present
 
             # Labels (separate and as annotations in order to, respectively, write over nodes and control the angle)
-            if radial_labels:
+            if large: pass # Already trace text
+            elif radial_labels:
                 for node in self.G.nodes:
                     fig.add_annotation(x = coords[node][0], y = coords[node][1], showarrow = False,
                         text = node, font = dict(size = 12, color = 'black'),
@@ -288,12 +724,13 @@ class Graph:
             # Centre legend (only useful for shell layout)
             # fig.update_layout(legend = dict(x = 0.45, y = 0.55, bgcolor = 'rgba(0,0,0,0)'))
 
-            fig.show()
-            return fig
+            return self._output_figure(fig, path, show)
         else:
+            import matplotlib.pyplot as plt
+            digraphs = self._get_nec_suff_arrows()
             node_cols, node_out_cols = self.get_node_colours(nodes_with_outline)
             # nx.draw also takes the arguments of nx.draw_networkx
-            plot_args = dict(arrows = True, with_labels = True,
+            plot_args = dict(arrows = not large, with_labels = True,
                 node_color = node_cols, edgecolors = node_out_cols, linewidths = 3,
                 font_size = 10, node_size = 500, edge_color = (0.2, 0.2, 0.2, 0.7))
             plot_args = {k: networkx_plot_args[k] if k in networkx_plot_args else v for k, v in plot_args.items()}
@@ -304,22 +741,39 @@ class Graph:
                 if not show_necessity   and attr == 'necessary':  continue
                 if not show_sufficiency and attr == 'sufficient': continue
                 nx.draw_networkx_edges(nx.DiGraph(digraphs[attr]), coords,# This restriction is redundant: {k: v for k, v in coords.items() if k in dg.nodes()},
-                   edge_color = colour, arrows = True, width = width, style = style, arrowsize = arrowsize, arrowstyle = '-|>') # https://matplotlib.org/stable/api/_as_gen/matplotlib.patches.ArrowStyle.html#matplotlib.patches.ArrowStyle
+                   edge_color = colour, arrows = not large, width = width, style = style, **({} if large else dict(arrowsize = arrowsize, arrowstyle = '-|>'))) # https://matplotlib.org/stable/api/_as_gen/matplotlib.patches.ArrowStyle.html#matplotlib.patches.ArrowStyle
 
             # The following is a networkx-matplotlib hack to print a colour legend: use empty scatter plots
             for t, c in self.colour_map.items(): plt.scatter([], [], c = [c], label = t)
-            plt.legend()
-            plt.show()
+            plt.legend(loc = 'upper right' if large else 'best') # 'best' searches over all drawn data
+            if path is not None: plt.savefig(path)
+            if show: plt.show()
+            elif path is not None: plt.close() # Exported only, e.g. headless
             return plt
 
+    def _outline_trace(self, scatter_class, nodes_with_outline: List[Node], coords: Dict[Node, Iterable[float]]):
+        node_x, node_y = map(list, zip(*[coords[n] for n in nodes_with_outline])) if nodes_with_outline else ([], [])
+        return scatter_class(x = node_x, y = node_y,
+            name = 'Node in State', mode = 'markers', showlegend = True,
+            #legendgroup = 'State', legendgrouptitle_text = 'State',
+            marker = dict(showscale = False, size = 17, color = 'rgba(0,0,0,0)',
+                          line = dict(color = 'black', width = 3)) )
+
+    @staticmethod
+    def _output_figure(fig, path: Optional[str], show: bool):
+        if path is not None:
+            if path.lower().endswith(('.html', '.htm')): fig.write_html(path)
+            else: fig.write_image(path) # Requires kaleido
+        if show: fig.show()
+        return fig
+
     def _get_nec_suff_arrows(self):
         digraphs = dict(necessary = [], sufficient = [], jointly_sufficient = [])
-        for b, d in self.G.nodes(data = True):
-            if 'necessary' in d: digraphs['necessary'] += [(a, b) for a in d['necessary']]
-            if 'sufficient' in d:
-                for a_or_as in d['sufficient']:
-                    if len(a_or_as) == 1: digraphs['sufficient'].append((list(a_or_as)[0], b))
-                    else: digraphs['jointly_sufficient'] += [(a, b) for a in a_or_as]
+        for b in self.G._node:
+            for a, k in self.requirements[b].kinds.items():
+                if k & NECESSARY: digraphs['necessary'].append((a, b))
+                if k & SUFFICIENT: digraphs['sufficient'].append((a, b))
+                if k & JOINTLY_SUFFICIENT: digraphs['jointly_sufficient'].append((a, b))
         return digraphs
 
 
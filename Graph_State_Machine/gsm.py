@@ -1,25 +1,42 @@
-from copy import deepcopy
-import warnings
+import asyncio
+from concurrent.futures import Executor
+from copy import copy, deepcopy
+from functools import partial
 import networkx as nx
-import matplotlib.pyplot as plt
 from inspect import signature
 
 from Graph_State_Machine.selectors import identity
 from Graph_State_Machine.scanners import by_score
 from Graph_State_Machine.updaters import list_accumulator, list_accumulator_greedy
+from Graph_State_Machine.incremental import IncrementalScan
+from Graph_State_Machine.log import GSMLog, LogRecord
+from Graph_State_Machine.cache import ScanCache
+from Graph_State_Machine.profiling import Profiler
 from Graph_State_Machine.types import *
-from Graph_State_Machine.Util.misc import expand_user_warning
+from Graph_State_Machine.outcomes import StepOutcome, warn_on_outcome
 
 
 class GSM:
     def __init__(self, graph: Graph, state: State = [],
                  node_scanner: Scanner = by_score(), state_updater: Updater = list_accumulator, selector = identity,
-                 greedy_state_updater: Updater = list_accumulator_greedy):
+                 greedy_state_updater: Updater = list_accumulator_greedy, incremental = False, log: GSMLog = None, scan_cache: ScanCache = None,
+                 profiler: Profiler = None, outcome_handler: Optional[Callable[[StepOutcome], Any]] = warn_on_outcome):
         '''Define a Graph State Machine by providing the starting graph and state and the two operation functions:
             - the scanner, which assigns scores to nodes of interest given the state nodes (e.g. their neighbours)
             - the updater, which updates the state based on the scanner's output; it can update the graph too (though it does not have to)
         Note: if the type of state is not a list of strings then a function to produce one from it (for the purposes of giving Scanners a list of nodes to scan) has to be provided as the selector argument
         Note: the default GSM scores nodes by state presence in target neighbours, has a simple list as state and a simple appender as its updater
+        Note: setting incremental to True makes scans on compiled graphs (see Graph's compiled argument) by Scanners accepting an 'incremental' argument (e.g. by_score)
+            reuse the previous scan's data and only process the newly added state nodes (with results identical to full scans)
+        Note: the log is a GSMLog of compact LogRecord-s (which read like dictionaries) keeping all records by default;
+            pass e.g. GSMLog('ring', 100) or GSMLog('off', sinks = [FileSink(path)]) as log to bound its memory
+        Note: passing a ScanCache (possibly shared with other GSMs) as scan_cache memoises scans by graph version, state nodes and scanner arguments;
+            updaters which modify the graph in place (rather than returning a new one) should call its mark_changed method
+        Note: passing a Profiler as profiler times the phases of steps ('gsm.selector', 'gsm.scan', 'gsm.log', 'gsm.updater' and 'gsm.outcome')
+            and is passed on to Scanners accepting a 'profiler' argument (e.g. by_score and neighbour_intersection), which time and count their own phases
+        Note: every step's outcome ('taken', 'no_candidates' or 'skipped'; see StepOutcome) is kept as last_outcome and passed to the outcome_handler;
+            the default one, warn_on_outcome, issues the usual warnings about empty scans and skipped steps, while None makes steps silent.
+            No warning filters are changed by steps, so warnings raised by user-defined Updaters reach the caller unaltered
         '''
         self.graph = graph
         self.scanner = node_scanner
@@ -28,9 +45,16 @@ class GSM:
         self.selector = selector
         self.updater = state_updater
         self.greedy_updater = greedy_state_updater
+        self.incremental_scan = IncrementalScan() if incremental else None
+        self.scan_cache = scan_cache
+        self.async_lock = None # Created on first use by the asynchronous methods
+        self.profiler = profiler
+        self.outcome_handler = outcome_handler
+        self.last_outcome = None
 
-        self.log = [dict(method = '__init__', graph = graph, state = state, node_scanner = node_scanner,
-                         state_updater = state_updater, list_accumulator = list_accumulator, selector = selector)]
+        self.log = log if log is not None else GSMLog()
+        self.log.append(LogRecord('__init__', graph = graph, state = state, node_scanner = node_scanner,
+                                  state_updater = state_updater, list_accumulator = list_accumulator, selector = selector))
 
     def __str__(self): return f'GSM State: {self.state.__str__()}'
 
@@ -38,64 +62,154 @@ class GSM:
     # Core functionality methods
 
     def extend_with(self, extension_graph, warn_about_problematic_sufficiencies = True):
-        '''Note: returns a new object; does not affect the original'''
-        res = deepcopy(self)
-        res.graph = res.graph.extend_with(extension_graph, warn_about_problematic_sufficiencies)
+        '''Note: returns a new object; does not affect the original (whose graph it overlays rather than copies; see Graph.extend_with).
+            The state is copied, while the log is a new one with the same (shared, immutable) records'''
+        res = copy(self)
+        res.state, res.log = deepcopy(self.state), self.log.copy()
+        res.incremental_scan = IncrementalScan() if self.incremental_scan is not None else None
+        res.async_lock = None
+        res.graph = self.graph.extend_with(extension_graph, warn_about_problematic_sufficiencies)
         return res
 
-    def _scan(self, *args, **kwargs) -> List[Tuple[Node, Any]]:
-        '''Note: this method just returns the step result; it does not update the state'''
-        return self.scanner(self.graph, self.selector(self.state), *args, **kwargs)
+    def _scan(self, *args, top_k: int = None, **kwargs) -> List[Tuple[Node, Any]]:
+        '''Note: this method just returns the step result; it does not update the state.
+            If top_k is given then only the first top_k entries of the scan result are produced: by the Scanner itself if it accepts a 'top_k' argument
+            (e.g. by_score and neighbour_intersection, which then avoid scoring and sorting all candidates), and by truncating its result otherwise.
+            If the GSM has a scan_cache then results are looked up in (and added to) it'''
+        watch = self.profiler.watch('gsm') if self.profiler is not None else None
+        nodes = self.selector(self.state)
+        if watch is not None: watch.lap('selector')
+        res = self.scan_cache.get(self.graph, self.scanner, nodes, dict(self._ensure_scanner_args_are_named(args, kwargs) or {}, top_k = top_k),
+                                  lambda: self._uncached_scan(nodes, args, kwargs, top_k)) if self.scan_cache is not None else self._uncached_scan(nodes, args, kwargs, top_k)
+        if watch is not None: watch.lap('scan')
+        return res
+
+    def _uncached_scan(self, nodes: List[Node], args, kwargs, top_k: int = None) -> List[Tuple[Node, Any]]:
+        parameters = signature(self.scanner).parameters
+        if self.incremental_scan is not None and self.graph.compiled is not None and 'incremental' in parameters:
+            kwargs = dict(kwargs, incremental = self.incremental_scan)
+        if top_k is not None and 'top_k' in parameters: kwargs, top_k = dict(kwargs, top_k = top_k), None
+        if self.profiler is not None and 'profiler' in parameters: kwargs = dict(kwargs, profiler = self.profiler)
+        res = self.scanner(self.graph, nodes, *args, **kwargs)
+        return res if top_k is None else res[:top_k]
 
-    def step(self, *args, conditional = False, greedy = False, **kwargs):
+    def step(self, *args, conditional = False, greedy = False, top_k: int = None, **kwargs):
         '''Scan nodes of interest and perform a step (i.e. have the step_handler update the state by processing the scan result).
             If conditional == True, the step is performed only if no node of the requested type is in state.
                 In that case an ASSUMPTION is made:
                 that the first (named or unnamed) argument of scanner (after graph and state) is a singleton list of the type of node to look for.
-            If greedy == True, then the step uses the self.greedy_updater updater (THE DEFAULT ONE IS ONLY FOR LIST-TYPE STATES), adding ALL candidates to state.'''
+            If greedy == True, then the step uses the self.greedy_updater updater (THE DEFAULT ONE IS ONLY FOR LIST-TYPE STATES), adding ALL candidates to state.
+            If top_k is given then the scan result (as passed to the updater and logged) only contains its first top_k entries (see _scan);
+                since the non-greedy updaters only use the first entry, top_k = 1 gives them the same outcome at a lower cost.'''
+        if not self._step_skipped(args, kwargs, conditional): self._apply_step(lambda: self._scan(*args, top_k = top_k, **kwargs), args, kwargs, greedy)
+        return self
+
+    def _step_skipped(self, args, kwargs, conditional) -> bool:
         if args and kwargs: raise TypeError('Step function arguments should be either all named or all unnamed (except for "conditional", which should always be named)')
         node_type = (args if args else (list(kwargs.values())))[0][0]
         if conditional and self.type_in_state(node_type):
-            warnings.warn(f'Step of type \'{node_type}\' not taken because nodes of that type were already in state')
-            return self
-        else:
-            def f():
-                scan_result = self._scan(*args, **kwargs)
-                self.log.append(dict(method = 'step', scan_result = scan_result, scanner_arguments = self._ensure_scanner_args_are_named(args, kwargs)))
-                self.state, self.graph = (self.greedy_updater if greedy else self.updater)(self.state, self.graph, scan_result)
-            expand_user_warning(f, lambda: f'; last log entry: {self.log[-1]}')
-        return self
-
-    def consecutive_steps(self, *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False):
+            self._report(StepOutcome('skipped', self._ensure_scanner_args_are_named(args, kwargs)))
+            return True
+        return False
+
+    def _apply_step(self, scan: Callable[[], ScanResult], args, kwargs, greedy):
+        scan_result = scan()
+        watch = self.profiler.watch('gsm') if self.profiler is not None else None
+        record = self.log.append(LogRecord('step', scan_result = scan_result, scanner_arguments = (scanner_arguments := self._ensure_scanner_args_are_named(args, kwargs))))
+        if watch is not None: watch.lap('log')
+        self.state, self.graph = (self.greedy_updater if greedy else self.updater)(self.state, self.graph, scan_result)
+        if watch is not None: watch.lap('updater')
+        self._report(StepOutcome('taken' if scan_result else 'no_candidates', scanner_arguments, record))
+        if watch is not None: watch.lap('outcome', steps = 1)
+
+    def _report(self, outcome: StepOutcome):
+        self.last_outcome = outcome
+        if self.outcome_handler is not None: self.outcome_handler(outcome)
+
+    def consecutive_steps(self, *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False, top_k: int = None):
         '''Perform steps of the given node types one after the other, i.e. using the progressively updated state for each new step.
             Note: steps can be made either all standard or all conditional.'''
-        for ss in scanners_arguments: self.step(**self._ensure_scanner_args_are_named(ss), conditional = conditional, greedy = greedy)
+        for ss in scanners_arguments: self.step(**self._ensure_scanner_args_are_named(ss), conditional = conditional, greedy = greedy, top_k = top_k)
         return self
 
-    def parallel_steps(self, *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False):
+    def parallel_steps(self, *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False, top_k: int = None):
         '''Perform steps of the given node types all starting from the same state, i.e. only apply state updates after scan results are known.
             Note: steps can be made either all standard or all conditional.'''
         scanners_arguments = [self._ensure_scanner_args_are_named(ss) for ss in scanners_arguments]
-        scan_results = [self._scan(**ss) for ss in scanners_arguments]
+        return self._apply_parallel_steps(scanners_arguments, [self._scan(**ss, top_k = top_k) for ss in scanners_arguments], conditional, greedy)
+
+    def _apply_parallel_steps(self, scanners_arguments: List[Dict[str, Any]], scan_results: List[ScanResult], conditional, greedy):
         for rs, ss in zip(scan_results, scanners_arguments):
             node_type = list(ss.values())[0][0] # no list check because ss is already guaranteed to be a dictionary
             if conditional and self.type_in_state(node_type):
-                warnings.warn(f'Step of type \'{node_type}\' not taken because nodes of that type were already in state')
+                self._report(StepOutcome('skipped', ss, parallel = True))
                 return self
             else:
-                def f(): self.state, self.graph = (self.greedy_updater if greedy else self.updater)(self.state, self.graph, rs)
-                expand_user_warning(f, lambda: f'; (parallel) step arguments: {ss}')
-        self.log.append(dict(method = 'parallel_steps', scan_results = scan_results, scanners_arguments = scanners_arguments))
+                self.state, self.graph = (self.greedy_updater if greedy else self.updater)(self.state, self.graph, rs)
+                self._report(StepOutcome('taken' if rs else 'no_candidates', ss, parallel = True))
+        self.log.append(LogRecord('parallel_steps', scan_results = scan_results, scanners_arguments = scanners_arguments))
         return self
 
 
+    # Asynchronous methods
+
+    def _async_lock(self) -> asyncio.Lock:
+        if self.async_lock is None: self.async_lock = asyncio.Lock()
+        return self.async_lock
+
+    async def _offload(self, f: Callable[[], Any], executor: Executor = None, timeout: float = None):
+        '''Await f run in the executor (the event loop's default one if None) for at most timeout seconds.
+            On cancellation or timeout the machine is left unchanged, but a scan already running keeps its thread busy until it completes
+            (its result then being discarded); an incremental machine gets fresh IncrementalScan data, since the abandoned scan may still be updating the old one'''
+        try: return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(executor, f), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if self.incremental_scan is not None: self.incremental_scan = IncrementalScan()
+            raise
+
+    async def astep(self, *args, conditional = False, greedy = False, top_k: int = None, executor: Executor = None, timeout: float = None, **kwargs):
+        '''Asynchronous step: as step, but with the scan run in the given executor (the event loop's default thread pool if None), so that the event loop is not blocked,
+            and the state update applied afterwards (on the event loop thread), so that cancelling the step or exceeding the timeout (in seconds) leaves the machine unchanged.
+            Asynchronous calls on the same machine are serialised (by a per-machine asyncio.Lock), while different machines, e.g. over one shared graph, run concurrently;
+            synchronous calls should not be made while asynchronous ones are pending.
+            Note: thread pool executors share the graph with the event loop; process pool ones would receive a copy of the whole machine for every scan'''
+        async with self._async_lock():
+            if not self._step_skipped(args, kwargs, conditional):
+                scan_result = await self._offload(partial(self._scan, *args, top_k = top_k, **kwargs), executor, timeout)
+                self._apply_step(lambda: scan_result, args, kwargs, greedy)
+        return self
+
+    async def aconsecutive_steps(self, *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False, top_k: int = None,
+                                 executor: Executor = None, timeout: float = None):
+        '''Asynchronous consecutive_steps (see astep; the timeout applies to each step)'''
+        async for _ in self.astream(*scanners_arguments, conditional = conditional, greedy = greedy, top_k = top_k, executor = executor, timeout = timeout): pass
+        return self
+
+    async def astream(self, *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False, top_k: int = None,
+                      executor: Executor = None, timeout: float = None) -> AsyncIterator['GSM']:
+        '''Asynchronous generator performing consecutive steps (see astep; the timeout applies to each step) and yielding the machine after each one,
+            e.g. to stream states to a client by async for gsm in gsm.astream(['A'], ['B']): send(gsm.state)'''
+        for ss in scanners_arguments:
+            yield await self.astep(**self._ensure_scanner_args_are_named(ss), conditional = conditional, greedy = greedy, top_k = top_k, executor = executor, timeout = timeout)
+
+    async def aparallel_steps(self, *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False, top_k: int = None,
+                              executor: Executor = None, timeout: float = None):
+        '''Asynchronous parallel_steps (see astep; the scans are offloaded together and the timeout applies to all of them)'''
+        async with self._async_lock():
+            scanners_arguments = [self._ensure_scanner_args_are_named(ss) for ss in scanners_arguments]
+            scan_results = await self._offload(lambda: [self._scan(**ss, top_k = top_k) for ss in scanners_arguments], executor, timeout)
+            return self._apply_parallel_steps(scanners_arguments, scan_results, conditional, greedy)
+
+
     # Plotting methods
 
     def plot(self, override_highlight: List[Node] = None,
              show_necessity = True, show_sufficiency = True,
              layout = nx.kamada_kawai_layout, layout_args: Dict[str, Any] = {},
-             plotly = True, radial_labels = False, networkx_plot_args: Dict[str, Any] = {}):
-        return self.graph.plot(override_highlight if override_highlight else self.selector(self.state), show_necessity, show_sufficiency, layout, layout_args, plotly, radial_labels, networkx_plot_args)
+             plotly = True, radial_labels = False, networkx_plot_args: Dict[str, Any] = {},
+             large = False, base_figure = None, path: str = None, show: bool = None):
+        '''See Graph.plot; in particular, a figure returned by a previous call can be passed as base_figure to only redraw the state highlight'''
+        return self.graph.plot(override_highlight if override_highlight else self.selector(self.state), show_necessity, show_sufficiency, layout, layout_args, plotly, radial_labels, networkx_plot_args,
+                               large = large, base_figure = base_figure, path = path, show = show)
 
 
     # Utility methods
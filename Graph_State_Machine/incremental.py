@@ -0,0 +1,131 @@
+from collections import Counter
+import numpy as np
+
+from Graph_State_Machine.compiled import CompiledGraph, segment_ids
+from Graph_State_Machine.states import OrderedState
+from Graph_State_Machine.types import *
+
+
+class IncrementalScan:
+    '''Running scan data for a growing (or shrinking) state on a compiled graph, so that consecutive by_score scans only process the state delta:
+        - per-node counts of adjacent distinct state nodes (whose positive entries are the candidates before type filtering)
+        - per-node counts of adjacent distinct state nodes of the neighbour types in use (i.e. the candidate-state intersection sizes)
+        - per-node counts of missing necessary nodes and per-node counts of satisfied sufficient sets
+        The last two groups depend on scan arguments (neighbour types and check_only_state_types), so they are kept for the few most recently used ones
+        and built from scratch for new ones (e.g. when check_only_state_types is True and a new node type enters the state).
+        A GSM created with incremental = True owns one of these and passes it to Scanners accepting an 'incremental' argument (e.g. by_score);
+        the data is reset whenever the graph's compiled form changes, or the state does not simply extend the previously seen one
+        and differs from it by as many nodes as it has (otherwise the difference is removed and added, e.g. when moving between sibling search branches).'''
+    max_keyed = 4 # Number of argument-dependent count arrays of each kind to keep
+
+    def __init__(self):
+        self.compiled = None
+
+    def reset(self, compiled: CompiledGraph):
+        self.compiled = compiled
+        self.state = [] # The list_state the data corresponds to (when driven by sync)
+        self.multiplicity = np.zeros(len(compiled.nodes), dtype = np.int64)
+        self.size = 0 # Number of distinct state nodes
+        self.adjacent = np.zeros(len(compiled.nodes), dtype = np.int64)
+        self.touched = [np.zeros(0, dtype = np.int64)] # Chunks of nodes which have been adjacent to the state at some point
+        self.state_types = np.zeros(len(compiled.types), dtype = np.int64)
+        self.inter = {} # Neighbour type mask bytes -> (mask, per-node intersection counts)
+        self.degrees = {} # Neighbour type mask bytes -> per-node counts of neighbours of those types (-1 if not computed yet)
+        self.nec_suff = {} # None or state-type bytes (for check_only_state_types) -> per-node missing necessary counts, per-set missing member counts, per-node satisfied set counts
+        return self
+
+
+    # State delta handling
+
+    def sync(self, compiled: CompiledGraph, list_state: List[Node]):
+        '''Bring the data in line with the given state, processing only the new nodes if it extends the previously synced one'''
+        if not isinstance(list_state, OrderedState): list_state = list(list_state) # OrderedState-s are immutable and check prefixes in O(1)
+        if compiled is not self.compiled: self.reset(compiled)
+        elif not (list_state.extends(self.state) if isinstance(list_state, OrderedState) else list_state[:len(self.state)] == self.state):
+            old, new = Counter(self.state), Counter(list_state)
+            if sum((removed := old - new).values()) + sum((added := new - old).values()) < len(list_state): # Cheaper than rebuilding, e.g. for a sibling search branch
+                self.remove(compiled.ids(removed.elements())).add(compiled.ids(added.elements()))
+                self.state = list_state
+                return self
+            self.reset(compiled)
+        self.add(compiled.ids(list_state[len(self.state):]))
+        self.state = list_state
+        return self
+
+    def add(self, ids: np.ndarray):
+        for i in ids.tolist():
+            self.multiplicity[i] += 1
+            if self.multiplicity[i] == 1: self._update(i, 1)
+        return self
+
+    def remove(self, ids: np.ndarray):
+        for i in ids.tolist():
+            self.multiplicity[i] -= 1
+            if not self.multiplicity[i]: self._update(i, -1)
+        return self
+
+    def _update(self, i: int, sign: int):
+        cg = self.compiled
+        neighbours = cg.indices[cg.indptr[i]:cg.indptr[i + 1]]
+        if sign > 0: self.touched.append(neighbours[self.adjacent[neighbours] == 0])
+        self.adjacent[neighbours] += sign
+        self.size += sign
+
+        t = cg.type_codes[i]
+        self.state_types[t] += sign
+        if self.state_types[t] == (1 if sign > 0 else 0): # The set of state types changed
+            self.nec_suff = {k: v for k, v in self.nec_suff.items() if k is None}
+        for mask, inter in self.inter.values():
+            if mask[t]: inter[neighbours] += sign
+
+        rev_nec_indptr, rev_nec_indices, rev_set_indptr, rev_set_indices, set_owners = cg.reverse_necessity_sufficiency
+        for nec_missing, set_missing, satisfied in self.nec_suff.values(): # Node i switches between not ok and ok (in state) in all remaining variants
+            np.subtract.at(nec_missing, rev_nec_indices[rev_nec_indptr[i]:rev_nec_indptr[i + 1]], sign)
+            sets = rev_set_indices[rev_set_indptr[i]:rev_set_indptr[i + 1]]
+            if sign < 0: np.subtract.at(satisfied, set_owners[sets[set_missing[sets] == 0]], 1)
+            np.subtract.at(set_missing, sets, sign)
+            if sign > 0: np.add.at(satisfied, set_owners[sets[set_missing[sets] == 0]], 1)
+
+
+    # Scan data
+
+    def state_ids(self) -> np.ndarray: return np.flatnonzero(self.multiplicity)
+
+    def candidates(self, type_mask: np.ndarray) -> np.ndarray:
+        '''Distinct (ascending) neighbours of state nodes with types in the given mask'''
+        self.touched = [touched := np.unique(np.concatenate(self.touched))]
+        self.touched = [touched := touched[self.adjacent[touched] > 0]]
+        return touched[type_mask[self.compiled.type_codes[touched]]]
+
+    def intersections(self, type_mask: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        '''Sizes of the intersections of the state with the given nodes' neighbours of types in the given mask'''
+        def build(): # Counts of state nodes of the given types around each node
+            state_ids = self.state_ids()
+            return type_mask, np.bincount(self.compiled.neighbours(state_ids[type_mask[self.compiled.type_codes[state_ids]]])[0], minlength = len(self.compiled.nodes))
+        return self._keyed(self.inter, type_mask.tobytes(), build)[1][ids]
+
+    def degrees_for(self, type_mask: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        '''Numbers of neighbours of types in the given mask of the given nodes (computed once per node and mask)'''
+        degrees = self._keyed(self.degrees, type_mask.tobytes(), lambda: np.full(len(self.compiled.nodes), -1, dtype = np.int64))
+        if len(unknown := ids[degrees[ids] < 0]): degrees[unknown] = self.compiled.neighbours(unknown, type_mask)[1]
+        return degrees[ids]
+
+    def necessity_sufficiency_ok(self, ids: np.ndarray, check_necessity = True, check_sufficiency = True, check_only_state_types = False) -> np.ndarray:
+        '''Boolean mask over ids with the semantics of CompiledGraph.necessity_sufficiency_mask'''
+        cg = self.compiled
+        def build():
+            ok = cg.nec_suff_ok_mask(self.state_ids(), check_only_state_types)
+            set_missing = np.bincount(segment_ids(np.diff(cg.set_indptr))[~ok[cg.set_indices]], minlength = len(cg.set_indptr) - 1)
+            return (np.bincount(segment_ids(np.diff(cg.nec_indptr))[~ok[cg.nec_indices]], minlength = len(cg.nodes)), set_missing,
+                    np.bincount(cg.reverse_necessity_sufficiency[4][set_missing == 0], minlength = len(cg.nodes)))
+        nec_missing, _, satisfied = self._keyed(self.nec_suff, (self.state_types > 0).tobytes() if check_only_state_types else None, build)
+        res = np.ones(len(ids), dtype = bool)
+        if check_necessity: res &= nec_missing[ids] == 0
+        if check_sufficiency: res &= (cg.suff_indptr[ids + 1] == cg.suff_indptr[ids]) | (satisfied[ids] > 0)
+        return res
+
+    def _keyed(self, cache: Dict, key, build: Callable[[], Any]):
+        '''Get (or build) an argument-dependent entry, marking it as the most recently used and evicting the least recently used ones beyond max_keyed'''
+        cache[key] = entry if (entry := cache.pop(key, None)) is not None else build()
+        while len(cache) > self.max_keyed: del cache[next(iter(cache))]
+        return cache[key]
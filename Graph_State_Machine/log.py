@@ -0,0 +1,109 @@
+import json
+import reprlib
+import weakref
+from collections import deque
+from collections.abc import Mapping
+
+from typing import *
+
+
+_field_tuples = {} # Interned field name tuples, shared by all records of the same shape
+def _weak(value):
+    try: return weakref.ref(value) if value is not None else value
+    except TypeError: return value # Not weakly referenceable
+
+_summary_repr = reprlib.Repr()
+_summary_repr.maxlist, _summary_repr.maxdict, _summary_repr.maxstring, _summary_repr.maxother = 10, 10, 200, 200
+
+
+class LogRecord(Mapping):
+    '''Compact, immutable log entry: a method name plus parallel tuples of field names (shared between records of the same shape) and values.
+        Values are references to the logged objects (never copies), except for graphs, which are held by weak reference (so that a log never keeps
+        a replaced graph alive; they read as None once collected). It reads like the dictionary entries GSM logs used to consist of,
+        e.g. record['scan_result'], record.get('method'), dict(record) or record == dict(method = 'step', ...)'''
+    __slots__ = ('method', 'fields', 'values')
+    weak_fields = ('graph',)
+
+    def __init__(self, method: str, **fields):
+        self.method = method
+        self.fields = _field_tuples.setdefault(key := tuple(fields), key)
+        self.values = tuple(_weak(v) if k in self.weak_fields else v for k, v in fields.items())
+
+    @classmethod
+    def from_dict(cls, entry: Mapping) -> 'LogRecord':
+        return entry if isinstance(entry, LogRecord) else cls(**entry) if 'method' in entry else cls(None, **entry)
+
+    def __getitem__(self, key: str):
+        if key == 'method' and self.method is not None: return self.method
+        try: value = self.values[self.fields.index(key)]
+        except ValueError: raise KeyError(key) from None
+        return value() if isinstance(value, weakref.ref) else value
+
+    def __iter__(self): return iter((('method',) if self.method is not None else ()) + self.fields)
+    def __len__(self): return len(self.fields) + (self.method is not None)
+    def __repr__(self): return repr(dict(self))
+
+    def summary(self) -> str:
+        '''Length-limited representation, e.g. for warning messages about steps with long scan results'''
+        return _summary_repr.repr(dict(self))
+
+    def __getstate__(self): return self.method, self.fields, tuple(v() if isinstance(v, weakref.ref) else v for v in self.values) # Weak references cannot be pickled
+    def __setstate__(self, state):
+        method, fields, values = state
+        self.method, self.fields = method, _field_tuples.setdefault(fields, fields)
+        self.values = tuple(_weak(v) if k in self.weak_fields else v for k, v in zip(fields, values))
+
+
+class GSMLog:
+    '''Log of GSM operations, i.e. a sequence of LogRecord-s (appending plain dictionaries converts them), with a retention policy:
+        - 'full': keep all records (the original behaviour)
+        - 'ring': keep only the last capacity records
+        - 'off': keep no records
+        Every appended record is also passed to each of the sinks (callables taking a LogRecord, e.g. a FileSink or any callback),
+        regardless of retention; e.g. GSMLog('off', sinks = [FileSink('gsm_log.jsonl')]) moves the whole log to a file.
+        If scan_result_limit is given then only that many leading entries of scan results are kept in the records (a short copy instead of a reference).
+        Indexing, slicing, iteration and len work as for the list the log used to be'''
+    def __init__(self, retention = 'full', capacity = 1000, sinks: Iterable[Callable[[LogRecord], Any]] = (), scan_result_limit: int = None):
+        if retention not in ('full', 'ring', 'off'): raise ValueError(f"Unknown log retention '{retention}'; the available ones are 'full', 'ring' and 'off'")
+        self.retention, self.capacity, self.sinks, self.scan_result_limit = retention, capacity, list(sinks), scan_result_limit
+        self.records = [] if retention == 'full' else deque(maxlen = capacity if retention == 'ring' else 0)
+
+    def append(self, entry: Mapping):
+        record = LogRecord.from_dict(entry)
+        if self.scan_result_limit is not None and 'scan_result' in record.fields:
+            record = LogRecord(record.method, **{k: v[:self.scan_result_limit] if k == 'scan_result' else v for k, v in record.items() if k != 'method'})
+        self.records.append(record)
+        for sink in self.sinks: sink(record)
+        return record
+
+    def copy(self) -> 'GSMLog':
+        '''New log with the same policy and sinks and the same (shared, immutable) records'''
+        res = GSMLog(self.retention, self.capacity, self.sinks, self.scan_result_limit)
+        res.records.extend(self.records)
+        return res
+
+    def __getitem__(self, i: Union[int, slice]):
+        return list(self.records)[i] if isinstance(i, slice) else self.records[i]
+
+    def __iter__(self): return iter(self.records)
+    def __len__(self): return len(self.records)
+    def __repr__(self): return repr(list(self.records))
+    def __eq__(self, other): return list(self.records) == list(other)
+
+
+class FileSink:
+    '''Log sink appending each record to a file as a line of JSON (with non-JSON values, e.g. graphs and functions, as their repr-s)'''
+    def __init__(self, path: str):
+        self.path, self.file = path, None
+
+    def __call__(self, record: LogRecord):
+        if self.file is None: self.file = open(self.path, 'a', encoding = 'utf-8')
+        self.file.write(json.dumps(dict(record), default = repr) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None: self.file.close()
+        self.file = None
+
+    def __deepcopy__(self, memo): return self # A shared resource, like a file handle, rather than data
+    def __getstate__(self): return dict(path = self.path, file = None)
@@ -0,0 +1,30 @@
+from warnings import warn
+
+from Graph_State_Machine.log import LogRecord
+from Graph_State_Machine.types import *
+
+
+class StepOutcome(NamedTuple):
+    '''What happened in a GSM step, as passed to the machine's outcome_handler and kept as its last_outcome:
+        - status: 'taken' (the Updater processed a non-empty scan result), 'no_candidates' (the scan result was empty) or 'skipped' (a conditional step found its type in state)
+        - scanner_arguments: the (named) step arguments
+        - record: the step's log record (None for skipped and parallel steps)
+        - parallel: whether the step was one of a parallel_steps call
+        - machine: the index of the machine in its GSMBatch (None for GSM steps)'''
+    status: str
+    scanner_arguments: Dict[str, Any]
+    record: Optional[LogRecord] = None
+    parallel: bool = False
+    machine: Optional[int] = None
+
+    @property
+    def node_type(self) -> NodeType: return list(self.scanner_arguments.values())[0][0]
+
+
+def warn_on_outcome(outcome: StepOutcome):
+    '''The default GSM (and GSMBatch) outcome_handler, issuing the warnings steps have always issued about skipped steps and empty scan results'''
+    machine = f' (machine {outcome.machine} of a GSMBatch)' if outcome.machine is not None else ''
+    if outcome.status == 'skipped': warn(f'Step of type \'{outcome.node_type}\' not taken because nodes of that type were already in state{machine}')
+    elif outcome.status == 'no_candidates':
+        warn('A Scanner returned no result: no appropriate candidates identified' +
+             (f'; (parallel) step arguments: {outcome.scanner_arguments}' if outcome.parallel else f'; last log entry: {outcome.record.summary() if outcome.record is not None else None}') + machine)
@@ -0,0 +1,197 @@
+from functools import cached_property
+import networkx as nx
+from networkx.classes.coreviews import AdjacencyView
+from networkx.classes.reportviews import NodeView, EdgeView
+
+from typing import *
+Node = str
+
+
+class CopyOnWriteGraph(nx.Graph):
+    '''networkx Graph sharing the attribute and adjacency dicts of most of its nodes with another graph (see overlay, as used by Graph.extend_with)
+        and copying them on first write, so that no change to it ever reaches the other graph:
+            - a node's attribute dict on access through G.nodes[n] (or data views of all nodes) and on add_node(s)
+            - a node's adjacency dict on any change to its edges (e.g. add_edge, remove_edge or the removal of a neighbour)
+            - an edge's data dict (in both endpoints' adjacency dicts) on access through G.edges[u, v] or get_edge_data and on add_edge(s)
+        Views exposing the adjacency dicts themselves (G.adj, G[n], adjacency(), edge data views, subgraphs and other views) first copy all shared dicts.
+        Reads of the underscore dicts (as by this library and networkx algorithms) cost nothing extra; writing to them directly bypasses the copies.
+        Pickled and deep-copied graphs have dicts of their own, hence share nothing'''
+    def __init__(self, incoming_graph_data = None, **attr):
+        self._shares, self._owned_nodes, self._owned_adjs, self._owned_edges = False, set(), set(), set()
+        super().__init__(incoming_graph_data, **attr)
+
+    @classmethod
+    def overlay(cls, G: nx.Graph) -> 'CopyOnWriteGraph':
+        '''New graph with the same graph attributes as G and sharing all node attribute and adjacency dicts (and hence edge data dicts) with it;
+            nodes and edges given their own dicts directly in _node and _adj should be marked as owned by adding them to _owned_nodes, _owned_adjs and _owned_edges'''
+        res = cls()
+        res.graph.update(G.graph)
+        res._node, res._adj = dict(G._node), dict(G._adj) # Shallow copies of the outer dicts only
+        res._shares = True
+        return res
+
+    def _own_nodes(self, nodes: Iterable[Node]):
+        if self._shares:
+            for n in nodes:
+                if n not in self._owned_nodes:
+                    self._owned_nodes.add(n)
+                    if (d := self._node.get(n)) is not None: self._node[n] = dict(d)
+
+    def _own_adjs(self, nodes: Iterable[Node]):
+        if self._shares:
+            for n in nodes:
+                if n not in self._owned_adjs:
+                    self._owned_adjs.add(n)
+                    if (d := self._adj.get(n)) is not None: self._adj[n] = dict(d)
+
+    def _own_edges(self, edges: Iterable[Tuple[Node, Node]]):
+        if self._shares:
+            for u, v in edges:
+                self._own_adjs((u, v))
+                if (u, v) not in self._owned_edges:
+                    self._owned_edges.update(((u, v), (v, u)))
+                    if (d := self._adj.get(u, {}).get(v)) is not None: self._adj[u][v] = self._adj[v][u] = dict(d)
+
+    def _own_all(self):
+        '''Copy all shared dicts, after which nothing is shared any more'''
+        if self._shares:
+            self._own_nodes(list(self._node))
+            self._own_adjs(list(self._adj))
+            copies = {} # Edge data dicts are shared by both endpoints, and should remain so; the originals are kept so that their ids are not reused
+            for nbrs in self._adj.values():
+                for v, d in list(nbrs.items()):
+                    if (c := copies.get(id(d))) is None: c = copies[id(d)] = d, dict(d)
+                    nbrs[v] = c[1]
+            self._shares, self._owned_nodes, self._owned_adjs, self._owned_edges = False, set(), set(), set()
+
+    def __getstate__(self): # The cached views (of which ours hold the graph) are rebuilt on first use
+        state = {k: v for k, v in self.__dict__.items() if k not in ('nodes', 'edges', 'adj', 'degree')}
+        state.update(_shares = False, _owned_nodes = set(), _owned_adjs = set(), _owned_edges = set())
+        return state
+
+    @staticmethod
+    def _node_of(item) -> Node: # As in nx.Graph.add_nodes_from, unhashable items are (node, attribute dict) pairs
+        try: hash(item)
+        except TypeError: return item[0]
+        return item
+
+
+    # Modification methods
+
+    def add_node(self, node_for_adding, **attr):
+        self._own_nodes((node_for_adding,))
+        super().add_node(node_for_adding, **attr)
+
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        nodes_for_adding = list(nodes_for_adding)
+        self._own_nodes(map(self._node_of, nodes_for_adding))
+        super().add_nodes_from(nodes_for_adding, **attr)
+
+    def remove_node(self, n):
+        self._own_adjs(list(self._adj.get(n, ())))
+        super().remove_node(n)
+
+    def remove_nodes_from(self, nodes):
+        nodes = list(nodes)
+        self._own_adjs([m for n in nodes for m in self._adj.get(n, ())])
+        super().remove_nodes_from(nodes)
+
+    def add_edge(self, u_of_edge, v_of_edge, **attr):
+        self._own_edges([(u_of_edge, v_of_edge)])
+        super().add_edge(u_of_edge, v_of_edge, **attr)
+
+    def add_edges_from(self, ebunch_to_add, **attr):
+        ebunch_to_add = list(ebunch_to_add)
+        self._own_edges((e[0], e[1]) for e in ebunch_to_add)
+        super().add_edges_from(ebunch_to_add, **attr)
+
+    def remove_edge(self, u, v):
+        self._own_adjs((u, v))
+        super().remove_edge(u, v)
+
+    def remove_edges_from(self, ebunch):
+        ebunch = list(ebunch)
+        self._own_adjs([n for e in ebunch for n in e[:2]])
+        super().remove_edges_from(ebunch)
+
+    def clear_edges(self):
+        self._own_adjs(list(self._adj))
+        super().clear_edges()
+
+
+    # Views
+
+    @cached_property
+    def nodes(self): return _CopyOnWriteNodeView(self)
+
+    @cached_property
+    def edges(self): return _CopyOnWriteEdgeView(self)
+
+    @cached_property
+    def adj(self):
+        self._own_all()
+        return AdjacencyView(self._adj)
+
+    def adjacency(self):
+        self._own_all()
+        return super().adjacency()
+
+    def get_edge_data(self, u, v, default = None):
+        if v in self._adj.get(u, ()): self._own_edges([(u, v)])
+        return super().get_edge_data(u, v, default)
+
+    def subgraph(self, nodes):
+        self._own_all()
+        return super().subgraph(nodes)
+
+    def edge_subgraph(self, edges):
+        self._own_all()
+        return super().edge_subgraph(edges)
+
+    def copy(self, as_view = False):
+        if as_view: self._own_all()
+        return super().copy(as_view)
+
+    def to_directed(self, as_view = False):
+        if as_view: self._own_all()
+        return super().to_directed(as_view)
+
+    def to_undirected(self, as_view = False):
+        if as_view: self._own_all()
+        return super().to_undirected(as_view)
+
+
+class _CopyOnWriteNodeView(NodeView):
+    __slots__ = ('_graph',)
+
+    def __init__(self, graph: CopyOnWriteGraph):
+        super().__init__(graph)
+        self._graph = graph
+
+    def __getitem__(self, n):
+        if not isinstance(n, slice): self._graph._own_nodes((n,))
+        return super().__getitem__(n)
+
+    def __call__(self, data = False, default = None):
+        if data is True: self._graph._own_nodes(list(self._nodes))
+        return super().__call__(data, default)
+
+    def data(self, data = True, default = None):
+        if data is True: self._graph._own_nodes(list(self._nodes))
+        return super().data(data, default)
+
+
+class _CopyOnWriteEdgeView(EdgeView):
+    __slots__ = ()
+
+    def __getitem__(self, e):
+        if not isinstance(e, slice) and e in self: self._graph._own_edges([e])
+        return super().__getitem__(e)
+
+    def __call__(self, nbunch = None, data = False, *, default = None):
+        if data is True: self._graph._own_all()
+        return super().__call__(nbunch, data, default = default)
+
+    def data(self, data = True, default = None, nbunch = None):
+        if data is True: self._graph._own_all()
+        return super().data(data, default, nbunch)
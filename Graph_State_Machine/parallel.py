@@ -0,0 +1,46 @@
+import multiprocessing as mp
+import os
+import tempfile
+
+from Graph_State_Machine.gsm import GSM
+from Graph_State_Machine.graph import Graph
+from Graph_State_Machine.compiled import CompiledGraph
+from Graph_State_Machine.types import *
+
+
+_worker = {} # Per-process shared Graph and run configuration, set by _init_worker
+
+
+def run_parallel(graph: Graph, states: Iterable[State], *scanners_arguments: List[Union[List, Dict]], conditional = False, greedy = False,
+                 gsm_factory: Callable[[Graph, State], GSM] = GSM, processes: int = None, chunksize = 1, keep_logs = True,
+                 start_method: str = None) -> Iterator[Tuple[int, State, List[Dict[str, Any]]]]:
+    '''Run one state machine per given initial state through the given steps (as GSM.consecutive_steps) in a pool of worker processes,
+        yielding (index of the initial state, final state, log) triples in completion order, i.e. as soon as each machine finishes.
+        The graph is compiled once and written to a memory-mapped file (in /dev/shm if available) which all workers map read-only,
+        so that no process unpickles the networkx graph (see Graph.from_compiled; it is only rebuilt in a worker if something accesses its G).
+        Machines are created by gsm_factory(graph, initial_state), which defaults to GSM with its default operations;
+            pass e.g. a functools.partial of GSM (or any module-level function) to use other Scanners, Updaters and selectors.
+        Note: with start methods other than 'fork' (the Linux default), gsm_factory and the functions it uses need to be importable (i.e. picklable by reference);
+            states are always sent to workers, and final states and logs always sent back, by pickling
+        Note: logs lack the '__init__' entry (which holds the graph and the operation functions), and are empty lists if keep_logs is False
+        Note: Updaters should not modify the graph in place, since each worker shares its graph between the machines it runs'''
+    compiled = graph.compiled if graph.compiled is not None else CompiledGraph.from_networkx(graph.G, graph.type_attr)
+    fd, path = tempfile.mkstemp(suffix = '.gsm', dir = '/dev/shm' if os.path.isdir('/dev/shm') else None)
+    os.close(fd)
+    try:
+        compiled.save(path)
+        with mp.get_context(start_method).Pool(processes, initializer = _init_worker,
+                                               initargs = (path, graph.type_attr, gsm_factory, scanners_arguments, conditional, greedy, keep_logs)) as pool:
+            yield from pool.imap_unordered(_run_machine, enumerate(states), chunksize)
+    finally: os.remove(path)
+
+
+def _init_worker(path: str, type_attr: str, gsm_factory: Callable[[Graph, State], GSM], scanners_arguments: Tuple, conditional: bool, greedy: bool, keep_logs: bool):
+    _worker.update(graph = Graph.from_compiled(CompiledGraph.load(path)[0], type_attr), gsm_factory = gsm_factory,
+                   scanners_arguments = scanners_arguments, conditional = conditional, greedy = greedy, keep_logs = keep_logs)
+
+
+def _run_machine(indexed_state: Tuple[int, State]) -> Tuple[int, State, List[Dict[str, Any]]]:
+    i, state = indexed_state
+    gsm = _worker['gsm_factory'](_worker['graph'], state).consecutive_steps(*_worker['scanners_arguments'], conditional = _worker['conditional'], greedy = _worker['greedy'])
+    return i, gsm.state, gsm.log[1:] if _worker['keep_logs'] else []
@@ -0,0 +1,68 @@
+from collections import Counter, defaultdict
+from itertools import chain
+from time import perf_counter
+
+from typing import *
+
+
+class ProfileStats:
+    '''Aggregates of profiled phases: total seconds and number of calls per phase (named as 'component.phase', e.g. 'gsm.updater' or 'by_score.score')
+        and totals of counters (e.g. 'candidates', 'filtered_candidates' and 'scored_candidates')'''
+    def __init__(self):
+        self.seconds, self.calls, self.counts = defaultdict(float), Counter(), Counter()
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return dict(seconds = dict(self.seconds), calls = dict(self.calls), counts = dict(self.counts))
+
+    def reset(self):
+        self.seconds.clear(), self.calls.clear(), self.counts.clear()
+        return self
+
+    def __str__(self):
+        width = max(map(len, chain(self.seconds, self.counts)), default = 5)
+        return '\n'.join([f"{'phase':<{width}}  {'seconds':>10}  {'calls':>8}  {'mean ms':>8}"] +
+                         [f'{p:<{width}}  {s:>10.4f}  {self.calls[p]:>8}  {1000 * s / max(self.calls[p], 1):>8.3f}' for p, s in sorted(self.seconds.items())] +
+                         [f'{c:<{width}}  {n:>10}' for c, n in sorted(self.counts.items())])
+
+    def __repr__(self): return f'ProfileStats({self.as_dict()})'
+
+
+class Stopwatch:
+    '''Timer of consecutive phases of one component: each lap records the time since the previous one (or since creation) as the given phase.
+        A deferred Stopwatch (e.g. timing an attempt at a fast path which may still be abandoned) holds its laps back until commit; uncommitted ones are never recorded'''
+    __slots__ = ('profiler', 'component', 'last', 'pending')
+
+    def __init__(self, profiler: 'Profiler', component: str, deferred = False):
+        self.profiler, self.component, self.last, self.pending = profiler, component, perf_counter(), [] if deferred else None
+
+    def lap(self, phase: str, **counts: int):
+        if self.pending is not None: self.pending.append((f'{self.component}.{phase}', perf_counter() - self.last, counts))
+        else: self.profiler.record(f'{self.component}.{phase}', perf_counter() - self.last, **counts)
+        self.last = perf_counter() # Excluding the recording (and hooks) from the next phase
+        return self
+
+    def commit(self):
+        '''Record the laps held back so far (and any later ones directly)'''
+        for phase, seconds, counts in self.pending or (): self.profiler.record(phase, seconds, **counts)
+        self.pending = None
+        return self
+
+
+class Profiler:
+    '''Instrumentation surface for GSMs (see GSM's profiler argument) and the provided Scanners (which accept a profiler argument):
+        phases are timed and counted into a ProfileStats (the stats attribute), and each record is also passed to the hooks,
+        i.e. callables taking the phase name, its seconds and a dictionary of counters (e.g. for logging slow steps or exporting metrics).
+        Instrumented code only checks whether a profiler was given, so the cost is negligible without one'''
+    def __init__(self, hooks: Iterable[Callable[[str, float, Dict[str, int]], Any]] = ()):
+        self.stats, self.hooks = ProfileStats(), list(hooks)
+
+    def watch(self, component: str, deferred = False) -> Stopwatch: return Stopwatch(self, component, deferred)
+
+    def record(self, phase: str, seconds: float, **counts: int):
+        self.stats.seconds[phase] += seconds
+        self.stats.calls[phase] += 1
+        self.stats.counts.update(counts)
+        for hook in self.hooks: hook(phase, seconds, counts)
+        return self
+
+    def __deepcopy__(self, memo): return self # A shared aggregator rather than data
@@ -1,13 +1,20 @@
 from collections import Counter
 from functools import reduce
+from heapq import nsmallest
+from itertools import chain
 from operator import add
+import numpy as np
 
 from Graph_State_Machine.Util.generic_util import flatten
-from Graph_State_Machine.scores import Score, jaccard_similarity
+from Graph_State_Machine.compiled import gather, segment_ids, sorted_membership
+from Graph_State_Machine.incremental import IncrementalScan
+from Graph_State_Machine.profiling import Profiler, Stopwatch
+from Graph_State_Machine.scores import Score, VectorisedScore, jaccard_similarity, vectorised_scores, inter_bounded_scores
 from Graph_State_Machine.types import *
 
 
-def by_score(score_function: Score = jaccard_similarity, check_only_state_types = False, check_necessity = True, check_sufficiency = True) -> Scanner:
+def by_score(score_function: Score = jaccard_similarity, check_only_state_types = False, check_necessity = True, check_sufficiency = True, top_k: int = None,
+             profiler: Profiler = None) -> Scanner:
     '''Produce a Step function which orders nodes by the given Score function;
         can also provide the default values of Scanner parameters which can be deviated from individually on each GSM.step call.
 
@@ -18,40 +25,227 @@ def by_score(score_function: Score = jaccard_similarity, check_only_state_types
                      candidate_types: List[NodeType] = None, bad_candidate_types: List[NodeType] = None,
                      neighbour_types: List[NodeType] = None, bad_neighbour_types: List[NodeType] = None,
                      check_only_state_types = check_only_state_types,
-                     check_necessity = check_necessity, check_sufficiency = check_sufficiency) -> List[Tuple[Node, float]]:
+                     check_necessity = check_necessity, check_sufficiency = check_sufficiency, top_k: int = top_k,
+                     incremental: IncrementalScan = None, profiler: Profiler = profiler) -> List[Tuple[Node, float]]:
         '''candidate_types and bad_candidate_types govern which list_state nodes' neighbour to consider,
             while neighbour_types end bad_neighbour_types do the same for the second order neighbours, i.e. the neighbours of the above neighbours.
             The utility of the latter pair is in including/excluding some node types when comparing the candidates' neighbours with the current state.
 
             Setting check_only_state_types to True restricts the attention when examining the neighbours of candidate nodes solely on
             those of types present in the state (in terms of parameters of the returned closure it overrides neighbour_types
-            and bad_neighbour_types with the graph.state_types() and None)'''
-        if any(bad_args := {arg: v for arg, v in dict(candidate_types = candidate_types, bad_candidate_types = bad_candidate_types, neighbour_types = neighbour_types, bad_neighbour_types = bad_neighbour_types).items() if v is not None and not isinstance(v, list)}):
-            raise TypeError(f'The following arguments should be lists of node types but received these values: {bad_args}')
+            and bad_neighbour_types with the graph.state_types() and None)
 
-        candidates = set(flatten(graph.relevant_neighbours(list_state, candidate_types, bad_candidate_types)))
+            incremental is normally only passed by GSMs created with incremental = True (and only used on compiled graphs, for the Score functions in scores.vectorised_scores);
+            it makes the scan reuse the candidates, intersection sizes and necessity/sufficiency statuses of the previous one, processing only the state delta
+
+            If top_k is given then only the first top_k entries of the full result are returned (the same ones, in the same order), found by partial selection;
+            for the Score functions in scores.inter_bounded_scores, candidates which cannot make the top_k are also not scored at all
+
+            If a Profiler is given (e.g. by a GSM with one) then the phases 'by_score.gather', 'by_score.filter', 'by_score.score' and 'by_score.sort'
+            are timed and the 'candidates', 'filtered_candidates' and 'scored_candidates' counters incremented'''
+        _check_type_lists(candidate_types, bad_candidate_types, neighbour_types, bad_neighbour_types)
+        if graph.compiled is not None and (vectorised_score := vectorised_scores.get(score_function)) is not None:
+            attempt = profiler.watch('by_score', deferred = True) if profiler is not None else None # Laps only recorded if the vectorised path is taken
+            if (res := _vectorised_by_score(graph, list_state, vectorised_score, candidate_types, bad_candidate_types, neighbour_types, bad_neighbour_types,
+                                            check_only_state_types, check_necessity, check_sufficiency, top_k, incremental, attempt)) is not None:
+                if attempt is not None: attempt.commit()
+                return res
+
+        watch = profiler.watch('by_score') if profiler is not None else None
+        state_neighbours = graph.relevant_neighbours(list(dict.fromkeys(list_state)), candidate_types, bad_candidate_types)
+        candidates = set(flatten(state_neighbours))
+        if watch is not None: watch.lap('gather', candidates = len(candidates))
         if check_necessity or check_sufficiency: candidates = graph.necessity_sufficiency_filter(list_state, candidates, check_necessity, check_sufficiency, check_only_state_types)
         if check_only_state_types: neighbour_types, bad_neighbour_types = graph.type_set(list_state), None
-        scores = [(c, score) for c in candidates
-                  if (score := score_function(list_state, graph.relevant_neighbours([c], neighbour_types, bad_neighbour_types)[0])) > 0]
-        return sorted(scores, key = lambda x: (-x[1], x[0]), reverse = False) # nested ordering: first by score, then by node name
+        candidates = list(candidates)
+        if watch is not None: watch.lap('filter', filtered_candidates = len(candidates))
+        if top_k is not None and len(candidates) > top_k and (bound := inter_bounded_scores.get(score_function)) is not None:
+            adjacent_state = Counter(flatten(state_neighbours)) # Numbers of distinct state nodes adjacent to each candidate, i.e. upper bounds of intersection sizes
+            return _pruned_by_score(graph, list_state, score_function, candidates, [bound(adjacent_state[c], len(list_state), len(set(list_state))) for c in candidates],
+                                    neighbour_types, bad_neighbour_types, top_k, watch = watch)
+        # All candidates' neighbourhoods are gathered at once (a single pass on compiled graphs)
+        scores = [(c, score) for c, ns in zip(candidates, graph.relevant_neighbours(candidates, neighbour_types, bad_neighbour_types))
+                  if (score := score_function(list_state, ns)) > 0]
+        if watch is not None: watch.lap('score', scored_candidates = len(candidates))
+        res = nsmallest(top_k, scores, key = _score_then_name) if top_k is not None else \
+              sorted(scores, key = _score_then_name, reverse = False) # nested ordering: first by score, then by node name (nsmallest giving the first top_k of it)
+        if watch is not None: watch.lap('sort')
+        return res
+
+    def batch_closure(graph: Graph, list_states: List[List[Node]],
+                      candidate_types: List[NodeType] = None, bad_candidate_types: List[NodeType] = None,
+                      neighbour_types: List[NodeType] = None, bad_neighbour_types: List[NodeType] = None,
+                      check_only_state_types = check_only_state_types,
+                      check_necessity = check_necessity, check_sufficiency = check_sufficiency, top_k: int = top_k, profiler: Profiler = profiler) -> List[List[Tuple[Node, float]]]:
+        '''Batched version of the Scanner (available as its .batch attribute, e.g. for GSMBatch): scan many states with the same arguments at once;
+            on compiled graphs and for the Score functions in scores.vectorised_scores this is a single vectorised pass over all states'''
+        _check_type_lists(candidate_types, bad_candidate_types, neighbour_types, bad_neighbour_types)
+        list_states = [list(s) for s in list_states]
+        if graph.compiled is not None and (vectorised_score := vectorised_scores.get(score_function)) is not None:
+            attempt = profiler.watch('by_score', deferred = True) if profiler is not None else None # As in the Scanner, the laps of abandoned attempts are dropped
+            if (res := _batched_by_score(graph, list_states, vectorised_score, candidate_types, bad_candidate_types, neighbour_types, bad_neighbour_types,
+                                         check_only_state_types, check_necessity, check_sufficiency, top_k, attempt)) is not None:
+                if attempt is not None: attempt.commit()
+                return res
+        return [scan_closure(graph, s, candidate_types, bad_candidate_types, neighbour_types, bad_neighbour_types, check_only_state_types, check_necessity, check_sufficiency, top_k,
+                             profiler = profiler) for s in list_states]
+
+    scan_closure.batch = batch_closure
     return scan_closure
 
+def _score_then_name(x: Tuple[Node, float]) -> Tuple[float, Node]: return -x[1], x[0]
+
+def _pruned_by_score(graph: Graph, list_state: List[Node], score_function: Score, candidates: List[Node], bounds: List[float],
+                     neighbour_types: List[NodeType], bad_neighbour_types: List[NodeType], top_k: int, chunk_size = 64, watch: Stopwatch = None) -> List[Tuple[Node, float]]:
+    '''Top-k by_score scan scoring candidates in chunks in decreasing order of their score upper bounds,
+        and stopping as soon as the next bound is below the current k-th best score (equal ones could still tie and precede it by name)'''
+    scores, order, scored = [], sorted(range(len(candidates)), key = lambda i: -bounds[i]), 0
+    for start in range(0, len(order), chunk_size := max(chunk_size, top_k)):
+        if len(scores) >= top_k and bounds[order[start]] < nsmallest(top_k, scores, key = _score_then_name)[-1][1]: break
+        chunk = [candidates[i] for i in order[start:start + chunk_size]]
+        scores += [(c, score) for c, ns in zip(chunk, graph.relevant_neighbours(chunk, neighbour_types, bad_neighbour_types)) if (score := score_function(list_state, ns)) > 0]
+        scored += len(chunk)
+    if watch is not None: watch.lap('score', scored_candidates = scored)
+    res = nsmallest(top_k, scores, key = _score_then_name)
+    if watch is not None: watch.lap('sort')
+    return res
+
+def _top_k_order(scores: np.ndarray, name_ranks: np.ndarray, top_k: Optional[int]) -> np.ndarray:
+    '''Positions of the entries ordered by descending score and then by name, or of only the first top_k of them,
+        found by partial selection of the candidates scoring at least the k-th best score (ties included) before sorting'''
+    if top_k is not None and len(scores) > top_k:
+        subset = np.flatnonzero(-scores <= np.partition(-scores, top_k - 1)[top_k - 1]) if top_k > 0 else np.zeros(0, dtype = np.int64)
+        return subset[np.lexsort((name_ranks[subset], -scores[subset]))][:top_k]
+    return np.lexsort((name_ranks, -scores))
+
+def _check_type_lists(candidate_types: List[NodeType], bad_candidate_types: List[NodeType], neighbour_types: List[NodeType], bad_neighbour_types: List[NodeType]):
+    if any(bad_args := {arg: v for arg, v in dict(candidate_types = candidate_types, bad_candidate_types = bad_candidate_types, neighbour_types = neighbour_types, bad_neighbour_types = bad_neighbour_types).items() if v is not None and not isinstance(v, list)}):
+        raise TypeError(f'The following arguments should be lists of node types but received these values: {bad_args}')
+
+def _vectorised_by_score(graph: Graph, list_state: List[Node], vectorised_score: VectorisedScore,
+                         candidate_types: List[NodeType], bad_candidate_types: List[NodeType], neighbour_types: List[NodeType], bad_neighbour_types: List[NodeType],
+                         check_only_state_types: bool, check_necessity: bool, check_sufficiency: bool, top_k: int = None,
+                         incremental: IncrementalScan = None, watch: Stopwatch = None) -> Optional[List[Tuple[Node, float]]]:
+    '''The by_score scan on a compiled graph with all candidates scored at once: the state indicator vector is applied to the (CSR) candidate-neighbour
+        incidence matrix to get all intersection sizes, and the result is ordered as by the standard path (by score, then by node name).
+        If an IncrementalScan is given, candidates, intersection sizes and necessity/sufficiency statuses are read from it after applying the state delta.
+        Returns None if any score is not finite, so that the standard path can be taken (and raise whatever the Score function raises)'''
+    if incremental is None: return res[0] if (res := _batched_by_score(graph, [list_state], vectorised_score, candidate_types, bad_candidate_types, neighbour_types, bad_neighbour_types,
+                                                                       check_only_state_types, check_necessity, check_sufficiency, top_k, watch)) is not None else None
+
+    cg = graph.compiled
+    incremental.sync(cg, list_state)
+    candidate_ids = incremental.candidates(cg.type_mask(candidate_types, bad_candidate_types))
+    if watch is not None: watch.lap('gather', candidates = len(candidate_ids))
+    if check_necessity or check_sufficiency:
+        candidate_ids = graph.attainable_candidates(list_state, candidate_ids, check_necessity, check_sufficiency, check_only_state_types)
+        candidate_ids = candidate_ids[incremental.necessity_sufficiency_ok(candidate_ids, check_necessity, check_sufficiency, check_only_state_types)]
+    if watch is not None: watch.lap('filter', filtered_candidates = len(candidate_ids))
+    neighbour_mask = incremental.state_types > 0 if check_only_state_types else cg.type_mask(neighbour_types, bad_neighbour_types)
+    inter, b_sizes = incremental.intersections(neighbour_mask, candidate_ids), incremental.degrees_for(neighbour_mask, candidate_ids)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'): scores = vectorised_score(inter, len(incremental.state), incremental.size, b_sizes)
+    if not np.isfinite(scores).all(): return None
+    if watch is not None: watch.lap('score', scored_candidates = len(candidate_ids))
+
+    candidate_ids, scores = candidate_ids[keep := scores > 0], scores[keep]
+    order = _top_k_order(scores, cg.name_rank[candidate_ids], top_k)
+    res = list(zip(cg.names(candidate_ids[order]), scores[order].tolist()))
+    if watch is not None: watch.lap('sort')
+    return res
+
+def _batched_by_score(graph: Graph, list_states: List[List[Node]], vectorised_score: VectorisedScore,
+                      candidate_types: List[NodeType], bad_candidate_types: List[NodeType], neighbour_types: List[NodeType], bad_neighbour_types: List[NodeType],
+                      check_only_state_types: bool, check_necessity: bool, check_sufficiency: bool, top_k: int = None, watch: Stopwatch = None) -> Optional[List[List[Tuple[Node, float]]]]:
+    '''The by_score scan of many states at once on a compiled graph: (machine, node) pairs are encoded as machine * n_nodes + node keys,
+        so that all states' candidates are gathered, filtered, scored and ordered together.
+        Intersection sizes are counted from the state side (i.e. as the transposed candidate-neighbour incidence matrix applied to the state indicator vectors),
+        which only touches the neighbours of state nodes, and the neighbour counts of candidates come from a cached per-type-mask degree array.
+        Returns None if any score is not finite, so that the standard path can be taken (and raise whatever the Score function raises)'''
+    cg, n, n_states = graph.compiled, len(graph.compiled.nodes), len(list_states)
+    state_lens = np.fromiter(map(len, list_states), dtype = np.int64, count = n_states)
+    state_keys = np.unique(np.repeat(np.arange(n_states), state_lens) * n + cg.ids(chain.from_iterable(list_states)))
+    state_machines, state_ids = np.divmod(state_keys, n)
+    in_state = lambda machines, ids: sorted_membership(state_keys, machines * n + ids)
+    if check_only_state_types:
+        state_types = np.zeros((n_states, len(cg.types)), dtype = bool)
+        state_types[state_machines, cg.type_codes[state_ids]] = True
+
+    values, counts = gather(cg.indptr, cg.indices, state_ids) # All neighbours of all (distinct) state nodes
+    pair_keys = np.repeat(state_machines, counts) * n + values
+    machines, candidate_ids = np.divmod(np.unique(pair_keys[cg.type_mask(candidate_types, bad_candidate_types)[cg.type_codes[values]]]), n)
+    if watch is not None: watch.lap('gather', candidates = len(candidate_ids))
+    if check_necessity or check_sufficiency:
+        if (p := graph._pruning(check_necessity, check_sufficiency, check_only_state_types)) is not None and p.attainable is not None: # Only for machines whose states are attainable
+            keep = p.attainable[candidate_ids] | (np.bincount(state_machines[~p.attainable[state_ids]], minlength = n_states) > 0)[machines]
+            machines, candidate_ids = machines[keep], candidate_ids[keep]
+        ok = (lambda owners, ids: in_state(machines[owners], ids) | ~state_types[machines[owners], cg.type_codes[ids]]) if check_only_state_types else \
+             (lambda owners, ids: in_state(machines[owners], ids))
+        keep = cg.necessity_sufficiency_ok(ok, candidate_ids, check_necessity, check_sufficiency)
+        machines, candidate_ids = machines[keep], candidate_ids[keep]
+    if watch is not None: watch.lap('filter', filtered_candidates = len(candidate_ids))
+
+    if check_only_state_types: # Neighbour types are each state's own types, hence all state nodes count towards intersections
+        inter_keys, inter_counts = np.unique(pair_keys, return_counts = True)
+        values, b_sizes = gather(cg.indptr, cg.indices, candidate_ids)
+        b_sizes = np.bincount(segment_ids(b_sizes)[state_types[np.repeat(machines, b_sizes), cg.type_codes[values]]], minlength = len(candidate_ids))
+    else:
+        neighbour_mask = cg.type_mask(neighbour_types, bad_neighbour_types)
+        inter_keys, inter_counts = np.unique(pair_keys[np.repeat(neighbour_mask[cg.type_codes[state_ids]], counts)], return_counts = True)
+        b_sizes = cg.type_degrees(neighbour_mask)[candidate_ids]
+    candidate_keys = machines * n + candidate_ids
+    positions = np.minimum(np.searchsorted(inter_keys, candidate_keys), max(len(inter_keys) - 1, 0))
+    inter = np.where(sorted_membership(inter_keys, candidate_keys), inter_counts[positions] if len(inter_keys) else 0, 0)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        scores = vectorised_score(inter, state_lens[machines], np.bincount(state_keys // n, minlength = n_states)[machines], b_sizes)
+    if not np.isfinite(scores).all(): return None
+    if watch is not None: watch.lap('score', scored_candidates = len(candidate_ids))
+
+    machines, candidate_ids, scores = machines[keep := scores > 0], candidate_ids[keep], scores[keep]
+    order, per_machine = np.lexsort((cg.name_rank[candidate_ids], -scores, machines)), np.bincount(machines, minlength = n_states)
+    if top_k is not None: # Only converting the first top_k of each machine's results
+        order = order[np.arange(len(order)) - np.repeat(np.cumsum(per_machine) - per_machine, per_machine) < top_k]
+        per_machine = np.minimum(per_machine, top_k)
+    names, scores = cg.names(candidate_ids[order]), scores[order].tolist()
+    res = [list(zip(names[end - c:end], scores[end - c:end])) for end, c in zip(np.cumsum(per_machine).tolist(), per_machine.tolist())]
+    if watch is not None: watch.lap('sort')
+    return res
+
 
 def neighbour_intersection(graph: Graph, list_state: List[Node],
                            candidate_types: List[NodeType] = None, bad_candidate_types: List[NodeType] = None,
                            neighbour_types: List[NodeType] = None, bad_neighbour_types: List[NodeType] = None,
-                           check_necessity = True, check_sufficiency = True) -> List[Tuple[Node, int]]:
+                           check_necessity = True, check_sufficiency = True, top_k: int = None, profiler: Profiler = None) -> List[Tuple[Node, int]]:
     '''Order nodes by counts of presence in immediate state neighbours
-        (standard candidate and neighbour type filters apply, with the latter acting directly on nodes in list_state in this Scanner)'''
-    if any(bad_args := {arg: v for arg, v in dict(candidate_types = candidate_types, bad_candidate_types = bad_candidate_types, neighbour_types = neighbour_types, bad_neighbour_types = bad_neighbour_types).items() if v is not None and not isinstance(v, list)}):
-        raise TypeError(f'The following arguments should be lists of node types but received these values: {bad_args}')
+        (standard candidate and neighbour type filters apply, with the latter acting directly on nodes in list_state in this Scanner).
+        If top_k is given then only the first top_k entries of the full result are returned (the same ones, in the same order),
+        with necessity/sufficiency checked only as far down the count order as needed.
+        If a Profiler is given (e.g. by a GSM with one) then the phases 'neighbour_intersection.gather', 'neighbour_intersection.filter' and 'neighbour_intersection.sort'
+        are timed (the last two being a single 'neighbour_intersection.select' one when top_k is given) and the 'candidates' and 'filtered_candidates' counters incremented'''
+    _check_type_lists(candidate_types, bad_candidate_types, neighbour_types, bad_neighbour_types)
+    watch = profiler.watch('neighbour_intersection') if profiler is not None else None
 
     filtered_state = graph.type_filter(list_state, neighbour_types, bad_neighbour_types) # The state nodes ARE the totality of neighbours in this Scanner
     res_counts = reduce(add, [Counter(ns) for ns in graph.relevant_neighbours(filtered_state, candidate_types, bad_candidate_types)])
+    if watch is not None: watch.lap('gather', candidates = len(res_counts))
+    if top_k is not None:
+        if not check_necessity and not check_sufficiency: res = res_counts.most_common(top_k)
+        else:
+            res, ordered = [], res_counts.most_common() # Counts only go down, so checking in this order can stop at top_k accepted candidates
+            for start in range(0, len(ordered), chunk_size := max(64, top_k)):
+                ok_candidates = set(graph.necessity_sufficiency_filter(filtered_state, [c for c, _ in ordered[start:start + chunk_size]], check_necessity, check_sufficiency))
+                res += [(c, count) for c, count in ordered[start:start + chunk_size] if c in ok_candidates]
+                if len(res) >= top_k: break
+            res = res[:top_k]
+        if watch is not None: watch.lap('select', filtered_candidates = len(res))
+        return res
     if check_necessity or check_sufficiency:
         ok_candidates = graph.necessity_sufficiency_filter(filtered_state, res_counts.keys(), check_necessity, check_sufficiency)
         for c in set(res_counts.keys()).difference(ok_candidates): del res_counts[c]
-    return res_counts.most_common()
+    if watch is not None: watch.lap('filter', filtered_candidates = len(res_counts))
+    res = res_counts.most_common()
+    if watch is not None: watch.lap('sort')
+    return res
 
 
@@ -1,3 +1,5 @@
+import numpy as np
+
 from typing import *
 Score = Callable[[List[str], List[str]], float]
     # Functions which compare two lists of nodes (e.g. the state and a given node's neighbours) and produce a numerical
@@ -27,3 +29,28 @@ def all_left_match(a: List, b: List) -> int: return int(set(a).issubset(set(b)))
 def all_right_match(a: List, b: List) -> int: return int(set(b).issubset(set(a)))
 
 
+
+# Vectorised equivalents
+
+VectorisedScore = Callable[[np.ndarray, int, int, np.ndarray], np.ndarray]
+    # Batched versions of the above for all candidates at once, taking: the per-candidate sizes of the intersection of the state with
+    # their neighbours, the length of the state list, the size of the state set and the per-candidate neighbour set sizes
+    # NOTE: the by_score Scanner uses these on compiled graphs for the Score functions in the dictionary below (keyed by function),
+    #   falling back to calling the Score function on each candidate for any other Score or if any result is not finite (e.g. division by 0)
+
+vectorised_scores: Dict[Score, VectorisedScore] = {
+    jaccard_similarity:     lambda inter, a_len, a_size, b_size: inter / (a_size + b_size - inter),
+    presence_score:         lambda inter, a_len, a_size, b_size: inter / a_len,
+    reverse_presence_score: lambda inter, a_len, a_size, b_size: inter / b_size,
+    perfect_match:          lambda inter, a_len, a_size, b_size: ((inter == a_size) & (inter == b_size)).astype(np.int64),
+    all_left_match:         lambda inter, a_len, a_size, b_size: (inter == a_size).astype(np.int64),
+    all_right_match:        lambda inter, a_len, a_size, b_size: (inter == b_size).astype(np.int64)
+}
+
+inter_bounded_scores: Dict[Score, Callable[[int, int, int], float]] = {
+    presence_score: lambda inter_bound, a_len, a_size: inter_bound / a_len,
+    all_left_match: lambda inter_bound, a_len, a_size: int(inter_bound >= a_size)
+}
+    # Upper bounds of the Score functions which are non-decreasing in the intersection size and independent of the candidate list otherwise,
+    #   given an upper bound of the intersection size, the length of the state list and the size of the state set
+    # NOTE: the by_score Scanner uses these to prune candidates in top-k scans (on the standard path), bounding intersection sizes by numbers of adjacent state nodes
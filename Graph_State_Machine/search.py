@@ -0,0 +1,74 @@
+from heapq import heappush, heappop, nlargest
+from itertools import count
+
+from Graph_State_Machine.gsm import GSM
+from Graph_State_Machine.log import GSMLog
+from Graph_State_Machine.cache import ScanCache
+from Graph_State_Machine.selectors import identity
+from Graph_State_Machine.scanners import by_score
+from Graph_State_Machine.updaters import list_accumulator
+from Graph_State_Machine.types import *
+
+Path = List[Tuple[Node, Any]] # The (node, scan score) pairs chosen at each step
+PathScore = Callable[[Path], float]
+
+
+def score_sum(path: Path) -> float: return sum(s for _, s in path)
+
+def score_mean(path: Path) -> float: return sum(s for _, s in path) / len(path) if path else 0.0
+
+
+def search(graph: Graph, state: State, *scanners_arguments: Union[List, Dict], node_scanner: Scanner = by_score(), state_updater: Updater = list_accumulator,
+           selector: Selector = identity, path_score: PathScore = score_sum, strategy = 'beam', beam_width = 10, branching = 3,
+           max_expansions: int = None, max_frontier = 10000, results: int = None, state_key: Callable[[List[Node]], Hashable] = frozenset,
+           incremental = True, scan_cache: ScanCache = None) -> List[Tuple[float, State, Path]]:
+    '''Search for the best sequences of the given steps (arguments as for GSM.consecutive_steps) from the given state, branching on the first branching
+        entries of each scan (each branch's state being produced by the Updater as if that entry had been the top one) and ranking paths by path_score;
+        returns (path score, final state, path) triples of complete paths, best first.
+        - strategy 'beam': advance all paths one step at a time, keeping only the beam_width best after each step (and returning those)
+        - strategy 'best_first': always expand the best path so far (not necessarily complete), stopping after results complete paths (default beam_width)
+            or max_expansions expansions, and discarding the worst paths beyond max_frontier
+        Branches reaching states with the same state_key(selector(state)) (by default the same node set) after the same number of steps are merged, keeping the best;
+        branches whose scan has no result are dropped.
+        All branches share the graph (unless an Updater returns a new one for a branch) and a single scanning machine,
+        whose IncrementalScan data (on compiled graphs, unless incremental is False) moves between branches by their state differences;
+        OrderedState States (with state_updater = ordered_accumulator) also make branch states share storage'''
+    if strategy not in ('beam', 'best_first'): raise ValueError(f"Unknown search strategy '{strategy}'; the available ones are 'beam' and 'best_first'")
+    machine = GSM(graph, state, node_scanner, state_updater, selector, incremental = incremental, log = GSMLog('off'), scan_cache = scan_cache)
+    steps = [machine._ensure_scanner_args_are_named(ss) for ss in scanners_arguments]
+
+    def children(st: State, g: Graph, path: Path) -> Iterator[Tuple[Hashable, float, State, Graph, Path]]:
+        machine.state, machine.graph = st, g
+        for c, s in machine._scan(**steps[len(path)], top_k = branching):
+            child, child_graph = state_updater(st, g, [(c, s)])
+            yield (len(path) + 1, state_key(selector(child))), path_score(child_path := path + [(c, s)]), child, child_graph, child_path
+
+    if strategy == 'beam':
+        frontier = [(path_score([]), state, graph, [])]
+        for _ in steps:
+            best = {}
+            for _, st, g, path in frontier:
+                for key, score, child, child_graph, child_path in children(st, g, path):
+                    if key not in best or score > best[key][0]: best[key] = (score, child, child_graph, child_path)
+            frontier = nlargest(beam_width, best.values(), key = lambda b: b[0])
+        return [(score, st, path) for score, st, _, path in frontier[:results]]
+
+    ties, seen, res, expansions = count(), {}, [], 0
+    heap = [(-path_score([]), next(ties), None, state, graph, [])]
+    while heap and len(res) < (results if results is not None else beam_width) and (max_expansions is None or expansions < max_expansions):
+        negative_score, _, key, st, g, path = heappop(heap)
+        if key is not None and seen.setdefault(key, -negative_score) > -negative_score: continue # Superseded by a better branch reaching the same state
+        if len(path) == len(steps):
+            res.append((-negative_score, st, path))
+            continue
+        expansions += 1
+        for key, score, child, child_graph, child_path in children(st, g, path):
+            if key not in seen or score > seen[key]:
+                seen[key] = score
+                heappush(heap, (-score, next(ties), key, child, child_graph, child_path))
+        if len(heap) > max_frontier: # A sorted list is a valid heap; dropped branches are forgotten, so that others may reach their states again
+            heap.sort()
+            for negative_score, _, key, *_ in heap[max_frontier:]:
+                if key is not None and seen.get(key) == -negative_score: del seen[key]
+            del heap[max_frontier:]
+    return res
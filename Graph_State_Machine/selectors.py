@@ -1,4 +1,5 @@
 from functools import reduce
+from itertools import chain
 from operator import concat
 
 from Graph_State_Machine.types import *
@@ -17,4 +18,8 @@ def dict_fields_getter(dict_keys: List[str] = None) -> Selector:
     def all_dict_fields_closure(state: State) -> List[Node]: return list(reduce(concat, state.values()))
     return selected_fields_closure if dict_keys else all_dict_fields_closure
 
-
+def dict_state_fields_getter(dict_keys: List[str] = None) -> Selector:
+    '''Equivalent of dict_fields_getter for DictState States (or any dictionary of node sequences), concatenating the fields without combining them into new States'''
+    def selected_fields_closure(state: State) -> List[Node]: return list(chain.from_iterable(state[k] for k in dict_keys))
+    def all_dict_fields_closure(state: State) -> List[Node]: return list(chain.from_iterable(state.values()))
+    return selected_fields_closure if dict_keys else all_dict_fields_closure
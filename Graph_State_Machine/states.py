@@ -0,0 +1,114 @@
+from collections.abc import Mapping, Sequence
+from itertools import chain, islice
+from threading import Lock
+
+from Graph_State_Machine.types import *
+
+
+class _Buffer:
+    '''Append-only node list shared by the versions of an OrderedState, with the position of the first occurrence of each node'''
+    __slots__ = ('nodes', 'first', 'lock')
+
+    def __init__(self, nodes: Iterable[Node] = ()):
+        self.nodes, self.first, self.lock = [], {}, Lock()
+        for n in nodes: self.append(n)
+
+    def append(self, n: Node):
+        self.first.setdefault(n, len(self.nodes))
+        self.nodes.append(n)
+
+
+class OrderedState(Sequence):
+    '''Persistent (i.e. immutable, with structurally shared versions) list-like State of nodes in insertion order, duplicates included,
+        with O(1) membership tests and O(1) appends (see plus, and the ordered_accumulator Updaters):
+        a state and the ones derived from it by appending share a single buffer, each version seeing a prefix of it, so keeping old states (e.g. as history)
+        costs nothing; only appending to a state which already has a longer descendant (i.e. branching) copies it.
+        It compares equal to lists and tuples with the same nodes, is hashable, and works with the identity and last_only Selectors;
+        slices are lists, and + appends (so that list_accumulator also works on it)'''
+    __slots__ = ('_buffer', '_length', '_hash')
+
+    def __init__(self, nodes: Iterable[Node] = ()):
+        self._buffer, self._hash = _Buffer(nodes), None
+        self._length = len(self._buffer.nodes)
+
+    @classmethod
+    def _version(cls, buffer: _Buffer, length: int) -> 'OrderedState':
+        res = cls.__new__(cls)
+        res._buffer, res._length, res._hash = buffer, length, None
+        return res
+
+    def plus(self, *nodes: Node) -> 'OrderedState':
+        '''New state with the given nodes appended; this one is unaffected'''
+        buffer = self._buffer
+        with buffer.lock:
+            if self._length == len(buffer.nodes): # Latest version: extend the shared buffer
+                for n in nodes: buffer.append(n)
+                return self._version(buffer, len(buffer.nodes))
+        return OrderedState(chain(islice(buffer.nodes, self._length), nodes))
+
+    def extends(self, other: Sequence) -> bool:
+        '''Whether other is a prefix of this state (in O(1) if other is an earlier version of it)'''
+        if isinstance(other, OrderedState) and other._buffer is self._buffer: return other._length <= self._length
+        return len(other) <= self._length and self[:len(other)] == list(other)
+
+    def __contains__(self, n: Node) -> bool: return (i := self._buffer.first.get(n)) is not None and i < self._length
+
+    def index(self, n: Node, *args) -> int:
+        if not args and n in self: return self._buffer.first[n]
+        return super().index(n, *args)
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice): return [self._buffer.nodes[j] for j in range(*i.indices(self._length))]
+        if not -self._length <= i < self._length: raise IndexError('OrderedState index out of range')
+        return self._buffer.nodes[i % self._length]
+
+    def __iter__(self): return islice(self._buffer.nodes, self._length)
+    def __len__(self): return self._length
+    def __add__(self, nodes: Iterable[Node]) -> 'OrderedState': return self.plus(*nodes)
+    def __radd__(self, nodes: Iterable[Node]) -> List[Node]: return list(nodes) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, OrderedState) and other._buffer is self._buffer: return other._length == self._length
+        return isinstance(other, (OrderedState, list, tuple)) and len(other) == self._length and all(a == b for a, b in zip(self, other))
+
+    def __hash__(self):
+        if self._hash is None: self._hash = hash(tuple(self))
+        return self._hash
+
+    def __repr__(self): return f'OrderedState({list(self)})'
+    def __reduce__(self): return OrderedState, (list(self),)
+    def __copy__(self): return self
+    def __deepcopy__(self, memo): return self # Immutable
+
+
+class DictState(Mapping):
+    '''Persistent dictionary of OrderedState fields, i.e. the Dict[str, List[Node]] State usage (see dict_fields_getter and list_in_dict_accumulator)
+        with O(1) appends to a field (see plus and the dict_state_accumulator Updater) which share all other fields with the previous state.
+        It compares equal to dictionaries of lists with the same nodes and is hashable'''
+    __slots__ = ('_fields', '_hash')
+
+    def __init__(self, fields: Mapping[str, Iterable[Node]] = None, **kwargs: Iterable[Node]):
+        self._fields = {k: v if isinstance(v, OrderedState) else OrderedState(v) for k, v in dict(fields if fields else {}, **kwargs).items()}
+        self._hash = None
+
+    def plus(self, key: str, *nodes: Node) -> 'DictState':
+        '''New state with the given nodes appended to the key field (created if missing); this one is unaffected'''
+        res = DictState.__new__(DictState)
+        res._fields, res._hash = dict(self._fields), None
+        res._fields[key] = (self._fields[key] if key in self._fields else OrderedState()).plus(*nodes)
+        return res
+
+    def has_node(self, n: Node) -> bool: return any(n in v for v in self._fields.values())
+
+    def __getitem__(self, key: str) -> OrderedState: return self._fields[key]
+    def __iter__(self): return iter(self._fields)
+    def __len__(self): return len(self._fields)
+
+    def __hash__(self):
+        if self._hash is None: self._hash = hash(frozenset(self._fields.items()))
+        return self._hash
+
+    def __repr__(self): return f'DictState({ {k: list(v) for k, v in self._fields.items()} })'
+    def __reduce__(self): return DictState, ({k: list(v) for k, v in self._fields.items()},)
+    def __copy__(self): return self
+    def __deepcopy__(self, memo): return self # Immutable
@@ -1,15 +1,14 @@
-from warnings import warn
 from copy import deepcopy
 
 from Graph_State_Machine.types import *
 
+# Empty scan results leave states unchanged, which GSMs report as 'no_candidates' step outcomes (see outcomes.py) rather than Updaters warning about it
+
 
 def list_accumulator(state: State, graph: Graph, scan_result: ScanResult) -> Tuple[State, Graph]:
     '''Never removes from state and adds the highest scoring node from step_result to a simple-list state'''
     if scan_result:  return state + [scan_result[0][0]], graph
-    else:
-        warn('A Scanner returned no result: no appropriate candidates identified')
-        return state, graph
+    else: return state, graph
 
 
 def list_in_dict_accumulator(dict_key: str) -> Updater:
@@ -19,17 +18,31 @@ def list_in_dict_accumulator(dict_key: str) -> Updater:
             new_state = deepcopy(state)
             new_state[dict_key].append(scan_result[0][0])
             return new_state, graph
-        else:
-            warn('A Scanner returned no result: no appropriate candidates identified')
-            return state, graph
+        else: return state, graph
     return dict_accumulator_closure
 
 
 def list_accumulator_greedy(state: State, graph: Graph, scan_result: ScanResult) -> Tuple[State, Graph]:
     '''Never removes from state and adds ALL NODES from step_result to a simple-list state'''
     if scan_result:  return state + scan_result[0], graph
-    else:
-        warn('A Scanner returned no result: no appropriate candidates identified')
-        return state, graph
+    else: return state, graph
+
+
+def ordered_accumulator(state: State, graph: Graph, scan_result: ScanResult) -> Tuple[State, Graph]:
+    '''Equivalent of list_accumulator for OrderedState States: appends the highest scoring node in O(1), sharing storage with the previous state'''
+    if scan_result: return state.plus(scan_result[0][0]), graph
+    else: return state, graph
+
+
+def ordered_accumulator_greedy(state: State, graph: Graph, scan_result: ScanResult) -> Tuple[State, Graph]:
+    '''Never removes from state and appends ALL NODES from step_result to an OrderedState State'''
+    if scan_result: return state.plus(*(n for n, _ in scan_result)), graph
+    else: return state, graph
 
 
+def dict_state_accumulator(dict_key: str) -> Updater:
+    def dict_state_accumulator_closure(state: State, graph: Graph, scan_result: ScanResult) -> Tuple[State, Graph]:
+        f'''Equivalent of list_in_dict_accumulator for DictState States: appends the highest scoring node to the {dict_key} field in O(1), without copying the state'''
+        if scan_result: return state.plus(dict_key, scan_result[0][0]), graph
+        else: return state, graph
+    return dict_state_accumulator_closure
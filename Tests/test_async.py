@@ -0,0 +1,42 @@
+import asyncio
+import time
+import warnings
+
+import pytest
+
+from Graph_State_Machine import *
+
+
+def small_graph(): return Graph(dict(A = dict(a1 = ['b1', 'b2'], a2 = ['b2']), B = dict(b1 = [], b2 = [])))
+
+
+def test_async_steps_match_sync_ones():
+    graph = small_graph()
+    async def main():
+        machines = [GSM(graph, [b]) for b in ['b1', 'b2']]
+        await asyncio.gather(*(m.astep(['A']) for m in machines)) # Concurrent machines over one shared graph
+        streamed = [list(gsm.state) async for gsm in GSM(graph, ['b2']).astream([['A']], [['B']])]
+        parallel = await GSM(graph, ['b2']).aparallel_steps([['A']], [['B']])
+        return [m.state for m in machines], streamed, parallel.state
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        states, streamed, parallel = asyncio.run(main())
+        assert states == [GSM(graph, [b]).step(['A']).state for b in ['b1', 'b2']]
+        assert streamed == [GSM(graph, ['b2']).step(['A']).state, GSM(graph, ['b2']).consecutive_steps([['A']], [['B']]).state]
+        assert parallel == GSM(graph, ['b2']).parallel_steps([['A']], [['B']]).state
+
+
+def test_async_timeout_and_cancellation_leave_state_unchanged():
+    def slow_scanner(graph, list_state, candidate_types = None):
+        time.sleep(0.2)
+        return by_score()(graph, list_state, candidate_types)
+    async def main():
+        gsm = GSM(small_graph(), ['b2'], slow_scanner)
+        with pytest.raises(asyncio.TimeoutError): await gsm.astep(['A'], timeout = 0.01)
+        task = asyncio.create_task(gsm.astep(['A']))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError): await task
+        assert gsm.state == ['b2'] and len(gsm.log) == 1
+        return (await gsm.astep(['A'])).state
+    assert asyncio.run(main()) == ['b2', 'a2']
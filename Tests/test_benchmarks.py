@@ -0,0 +1,8 @@
+from Benchmarks.suite import run, compare, cases
+
+
+def test_benchmarks_run_and_compare():
+    report = run('tiny', repeats = 1)
+    assert set(report['results']) == set(cases())
+    assert all(r['seconds_min'] > 0 and r['peak_bytes'] >= 0 for r in report['results'].values())
+    assert not any(r['regression'] for r in compare(report, report))
@@ -0,0 +1,36 @@
+import warnings
+
+from Graph_State_Machine import *
+
+
+def small_graph(): return Graph(dict(A = dict(a1 = ['b1', 'b2'], a2 = ['b2']), B = dict(b1 = [], b2 = [])))
+
+
+def test_cached_scans_match_and_invalidate():
+    now = [0.0]
+    cache = ScanCache(maxsize = 2, ttl = 10, clock = lambda: now[0])
+    graph = small_graph()
+    plain, cached = GSM(graph, ['b2']), GSM(graph, ['b2'], scan_cache = cache)
+    assert cached._scan(['A']) == plain._scan(['A']) and cached._scan(candidate_types = ['A']) == plain._scan(['A'])
+    assert cache.info()['hits'] == 1 and cache.info()['misses'] == 1
+    cached._scan(['A'], top_k = 1)
+    GSM(graph, ['b2'], scan_cache = cache)._scan(['B']) # Shared cache; evicts the least recently used entry
+    assert cache.info()['evictions'] == 1 and len(cache) == 2
+
+    extended = cached.extend_with(Graph(dict(A = dict(a3 = ['b2']), B = dict(b2 = []))))
+    assert [n for n, _ in extended._scan(['A'])] == [n for n, _ in GSM(extended.graph, ['b2'])._scan(['A'])] and 'a3' in dict(extended._scan(['A']))
+    graph.G.add_edge('a1', 'b3', **{})
+    graph.G.nodes['b3']['node_type'] = 'B'
+    graph._set_graph(graph.G)
+    misses = cache.info()['misses']
+    cached._scan(['A'])
+    assert cache.info()['misses'] == misses + 1
+
+    now[0] = 20.0
+    cached._scan(['A'])
+    assert cache.info()['expirations'] == 1
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        assert GSM(small_graph(), ['b2'], scan_cache = cache).consecutive_steps([['A']], [['B']]).state == \
+            GSM(small_graph(), ['b2']).consecutive_steps([['A']], [['B']]).state
@@ -0,0 +1,245 @@
+import pickle
+import random
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+import warnings
+import pytest
+import numpy as np
+import networkx as nx
+
+from Graph_State_Machine import *
+from Graph_State_Machine.compiled import CompiledGraph
+from Graph_State_Machine.scores import reverse_presence_score, perfect_match, all_left_match, all_right_match
+
+
+def random_typed_adjacencies(n_nodes = 120, n_types = 4, max_degree = 6, seed = 0):
+    '''Small random TypedAdjacencies with plain, necessary and (jointly) sufficient edges, all declared towards earlier nodes (so never symmetric)'''
+    rng = random.Random(seed)
+    types = [f'T{i}' for i in range(n_types)]
+    nodes = [f'n{i:03d}' for i in range(n_nodes)]
+    tas = {t: {} for t in types}
+    for i, n in enumerate(nodes):
+        ends = rng.sample(nodes[:i], min(i, rng.randint(1, max_degree))) if i else []
+        kinds = dict(plain = [], are_necessary = [], are_sufficient = [])
+        for e in ends: kinds[rng.choice(['plain', 'plain', 'are_necessary', 'are_sufficient'])].append(e)
+        if len(kinds['are_sufficient']) > 2: kinds['are_sufficient'] = [kinds['are_sufficient'][:2]] + kinds['are_sufficient'][2:] # One joint sufficiency
+        tas[rng.choice(types)][n] = {k: v for k, v in kinds.items() if v} if rng.random() < 0.7 else ends
+    return tas
+
+
+def outcome(f, *args, **kwargs):
+    '''Result of a call or the type of exception it raised, so that paths can be compared on failures too'''
+    try: return f(*args, **kwargs)
+    except Exception as e: return type(e)
+
+
+def graph_pair(**kwargs):
+    tas = random_typed_adjacencies(**kwargs)
+    return Graph(tas, warn_about_problematic_sufficiencies = False), Graph(tas, warn_about_problematic_sufficiencies = False, compiled = True)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_compiled_scans_match(seed):
+    plain, compiled = graph_pair(seed = seed)
+    rng = random.Random(seed)
+    scanners = [by_score(), by_score(presence_score), by_score(jaccard_similarity, check_only_state_types = True), neighbour_intersection,
+                by_score(reverse_presence_score), by_score(perfect_match), by_score(all_left_match), by_score(all_right_match),
+                by_score(lambda a, b: len(b) - len(a))] # Not vectorised
+    for _ in range(20):
+        state = rng.sample(list(plain.G.nodes), rng.randint(1, 8))
+        for scanner in scanners:
+            for args in [dict(), dict(candidate_types = ['T1', 'T2']), dict(bad_candidate_types = ['T0'], neighbour_types = ['T0', 'T3']),
+                         dict(check_necessity = False), dict(check_sufficiency = False)]:
+                assert outcome(scanner, plain, state, **args) == outcome(scanner, compiled, state, **args)
+
+
+def test_compiled_filters_match():
+    plain, compiled = graph_pair(seed = 7)
+    nodes = list(plain.G.nodes)
+    assert plain.type_filter(nodes[:30], ['T1']) == compiled.type_filter(nodes[:30], ['T1'])
+    assert plain.type_filter(None, None, ['T2']) == compiled.type_filter(None, None, ['T2'])
+    assert plain.relevant_neighbours(nodes[::7], bad_types = ['T3']) == compiled.relevant_neighbours(nodes[::7], bad_types = ['T3'])
+    for only_state_types in [False, True]:
+        assert plain.necessity_sufficiency_filter(nodes[:40], nodes, check_only_state_types = only_state_types) == \
+            compiled.necessity_sufficiency_filter(nodes[:40], nodes, check_only_state_types = only_state_types)
+
+
+def test_necessity_sufficiency_masks():
+    tas = {'A': {'a1': [], 'a2': [], 'c': dict(are_necessary = ['a1'], are_sufficient = [['a2', 'b1'], 'b2']), 'free': ['a1']}, 'B': {'b1': [], 'b2': []}}
+    cg = Graph(tas, compiled = True).compiled
+    mask = lambda state, **kwargs: cg.necessity_sufficiency_mask(cg.ids(state), cg.ids(['c', 'free']), **kwargs).tolist()
+    assert mask([]) == mask(['a1', 'a2']) == mask(['a1', 'b1']) == [False, True] # Joint sets need all their members
+    assert mask(['a1', 'a2', 'b1']) == mask(['a1', 'b2']) == [True, True]
+    assert mask(['a2', 'b1']) == [False, True] and mask(['a2', 'b1'], check_necessity = False) == [True, True]
+    assert mask(['a1'], check_sufficiency = False) == [True, True] and mask(['a1', 'a2'], check_only_state_types = True) == [True, True]
+    assert mask(['a2'], check_only_state_types = True) == [False, True] and mask(['b1'], check_only_state_types = True) == [True, True]
+    assert cg.names(np.flatnonzero(cg.nec_suff_ok_mask(cg.ids(['a1']), check_only_state_types = True))) == ['a1', 'b1', 'b2']
+    assert cg.names(np.flatnonzero(cg.nec_suff_ok_mask(cg.ids(['a1', 'b2'])))) == ['a1', 'b2']
+
+
+@pytest.mark.parametrize('scanner', [by_score(), by_score(presence_score, check_only_state_types = True), by_score(all_left_match, check_sufficiency = False)])
+def test_incremental_steps_match(scanner):
+    plain, compiled = graph_pair(seed = 11)
+    rng = random.Random(11)
+    for _ in range(5):
+        start = rng.sample(list(plain.G.nodes), 2)
+        full, incremental = GSM(plain, list(start), scanner), GSM(compiled, list(start), scanner, incremental = True)
+        for _ in range(12):
+            args = dict(candidate_types = rng.choice([['T0', 'T1', 'T2', 'T3'], ['T1', 'T2'], ['T3']]), **rng.choice([dict(), dict(neighbour_types = ['T0', 'T3']), dict(check_necessity = False)]))
+            assert outcome(full._scan, **args) == outcome(incremental._scan, **args)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                full.step(**args), incremental.step(**args)
+            assert full.state == incremental.state
+        incremental.state = incremental.state[:3] # Not an extension of the previous state: data is rebuilt
+        assert incremental._scan() == scanner(plain, incremental.state)
+
+
+@pytest.mark.parametrize('scanner', [by_score(), by_score(presence_score, check_only_state_types = True), neighbour_intersection])
+def test_batch_matches_individual_machines(scanner):
+    plain, compiled = graph_pair(seed = 5)
+    rng = random.Random(5)
+    starts = [rng.sample(list(plain.G.nodes), rng.randint(1, 4)) for _ in range(30)]
+    plan = [dict(candidate_types = ['T1', 'T2']), dict(candidate_types = ['T0', 'T3']), dict(candidate_types = ['T3'], neighbour_types = ['T0', 'T1'])] * 3
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        states, logs = GSMBatch(compiled, starts, scanner).run(*plan)
+        for start, state, log in zip(starts, states, logs):
+            assert state == GSM(plain, list(start), scanner).consecutive_steps(*plan).state
+            assert len(log) == 1 + len(plan)
+
+
+def test_graph_file_round_trip(tmp_path):
+    plain, compiled = graph_pair(seed = 3)
+    plain.G.add_node('ünïcode', node_type = 'T0')
+    plain.G.add_edge('ünïcode', 'n000')
+    plain._set_graph(plain.G, False)
+    plain.save(str(path := tmp_path / 'graph.gsm'))
+    loaded = Graph.load(str(path))
+    assert (loaded.types, loaded.nodes_to_types, loaded.colour_map, loaded.default_cols) == (plain.types, plain.nodes_to_types, plain.colour_map, plain.default_cols)
+    rng = random.Random(3)
+    for _ in range(10):
+        state = rng.sample(list(plain.G.nodes), rng.randint(1, 6))
+        for scanner in [by_score(), by_score(jaccard_similarity, check_only_state_types = True), neighbour_intersection]:
+            assert outcome(scanner, loaded, state) == outcome(scanner, plain, state)
+    assert list(loaded.G.nodes(data = True)) == list(plain.G.nodes(data = True))
+    assert [list(loaded.G.adj[n]) for n in loaded.G] == [list(plain.G.adj[n]) for n in plain.G]
+
+
+def test_parallel_matches_sequential():
+    plain, compiled = graph_pair(seed = 5)
+    rng = random.Random(5)
+    starts = [rng.sample(list(plain.G.nodes), rng.randint(1, 4)) for _ in range(12)]
+    plan = [dict(candidate_types = ['T1', 'T2']), dict(candidate_types = ['T0', 'T3'])] * 2
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = sorted(run_parallel(compiled, starts, *plan, processes = 2))
+        assert [i for i, _, _ in results] == list(range(len(starts)))
+        for (_, state, log), start in zip(results, starts):
+            assert state == GSM(plain, list(start)).consecutive_steps(*plan).state
+            assert len(log) == len(plan)
+
+
+def type_filtered_neighbours_match(graph):
+    '''Whether type-filtered neighbour lookups match filtering neighbours by their type attributes, for some type selections'''
+    nodes = list(graph.G)
+    by_attribute = lambda good: [[m for m in graph.G._adj[n] if graph.G._node[m]['node_type'] in good] for n in nodes]
+    return all(graph.relevant_neighbours(nodes, good) == by_attribute(good) for good in [['T0'], ['T1', 'T3'], ['T2', 'T4'], list(graph.types)])
+
+
+def test_extension_overlay_matches_compose():
+    base_tas, extension_tas = random_typed_adjacencies(seed = 13), random_typed_adjacencies(n_nodes = 30, n_types = 5, seed = 14)
+    rename = lambda x: [rename(y) for y in x] if isinstance(x, list) else {k: rename(v) for k, v in x.items()} if isinstance(x, dict) else x if int(x[1:]) % 3 else f'x{x}'
+    extension_tas = {t: {rename(n): rename(es) for n, es in ns.items()} for t, ns in extension_tas.items()} # A third of the nodes are new ones
+    for compiled in [False, True]:
+        base = Graph(base_tas, warn_about_problematic_sufficiencies = False, compiled = compiled)
+        if not compiled: assert not base.neighbours_by_type.cache and type_filtered_neighbours_match(base) # Filling the index before extension
+        base_nodes, base_edges = list(base.G.nodes(data = True)), list(base.G.edges)
+        extension = Graph(extension_tas, warn_about_problematic_sufficiencies = False)
+        extended = base.extend_with(extension, False)
+        composed = nx.compose(base.G, extension.G)
+        assert list(extended.G.nodes(data = True)) == list(composed.nodes(data = True)) and nx.utils.edges_equal(extended.G.edges, composed.edges)
+        assert list(base.G.nodes(data = True)) == base_nodes and list(base.G.edges) == base_edges
+        assert (extended.types, extended.nodes_to_types) == ((full := Graph(composed, warn_about_problematic_sufficiencies = False)).types, full.nodes_to_types)
+        if compiled:
+            fresh = CompiledGraph.from_networkx(extended.G)
+            assert extended.compiled.types == fresh.types and extended.compiled.nodes == fresh.nodes
+            for a in CompiledGraph.array_names: assert np.array_equal(getattr(extended.compiled, a), getattr(fresh, a)), a
+        else:
+            assert type_filtered_neighbours_match(base) and type_filtered_neighbours_match(extended)
+            assert len(extended.neighbours_by_type.cache) == len(extended.G) and len(base.neighbours_by_type.cache) == len(base.G) # Filled on lookup only
+
+    snapshot = lambda G: ([(n, dict(d)) for n, d in G._node.items()], [(a, b, dict(d)) for a, nbrs in G._adj.items() for b, d in nbrs.items()])
+    extension = Graph(dict(C = dict(c1 = ['a1']), A = dict(a1 = [])))
+    for frozen in [False, True]: # Modifying the result in place (even through a machine) does not affect the base
+        base = Graph(dict(A = dict(a1 = ['b1'], a2 = ['b1', 'b2']), B = dict(b1 = [], b2 = [])))
+        if frozen: base.freeze()
+        before = snapshot(base.G)
+        extended = base.extend_with(extension)
+        extended.G.add_edge('a2', 'b2', foo = 1), extended.G.remove_edge('a2', 'b1'), extended.G.add_node('b1', x = 1)
+        extended.G.nodes['b2']['node_type'], extended.G.edges['a1', 'b1']['w'] = 'Z', 2
+        assert extended.G['b1']['a1'] == {'w': 2} and extended.G.nodes['b2'] == dict(node_type = 'Z') and not extended.G.has_edge('a2', 'b1')
+        GSM(base, ['b1']).extend_with(extension).graph.G.add_edge('b1', 'b2')
+        extended.G.remove_node('b1'), extended.G.clear_edges()
+        assert snapshot(base.G) == before and base.plain_edges('b1') == ['a1', 'a2']
+
+    extended = base.extend_with(extension)
+    extended.G.nodes['b1'], extended.G.edges['a1', 'b1'], extended.G['a1'] # Caching the views
+    for copied in [pickle.loads(pickle.dumps(extended)), deepcopy(extended)]:
+        assert copied.G.nodes['b1'] == dict(node_type = 'B') and copied.G.edges['a1', 'b1'] == {} and list(copied.G['a1']) == ['b1', 'c1']
+        copied.G.nodes['b1']['x'], copied.G.edges['a1', 'b1']['w'] = 1, 2
+        assert snapshot(extended.G) == snapshot(extended.fork().G) and 'x' not in extended.G.nodes['b1'] and extended.G.edges['a1', 'b1'] == {}
+        assert copied.G.edges['b1', 'a1'] == {'w': 2} and copied.G.nodes(data = True)['b1'] == dict(node_type = 'B', x = 1)
+
+
+def test_streaming_construction_matches_dict():
+    tas = random_typed_adjacencies(seed = 17)
+    tas['T1']['n005'] = ['n001', 'undeclared'] # A redeclared node (with a new type) and an edge to an undeclared one
+    records = lambda tas: ((nt, n, many) for nt, one_to_many in tas.items() for n, many in one_to_many.items())
+    full = Graph.read_typed_adjacency_list(tas)
+    for chunk_size in [1, 7, 1000]:
+        streamed = Graph.read_typed_adjacency_stream(records(tas), chunk_size = chunk_size)
+        assert list(streamed.nodes(data = True)) == list(full.nodes(data = True))
+        assert [list(streamed.adj[n]) for n in streamed] == [list(full.adj[n]) for n in full]
+    with pytest.raises(ValueError):
+        Graph.read_typed_adjacency_stream(records(dict(A = dict(a = dict(are_necessary = ['b']), b = dict(are_necessary = ['a'])))), chunk_size = 1)
+    with pytest.raises(AssertionError):
+        Graph.read_typed_adjacency_stream(records(dict(A = dict(a = dict(are_needed = ['b']), b = []))))
+
+
+@pytest.mark.parametrize('top_k', [1, 3, 50])
+def test_top_k_matches_full_scans(top_k):
+    plain, compiled = graph_pair(seed = 19, n_nodes = 400, max_degree = 25)
+    rng = random.Random(19)
+    scanners = [by_score(), by_score(presence_score), by_score(all_left_match, check_sufficiency = False), by_score(presence_score, check_only_state_types = True), neighbour_intersection]
+    states = [rng.sample(list(plain.G.nodes), rng.randint(1, 10)) for _ in range(15)]
+    for scanner in scanners:
+        for args in [dict(), dict(candidate_types = ['T1', 'T2']), dict(neighbour_types = ['T0', 'T3'], check_necessity = False)]:
+            for graph in [plain, compiled]:
+                for state in states: assert outcome(scanner, graph, state, top_k = top_k, **args) == (r[:top_k] if isinstance(r := outcome(scanner, graph, state, **args), list) else r)
+            if scanner is not neighbour_intersection:
+                assert scanner.batch(compiled, states, top_k = top_k, **args) == [r[:top_k] for r in scanner.batch(compiled, states, **args)]
+    gsm, reference = GSM(compiled, states[0][:2], incremental = True), GSM(plain, states[0][:2])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for types in [['T1'], ['T2', 'T3'], ['T0']]:
+            gsm.step(types, top_k = top_k), reference.step(types)
+            assert gsm.state == reference.state and gsm.log[-1]['scan_result'] == reference.log[-1]['scan_result'][:top_k]
+
+
+def test_frozen_graph_sharing_and_fork():
+    graph = Graph(dict(A = dict(a1 = ['b1', 'b2'], a2 = dict(plain = ['b1'], are_necessary = ['b2'])), B = dict(b1 = [], b2 = [])), compiled = True).freeze()
+    states = [['b1'], ['b2'], ['b1', 'b2']] * 20
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(lambda s: GSM(graph, s)._scan(['A']), states)) == [GSM(graph, s)._scan(['A']) for s in states]
+    with pytest.raises(TypeError): graph.mark_changed()
+    with pytest.raises(nx.NetworkXError): graph.G.add_node('c1')
+    with pytest.raises(ValueError): graph.compiled.indices[0] = 0
+
+    fork = graph.fork()
+    fork.G.add_edge('a2', 'b3')
+    fork.G.nodes['b3']['node_type'] = 'B'
+    fork._set_graph(fork.G)
+    assert 'b3' not in graph.G and 'b3' in fork.nodes_to_types and fork.version != graph.version and not fork.frozen
+    extended = graph.extend_with(Graph(dict(A = dict(a3 = ['b1']), B = dict(b1 = []))))
+    assert not extended.frozen and 'a3' in dict(GSM(extended, ['b1'])._scan(['A']))
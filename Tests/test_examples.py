@@ -7,3 +7,15 @@ def test_dict_state_example():
     import Tests.self_contained_showcase_dict_state
 
 
+
+def test_scanning_does_not_import_plotting_libraries():
+    import subprocess, sys
+    code = '''
+import sys, Graph_State_Machine as gsm
+g = gsm.Graph({'A': {'a1': ['b1'], 'a2': ['b1', 'b2']}, 'B': {'b1': [], 'b2': []}})
+machine = gsm.GSM(g.extend_with(gsm.Graph({'C': {'c1': ['a1']}, 'A': {'a1': []}})), ['b1'])
+machine.consecutive_steps([['A']], [['C']])
+assert machine.state == ['b1', 'a1', 'c1'], machine.state
+print(sorted({m.split('.')[0] for m in sys.modules} & {'matplotlib', 'plotly'}))
+'''
+    assert subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, check = True).stdout.split() == ['[]']
@@ -0,0 +1,104 @@
+import gc
+import json
+import pickle
+import warnings
+
+from Graph_State_Machine import *
+from Graph_State_Machine.log import LogRecord
+from Graph_State_Machine.scores import vectorised_scores
+
+
+def small_graph(): return Graph(dict(A = dict(a1 = ['b1', 'b2'], a2 = ['b2']), B = dict(b1 = [], b2 = [])))
+
+
+def test_records_read_like_dicts():
+    record = LogRecord('step', scan_result = [('a1', 1.0)], scanner_arguments = dict(candidate_types = ['A']))
+    assert record == dict(method = 'step', scan_result = [('a1', 1.0)], scanner_arguments = dict(candidate_types = ['A']))
+    assert record['scan_result'][0] == ('a1', 1.0) and record.get('missing') is None and 'scanner_arguments' in record
+    assert repr(record) == repr(dict(record))
+    assert pickle.loads(pickle.dumps(record)) == record
+    assert LogRecord('step', scan_result = [], scanner_arguments = {}).fields is record.fields # Shared field tuples
+
+
+def test_log_retention_and_sinks(tmp_path):
+    received = []
+    gsms = [GSM(small_graph(), ['b1'], log = GSMLog(retention, 3, sinks = [received.append, FileSink(str(tmp_path / f'{retention}.jsonl'))]))
+            for retention in ['full', 'ring', 'off']]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for gsm in gsms: gsm.consecutive_steps([['A']], [['A']], [['A']], [['B']])
+    full, ring, off = gsms
+    assert len(full.log) == 5 and full.log[0]['method'] == '__init__' and full.log[-1]['scanner_arguments'] == dict(candidate_types = ['B'])
+    assert list(ring.log) == full.log[-3:] and len(off.log) == 0
+    assert len(received) == 15
+    for gsm in gsms: gsm.log.sinks[1].close()
+    assert [json.loads(line)['method'] for line in open(tmp_path / 'off.jsonl')] == [r['method'] for r in full.log]
+
+
+def test_batch_logs_follow_policy():
+    received = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        states, logs = GSMBatch(small_graph(), [['b1'], ['b2'], ['a1']], log = GSMLog('ring', 2, sinks = [received.append], scan_result_limit = 1)).run([['A']], [['A']], [['B']])
+    assert all(isinstance(log, GSMLog) and log.retention == 'ring' and len(log) == 2 for log in logs) and len(received) == 3 * 4
+    assert all(len(r['scan_result']) <= 1 for r in received if 'scan_result' in r) and logs[0][-1]['scanner_arguments'] == dict(candidate_types = ['B'])
+
+
+def test_log_does_not_keep_graphs_alive():
+    gsm = GSM(small_graph(), ['b1'])
+    assert gsm.log[0]['graph'] is gsm.graph
+    extended = gsm.extend_with(Graph(dict(A = dict(a3 = ['b1']), B = dict(b1 = []))))
+    assert extended.log[0] is gsm.log[0] and extended.log is not gsm.log
+    gsm.graph = None
+    gc.collect()
+    assert gsm.log[0]['graph'] is None
+
+
+def test_profiler_phases_and_hooks():
+    events = []
+    profiler = Profiler(hooks = [lambda phase, seconds, counts: events.append(phase)])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for compiled in [False, True]:
+            graph = Graph(dict(A = dict(a1 = ['b1', 'b2'], a2 = ['b2']), B = dict(b1 = [], b2 = [])), compiled = compiled)
+            plain, profiled = GSM(graph, ['b1']), GSM(graph, ['b1'], profiler = profiler)
+            assert profiled.consecutive_steps([['A']], [['B']]).state == plain.consecutive_steps([['A']], [['B']]).state
+            GSM(graph, ['b2'], neighbour_intersection, profiler = profiler).step(['A'], top_k = 1)
+    stats = profiler.stats
+    assert {'gsm.selector', 'gsm.scan', 'gsm.log', 'gsm.updater', 'gsm.outcome', 'by_score.gather', 'by_score.filter', 'by_score.score', 'by_score.sort',
+            'neighbour_intersection.gather', 'neighbour_intersection.select'} == set(stats.seconds) == set(events)
+    assert stats.calls['gsm.updater'] == stats.counts['steps'] == 6 and stats.calls['by_score.score'] == 4
+    assert stats.counts['candidates'] >= stats.counts['filtered_candidates'] > 0 and stats.counts['scored_candidates'] > 0 and 'by_score.score' in str(stats)
+
+
+def test_profiler_drops_abandoned_vectorised_laps(monkeypatch):
+    score = lambda a, b: len(set(a).intersection(b))
+    monkeypatch.setitem(vectorised_scores, score, lambda inter, a_len, a_size, b_size: inter / 0) # Never finite, hence always falling back to the standard path
+    profiler = Profiler()
+    graph = Graph(dict(A = dict(a1 = ['b1', 'b2'], a2 = ['b2']), B = dict(b1 = [], b2 = [])), compiled = True)
+    assert by_score(score, profiler = profiler)(graph, ['b1', 'b2'], ['A']) == [('a1', 2), ('a2', 1)]
+    assert by_score(score, profiler = profiler).batch(graph, [['b1'], ['b2']], ['A']) == [[('a1', 1)], [('a1', 1), ('a2', 1)]]
+    assert profiler.stats.calls == {f'by_score.{phase}': 3 for phase in ['gather', 'filter', 'score', 'sort']} and profiler.stats.counts['candidates'] == 5
+
+
+def test_step_outcomes_without_warnings():
+    graph = small_graph()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error') # Silent machines must not warn
+        gsm = GSM(graph, ['b1'], outcome_handler = None)
+        assert gsm.step(['A']).last_outcome.status == 'taken' and gsm.last_outcome.record['scan_result'][0][0] == 'a1'
+        assert gsm.step(['A'], conditional = True).last_outcome.status == 'skipped' and gsm.last_outcome.node_type == 'A'
+        assert gsm.step(['C']).last_outcome.status == 'no_candidates' and gsm.state == ['b1', 'a1']
+        outcomes = []
+        GSM(graph, ['b1'], outcome_handler = outcomes.append).parallel_steps([['A']], [['C']])
+        assert [(o.status, o.parallel) for o in outcomes] == [('taken', True), ('no_candidates', True)]
+        batch_outcomes = []
+        batch = GSMBatch(graph, [['b1'], ['a1']], outcome_handler = batch_outcomes.append).step(['A'], conditional = True).step(['C'])
+        assert [(o.status, o.machine) for o in batch_outcomes] == [('skipped', 1), ('taken', 0), ('no_candidates', 0), ('no_candidates', 1)]
+        assert batch.last_outcomes == batch_outcomes[-2:] and batch_outcomes[1].record is batch.logs[0][1] and len(batch.logs[1]) == 2
+    with warnings.catch_warnings(record = True) as caught:
+        warnings.simplefilter('always')
+        GSM(graph, ['b1']).step(['C'])
+        assert len(caught) == 1 and str(caught[0].message).startswith('A Scanner returned no result: no appropriate candidates identified; last log entry:')
+        GSMBatch(graph, [['b1'], ['a1']]).step(['A'], conditional = True)
+        assert len(caught) == 2 and str(caught[1].message).endswith('already in state (machine 1 of a GSMBatch)')
@@ -0,0 +1,41 @@
+import os
+
+from Graph_State_Machine import *
+
+
+def nec_suff_graph(): return Graph(dict(A = dict(a1 = ['b1', 'b2'], a2 = ['b2']), B = dict(b1 = [], b2 = []),
+                                        C = dict(c1 = dict(are_necessary = ['a1'], are_sufficient = ['b1', ['a1', 'a2']]))), warn_about_problematic_sufficiencies = False)
+
+
+def test_layouts_are_cached_on_graph_version():
+    calls = []
+    def layout(G, scale = 1):
+        calls.append(scale)
+        return {n: (i * scale, 0.0) for i, n in enumerate(G.nodes)}
+    graph = nec_suff_graph().freeze()
+    assert graph.get_layout(layout) == graph.get_layout(layout) and calls == [1]
+    graph.get_layout(layout, dict(scale = 2))
+    graph.fork().mark_changed()
+    graph.extend_with(Graph(dict(A = dict(a3 = ['b1']), B = dict(b1 = [])))).get_layout(layout)
+    assert calls == [1, 2, 1]
+    for scale in range(3, 19): graph.get_layout(layout, dict(scale = scale)) # Evicting the least recently used layout, i.e. the first one
+    graph.get_layout(layout, dict(scale = 18)), graph.get_layout(layout)
+    assert calls[-2:] == [18, 1] and len(calls) == 20
+
+
+def test_large_plot_batches_traces_and_rerenders_highlight(tmp_path):
+    graph = nec_suff_graph()
+    fig = graph.plot(['a1'], large = True, show = False)
+    assert {t.type for t in fig.data} == {'scattergl'} and not fig.layout.annotations
+    assert {'Necessary', 'Sufficient', 'Jointly Sufficient', 'Node in State'}.issubset(t.name for t in fig.data)
+    assert sum(t.name == 'Jointly Sufficient' for t in fig.data) == 2 # Lines and direction markers
+
+    outline = lambda f: [t for t in f.data if t.name == 'Node in State']
+    assert graph.plot(['b1', 'b2'], large = True, base_figure = fig, show = False) is fig and len(outline(fig)) == 1 and len(outline(fig)[0].x) == 2
+    small_fig = graph.plot(show = False)
+    assert not outline(small_fig) and len(small_fig.layout.annotations) == 9 # 4 arrows and 5 labels
+    GSM(graph, ['a2']).plot(base_figure = small_fig, show = False)
+    assert outline(small_fig)[0].x == (graph.get_layout()['a2'][0],)
+
+    graph.plot(large = True, path = (html := str(tmp_path / 'graph.html')))
+    assert os.path.getsize(html) > 0
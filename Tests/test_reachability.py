@@ -0,0 +1,56 @@
+import warnings
+
+from Benchmarks.generator import synthetic_ontology
+from Graph_State_Machine import *
+
+
+def cyclic_graph(compiled = False):
+    '''x1 -> x2 -> x3 -> x1 is a necessity cycle (each needing the previous), y1 needs x3 and z1 is jointly sufficed by b1 and x1'''
+    return Graph(dict(A = dict(a1 = ['b1'], a2 = dict(are_necessary = ['b1'], plain = ['x1'])), B = dict(b1 = []),
+                      X = dict(x1 = dict(are_necessary = ['x3'], plain = ['a2']), x2 = dict(are_necessary = ['x1']), x3 = dict(are_necessary = ['x2'])),
+                      Y = dict(y1 = dict(are_necessary = ['x3'])), Z = dict(z1 = dict(are_sufficient = [['b1', 'x1']]))),
+                 warn_about_problematic_sufficiencies = False, compiled = compiled)
+
+
+def naive_attainable(graph, start):
+    attained = set(start)
+    while new := set(graph.necessity_sufficiency_filter(list(attained), [m for n in attained for m in graph.G._adj[n]])) - attained: attained |= new
+    return attained
+
+
+def test_attainable_and_prerequisites():
+    for compiled in [False, True]:
+        graph = cyclic_graph(compiled)
+        assert set(graph.attainable(['A', 'B'])) == {'a1', 'a2', 'b1'} and set(graph.unattainable()) == {'x1', 'x2', 'x3', 'y1', 'z1'}
+        assert set(graph.attainable(start_nodes = ['x2'])) == {'x1', 'x2', 'x3', 'y1'} # Not a2, which needs b1
+        assert set(graph.attainable(start_nodes = ['x2', 'b1'])) == set(graph.G.nodes)
+        assert set(graph.attainable(['B'], check_necessity = False)) == set(graph.G.nodes)
+        assert graph.prerequisites(['y1']) == ['x1', 'x2', 'x3'] and graph.prerequisites(['a2', 'z1']) == ['b1', 'x1', 'x2', 'x3']
+        assert graph.prerequisites(['z1'], check_necessity = False) == ['b1', 'x1'] and graph.prerequisites(['a1']) == []
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        graph = Graph(synthetic_ontology(n_nodes = 400, necessity_density = 0.3, sufficiency_density = 0.3, seed = 3), warn_about_problematic_sufficiencies = False)
+    for start_types in [['Type_0'], ['Type_1', 'Type_2'], None]:
+        start = graph.type_filter(None, start_types) if start_types else [n for n, d in graph.G.nodes(data = True) if 'necessary' not in d and 'sufficient' not in d]
+        assert set(graph.attainable(start_types)) == naive_attainable(graph, start)
+
+
+def test_pruning_keeps_scan_results():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        tas = synthetic_ontology(n_nodes = 400, necessity_density = 0.3, sufficiency_density = 0.3, seed = 5)
+        plain, pruned = Graph(tas, warn_about_problematic_sufficiencies = False), Graph(tas, warn_about_problematic_sufficiencies = False)
+    pruned.prune_unattainable(['Type_0'])
+    assert pruned.pruning.unattainable and pruned.pruning.attainable is None
+    states = [sorted(plain.attainable(['Type_0']))[i::37] for i in range(5)] + [sorted(plain.unattainable(['Type_0']))[:3] + ['node_1']]
+    for scanner in [by_score(), neighbour_intersection, by_score(presence_score, check_sufficiency = False), by_score(check_only_state_types = True)]:
+        for state in states: assert scanner(pruned, state) == scanner(plain, state)
+    plain.compile(), pruned.compile()
+    assert pruned.pruning is not None and pruned._pruning(True, True, False) is None # Lapsed with the new version
+    pruned.prune_unattainable(['Type_0'])
+    assert pruned.pruning.attainable is not None
+    for state in states:
+        assert by_score()(pruned, state) == by_score()(plain, state) and neighbour_intersection(pruned, state) == neighbour_intersection(plain, state)
+        assert GSM(pruned, state, incremental = True)._scan() == GSM(plain, state)._scan()
+    assert by_score().batch(pruned, states) == by_score().batch(plain, states)
@@ -0,0 +1,35 @@
+import warnings
+
+from Graph_State_Machine import *
+from Tests.test_compiled import random_typed_adjacencies
+
+
+def exhaustive(graph, state, steps, branching):
+    '''All (path score, final state) pairs of the paths search explores, by plain scans on fresh machines'''
+    if not steps: return [(0.0, state)]
+    return [(s + score, final) for c, s in by_score()(graph, state, [steps[0]], top_k = branching)
+            for score, final in exhaustive(graph, state + [c], steps[1:], branching)]
+
+
+def test_search_finds_best_paths():
+    graph = Graph(random_typed_adjacencies(seed = 3), warn_about_problematic_sufficiencies = False, compiled = True)
+    types, start = ['T1', 'T2', 'T0', 'T3'], list(graph.G.nodes)[:2]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        best = max(score for score, _ in exhaustive(graph, start, types, 3))
+        full = search(graph, start, *[[[t]] for t in types], beam_width = 10 ** 6, incremental = False)
+        assert abs(full[0][0] - best) < 1e-12 and len({frozenset(s) for _, s, _ in full}) == len(full) # Deduplicated
+        for incremental in [False, True]:
+            beam = search(graph, OrderedState(start), *[[[t]] for t in types], state_updater = ordered_accumulator, beam_width = 5, incremental = incremental)
+            assert [(s, list(st)) for s, st, _ in beam] == [(s, list(st)) for s, st, _ in search(graph, start, *[[[t]] for t in types], beam_width = 5, incremental = False)]
+            best_first = search(graph, start, *[[[t]] for t in types], strategy = 'best_first', results = 1, incremental = incremental)
+            assert best_first[0][0] <= best and [n for n, _ in best_first[0][2]] == best_first[0][1][len(start):]
+
+
+def test_best_first_forgets_dropped_branches():
+    graph = Graph({'T': {'s': ['a', 'b', 'c'], 'a': [], 'b': [], 'c': []}})
+    scans = {frozenset('s'): [('a', 0.0), ('b', -1.0)], frozenset('sa'): [('c', -0.5), ('b', -5.0)], frozenset('sb'): [('a', -6.0), ('c', -10.0)]}
+    table = lambda graph, state, step: scans[frozenset(state)]
+    # {s, a, b} is first reached through a, but that branch is dropped by the frontier cap, so the worse one through b must still be kept
+    res = search(graph, ['s'], [1], [2], node_scanner = table, strategy = 'best_first', results = 10, max_frontier = 2)
+    assert [(s, st) for s, st, _ in res] == [(-0.5, ['s', 'a', 'c']), (-7.0, ['s', 'b', 'a']), (-11.0, ['s', 'b', 'c'])]
@@ -0,0 +1,33 @@
+import pickle
+import warnings
+
+from Graph_State_Machine import *
+from Tests.test_compiled import random_typed_adjacencies
+
+
+def test_ordered_state_versions():
+    a = OrderedState(['x', 'y'])
+    b = a.plus('z')
+    c = a + ['w', 'x'] # Branching: a already has a longer descendant
+    assert (a, b, c) == (['x', 'y'], ['x', 'y', 'z'], ['x', 'y', 'w', 'x']) and b._buffer is a._buffer and c._buffer is not a._buffer
+    assert 'z' in b and 'z' not in a and c.index('x') == 0 and c[-1] == 'x' and c[1:3] == ['y', 'w'] and b.extends(a) and not c.extends(b)
+    assert hash(b) == hash(('x', 'y', 'z')) and len({a, OrderedState(['x', 'y'])}) == 1 and pickle.loads(pickle.dumps(b)) == b
+
+    d = DictState(A = ['x'])
+    e = d.plus('B', 'y')
+    assert d == dict(A = ['x']) and e == dict(A = ['x'], B = ['y']) and e['A'] is d['A'] and e.has_node('y') and not d.has_node('y')
+    assert dict_state_fields_getter()(e) == dict_fields_getter()(dict(A = ['x'], B = ['y'])) == ['x', 'y']
+
+
+def test_ordered_states_match_lists():
+    graph = Graph(random_typed_adjacencies(seed = 3), warn_about_problematic_sufficiencies = False, compiled = True)
+    steps = [[[t]] for t in ['T1', 'T2', 'T0', 'T3', 'T1', 'T2']]
+    start = list(graph.G.nodes)[:2]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = GSM(graph, list(start)).consecutive_steps(*steps).state
+        for incremental in [False, True]:
+            assert GSM(graph, OrderedState(start), state_updater = ordered_accumulator, incremental = incremental).consecutive_steps(*steps).state == expected
+        dict_steps = [dict(candidate_types = t) for (t,) in steps]
+        expected = GSM(graph, dict(s = list(start)), state_updater = list_in_dict_accumulator('s'), selector = dict_fields_getter()).consecutive_steps(*dict_steps).state
+        assert GSM(graph, DictState(s = start), state_updater = dict_state_accumulator('s'), selector = dict_state_fields_getter()).consecutive_steps(*dict_steps).state == expected
@@ -0,0 +1,86 @@
+import warnings
+from itertools import chain
+
+import pytest
+
+from Benchmarks.generator import synthetic_ontology
+from Graph_State_Machine import *
+from Graph_State_Machine.compiled import CompiledGraph
+from Graph_State_Machine.graph import NECESSARY, SUFFICIENT, JOINTLY_SUFFICIENT, REQUIRED_BY
+
+
+def reference_problematic_sufficiencies(graph):
+    requirements = lambda n: set(graph.G.nodes[n].get('necessary', [])).union(*graph.G.nodes[n].get('sufficient', []))
+    return {c: dict(are_sufficient = sufficient, plain = plain) for c in graph.G.nodes if (sufficient := graph.G.nodes[c].get('sufficient'))
+            if (plain := [b for b in graph.G._adj[c] if b not in requirements(c) and c not in requirements(b)])}
+
+
+def test_validation_report_and_incremental_validation():
+    base_tas = synthetic_ontology(n_nodes = 300, sufficiency_density = 0.4, hub_skew = 2.0, seed = 7)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        base = Graph(base_tas)
+    extension_tas = {'New': {'new_0': dict(plain = ['node_250', 'node_255'], are_sufficient = [['node_251', 'node_252']]), 'new_1': ['node_253', 'new_0']}}
+    for n in ['node_250', 'node_251', 'node_252', 'node_253', 'node_255']: extension_tas.setdefault(base.nodes_to_types[n], {})[n] = []
+    extension = Graph(extension_tas, warn_about_problematic_sufficiencies = False)
+    report = base.validate()
+    assert report.ok is False and not report.untyped and report.checked == len(base.G)
+    assert report.problematic_sufficiencies == reference_problematic_sufficiencies(base)
+    assert all(base.plain_edges(c) == d['plain'] for c, d in report.problematic_sufficiencies.items())
+
+    with pytest.warns(UserWarning, match = 'perhaps problematic') as record: extended = base.extend_with(extension)
+    incremental, full = extended.validate(extension = extension.G), extended.validate()
+    assert 'new_0' in incremental.problematic_sufficiencies and incremental.checked < len(extended.G) / 10
+    assert all(full.problematic_sufficiencies[c] == d for c, d in incremental.problematic_sufficiencies.items())
+    assert set(full.problematic_sufficiencies) == set(report.problematic_sufficiencies) | set(incremental.problematic_sufficiencies)
+    assert str(record[0].message) == incremental.sufficiency_warning()
+
+    extended.G.add_node('untyped')
+    assert extended.validate(['untyped', 'node_0'], check_sufficiencies = False) == ({'untyped'}, {}, 2)
+    with pytest.raises(AssertionError, match = 'untyped'): extended.consistent()
+
+
+def reference_edge_kinds(graph):
+    kinds = {}
+    for b, d in graph.G.nodes(data = True):
+        for a_or_as, kind in [([a], NECESSARY) for a in d.get('necessary', [])] + [(s, SUFFICIENT if len(s) == 1 else JOINTLY_SUFFICIENT) for s in d.get('sufficient', [])]:
+            for a in a_or_as:
+                kinds[b, a] = kinds.get((b, a), 0) | kind
+                kinds[a, b] = kinds.get((a, b), 0) | REQUIRED_BY
+    return kinds
+
+
+def test_edge_kind_index():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        base = Graph(synthetic_ontology(n_nodes = 300, necessity_density = 0.3, sufficiency_density = 0.4, seed = 11), compiled = True)
+    extension_tas = {'New': {'new_0': dict(are_necessary = ['node_250'], are_sufficient = [['node_251', 'node_252'], 'node_253'])}}
+    extension_tas.setdefault(base.nodes_to_types['node_250'], {})['node_250'] = dict(are_necessary = ['node_251'], plain = ['new_0'])
+    for n in ['node_251', 'node_252', 'node_253']: extension_tas.setdefault(base.nodes_to_types[n], {})[n] = []
+    extended = base.extend_with(Graph(extension_tas, warn_about_problematic_sufficiencies = False), warn_about_problematic_sufficiencies = False)
+
+    for graph in [base, extended, Graph.from_compiled(extended.compiled)]:
+        reference, cg = reference_edge_kinds(graph), graph.compiled
+        assert all(graph.edge_kind(a, b) == k for (a, b), k in reference.items())
+        assert all(graph.edge_kind(a, b) == reference.get((a, b), 0) for a, b in graph.G.edges)
+        assert cg.edge_kinds.tolist() == [reference.get((a, b), 0) for i, a in enumerate(cg.nodes) for b in cg.names(cg.indices[cg.indptr[i]:cg.indptr[i + 1]])]
+        arrows = graph._get_nec_suff_arrows()
+        assert set(arrows['necessary']) == {(a, b) for (b, a), k in reference.items() if k & NECESSARY}
+        assert sorted(arrows['jointly_sufficient']) == sorted((a, b) for (b, a), k in reference.items() if k & JOINTLY_SUFFICIENT)
+    assert extended.edge_kind('node_250', 'node_251') == NECESSARY and extended.edge_kind('new_0', 'node_253') == SUFFICIENT
+    assert extended.edge_kind('node_250', 'new_0') == REQUIRED_BY and base.edge_kind('node_250', 'node_251') == 0
+    assert extended.requirements['new_0'].sufficient == ({'node_251', 'node_252'}, {'node_253'}) and 'new_0' not in base.requirements.cache
+
+
+def test_edge_kind_index_builders_agree():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        G = Graph(synthetic_ontology(n_nodes = 200, necessity_density = 0.3, sufficiency_density = 0.4, seed = 5)).G
+    far = next(n for n in G if n != 'node_10' and n not in G._adj['node_10'])
+    G.nodes['node_10'].setdefault('necessary', []).append(far) # A requirement without an edge (not checked by consistent)
+    graphs = [Graph(G, warn_about_problematic_sufficiencies = False), Graph.from_compiled(CompiledGraph.from_networkx(G))]
+    reference = reference_edge_kinds(graphs[0])
+    assert reference[far, 'node_10'] & REQUIRED_BY and graphs[1]._G is None
+    for graph in graphs: assert all(graph.edge_kind(a, b) == reference.get((a, b), 0) for a in G for b in chain(G._adj[a], [far]))
+    assert all(graphs[0].requirements[n] == graphs[1].requirements[n] for n in G) and graphs[1]._G is None
+    assert all(graphs[0].plain_edges(n) == graphs[1].plain_edges(n) for n in G)
@@ -29,7 +29,7 @@ setup(
     description = "A simple library to build easily interpretable computational constructs similar to a Turing machine over a graph, where states are combinations of a graph's (typed) nodes; an example use would be a transparent backend logic which navigates an ontology",
     long_description = read('README.rst'),
 
-    packages = find_packages(exclude = ('tests',)),
+    packages = find_packages(exclude = ('tests', 'Tests', 'Benchmarks')),
 
     install_requires = read_requirements(),
 